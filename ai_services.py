@@ -1,37 +1,116 @@
 # ai_services.py
 import json
 import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import google.api_core.exceptions
 import pandas as pd
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 import prompts
 import config
+import score_cache
+import llm_cache
+import rate_limiter
+import tracing
 
-def get_api_response_resilient(prompt, model):
-    """Hàm gọi API Gemini bền bỉ, có cơ chế retry."""
-    max_retries = 3
-    initial_wait_time = 5
-    for attempt in range(max_retries):
+_evaluation_executor = None
+_evaluation_executor_lock = threading.Lock()
+
+def get_api_response_resilient(prompt, model, timeout=100, cache_template=None, validate=None, refresh_cache=False):
+    """
+    Hàm gọi API Gemini bền bỉ, có cơ chế retry.
+    Nếu truyền `cache_template` (prompt template gốc), phản hồi được lấy/lưu trong cache trên đĩa
+    theo (model, phiên bản template, prompt) để các prompt lặp lại không phải gọi lại Gemini.
+    `validate(response_text)` kiểm tra phản hồi parse được: chỉ phản hồi hợp lệ mới được lưu vào cache
+    (và mục cache không hợp lệ bị bỏ qua). `refresh_cache=True` (khi thử lại) luôn gọi lại Gemini.
+    """
+    with tracing.span('llm.call', prompt=_prompt_name(cache_template)) as span_attributes:
+        cache = llm_cache.get_llm_cache() if cache_template is not None else None
+        if cache is not None:
+            model_name = getattr(model, 'model_name', type(model).__name__)
+            template_version = prompt_version(cache_template)
+            cached = None if refresh_cache else cache.get(model_name, template_version, prompt)
+            if cached is not None and (validate is None or validate(cached.text)):
+                span_attributes['cache_hit'] = True
+                return cached
+        response = _call_model_with_retry(prompt, model, timeout)
+        if response is None:
+            span_attributes['outcome'] = 'failed'
+            return None
         try:
-            safety_settings_config = {
-                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-            }
-            response = model.generate_content(
-                prompt,
-                request_options={'timeout': 100},
-                safety_settings=safety_settings_config
-            )
-            return response
-        except google.api_core.exceptions.ResourceExhausted as e:
-            wait_time = initial_wait_time * (2 ** attempt)
-            print(f"⚠️ Rate limit hit. Đang chờ {wait_time} giây... (lần {attempt + 1}/{max_retries})")
+            response_text = response.text
+        except Exception:
+            response_text = None  # Phản hồi bị chặn/không có nội dung thì không lưu
+        _record_token_usage(span_attributes, prompt, response, response_text)
+        if cache is not None and response_text and (validate is None or validate(response_text)):
+            cache.put(model_name, template_version, prompt, response_text)
+        return response
+
+def _parse_json_text(text):
+    """Parse JSON từ output của LLM (bỏ code fence). Ném json.JSONDecodeError nếu không hợp lệ."""
+    return json.loads(text.strip().replace("```json", "").replace("```", ""))
+
+def _is_json(text, expected_type=(dict, list)):
+    try:
+        result = _parse_json_text(text)
+    except json.JSONDecodeError:
+        return False
+    return isinstance(result, expected_type) and bool(result)
+
+def _is_json_object(text):
+    return _is_json(text, dict)
+
+def _prompt_name(template):
+    """Tên biến của prompt template trong prompts.py (dùng làm nhãn trace)."""
+    if template is None:
+        return None
+    for name, value in vars(prompts).items():
+        if name.startswith('PROMPT_') and value is template:
+            return name
+    return 'custom'
+
+def _record_token_usage(span_attributes, prompt, response, response_text):
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None and getattr(usage, 'prompt_token_count', None) is not None:
+        tracing.record_tokens(span_attributes, usage.prompt_token_count, getattr(usage, 'candidates_token_count', 0))
+    else:
+        # Không có số liệu từ API: ước lượng ~4 ký tự một token
+        tracing.record_tokens(span_attributes, len(prompt) // 4, len(response_text or "") // 4, estimated=True)
+
+def _call_model_with_retry(prompt, model, timeout):
+    max_retries = config.API_MAX_RETRIES
+    initial_wait_time = config.API_RETRY_INITIAL_WAIT
+    limiter = rate_limiter.get_llm_rate_limiter()
+    for attempt in range(max_retries):
+        if limiter is not None:
+            # Giới hạn chung cho mọi lần tìm kiếm chạy đồng thời trong process (UI, API, batch)
+            with tracing.span('llm.rate_limit_wait') as wait_attributes:
+                wait_attributes['seconds'] = limiter.acquire()
+        with tracing.span('llm.attempt', attempt=attempt + 1) as span_attributes:
+            try:
+                safety_settings_config = {
+                    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+                    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+                    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+                    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+                }
+                response = model.generate_content(
+                    prompt,
+                    request_options={'timeout': timeout},
+                    safety_settings=safety_settings_config
+                )
+                return response
+            except google.api_core.exceptions.ResourceExhausted as e:
+                span_attributes['outcome'] = 'rate_limited'
+                wait_time = initial_wait_time * (2 ** attempt)
+                print(f"⚠️ Rate limit hit. Đang chờ {wait_time} giây... (lần {attempt + 1}/{max_retries})")
+            except Exception as e:
+                span_attributes['outcome'] = 'error'
+                print(f"🔥 Lỗi không xác định khi gọi API: {e}")
+                return None
+        with tracing.span('llm.backoff', seconds=wait_time):
             time.sleep(wait_time)
-        except Exception as e:
-            print(f"🔥 Lỗi không xác định khi gọi API: {e}")
-            return None
     print(f"🔥 Đã thử lại {max_retries} lần nhưng vẫn thất bại.")
     return None
 
@@ -39,7 +118,7 @@ def enhance_query(model, query):
     """Sử dụng LLM để sửa lỗi và làm rõ query của người dùng."""
     try:
         prompt = prompts.PROMPT_QUERY_ENHANCER.format(user_query=query)
-        response = get_api_response_resilient(prompt, model)
+        response = get_api_response_resilient(prompt, model, cache_template=prompts.PROMPT_QUERY_ENHANCER)
         if response:
             return response.text.strip()
         return query
@@ -49,13 +128,13 @@ def enhance_query(model, query):
 def classify_intent(model, query):
     """Phân loại ý định người dùng."""
     prompt = prompts.PROMPT_INTENT_CLASSIFIER.format(user_query=query)
-    response = get_api_response_resilient(prompt, model)
+    response = get_api_response_resilient(prompt, model, cache_template=prompts.PROMPT_INTENT_CLASSIFIER)
     return response.text.strip() if response else None
 
 def get_dynamic_weights(model, query):
     """Lấy trọng số động dựa trên query."""
     prompt = prompts.PROMPT_WEIGHT_ADJUSTER.format(user_query=query)
-    response = get_api_response_resilient(prompt, model)
+    response = get_api_response_resilient(prompt, model, cache_template=prompts.PROMPT_WEIGHT_ADJUSTER, validate=_is_json_object)
     if response:
         try:
             # Dọn dẹp output từ LLM để đảm bảo là JSON hợp lệ
@@ -70,7 +149,7 @@ def get_ai_plan(model, query, intent):
     """Lấy kế hoạch tuyển dụng từ AI."""
     prompt_template = prompts.PROMPT_PROJECT_DECOMPOSER if intent == 'project_description' else prompts.PROMPT_ROLE_EXTRACTOR
     prompt = prompt_template.format(user_query=query)
-    response = get_api_response_resilient(prompt, model)
+    response = get_api_response_resilient(prompt, model, cache_template=prompt_template, validate=_is_json)
     if response:
         try:
             clean_text = response.text.strip().replace("```json", "").replace("```", "")
@@ -80,55 +159,405 @@ def get_ai_plan(model, query, intent):
             return None
     return None
 
-def get_on_demand_quality_scores(candidate_row, model):
-    """Đánh giá chất lượng chi tiết của một ứng viên."""
+def _understand_query_fused(model, query):
+    """Phân tích truy vấn bằng một lời gọi duy nhất. Trả về None nếu output không hợp lệ."""
+    prompt = prompts.PROMPT_QUERY_UNDERSTANDING.format(user_query=query)
+    response = get_api_response_resilient(
+        prompt, model, cache_template=prompts.PROMPT_QUERY_UNDERSTANDING,
+        validate=lambda text: _parse_understanding(text, query, quiet=True) is not None
+    )
+    if not response:
+        return None
+    return _parse_understanding(response.text, query)
+
+def _is_valid_role(role):
+    if not isinstance(role, dict):
+        return False
+    title = role.get('position_title')
+    hard_skills = role.get('hard_skills', [])
+    return isinstance(title, str) and bool(title.strip()) and isinstance(hard_skills, list) \
+        and all(isinstance(skill, str) for skill in hard_skills)
+
+def _parse_understanding(text, query, quiet=False):
+    """Parse output của prompt phân tích gộp thành (enhanced_query, intent, dynamic_weights, plan), hoặc None."""
+    try:
+        result = _parse_json_text(text)
+    except json.JSONDecodeError:
+        if not quiet:
+            print(f"⚠️ Lỗi parse JSON từ prompt phân tích gộp. Output thô: {text}")
+        return None
+
+    intent = result.get('intent') if isinstance(result, dict) else None
+    roles = result.get('roles') if isinstance(result, dict) else None
+    if intent not in ('project_description', 'specific_role') or not isinstance(roles, list) or not roles:
+        if not quiet:
+            print("⚠️ Output của prompt phân tích gộp thiếu intent hoặc danh sách vị trí.")
+        return None
+
+    # Mỗi vị trí phải là object có tên vị trí (build_role_queries dùng role.get và nối hard_skills)
+    if not all(_is_valid_role(role) for role in roles):
+        if not quiet:
+            print("⚠️ Output của prompt phân tích gộp có vị trí không hợp lệ (thiếu position_title hoặc hard_skills sai kiểu).")
+        return None
+    weights = result.get('weights')
+    if weights is not None and not (isinstance(weights, dict) and all(
+            isinstance(value, (int, float)) and not isinstance(value, bool) for value in weights.values())):
+        if not quiet:
+            print("⚠️ Output của prompt phân tích gộp có trọng số không phải là số.")
+        return None
+
+    enhanced_query = str(result.get('enhanced_query') or query).strip()
+    dynamic_weights = dict(config.DEFAULT_DYNAMIC_WEIGHTS)
+    dynamic_weights.update(weights or {})
+    # Giữ nguyên định dạng kế hoạch như các prompt cũ để phần còn lại của pipeline không đổi
+    if intent == 'project_description':
+        plan = {"project_summary": result.get('project_summary', ''), "team_composition": roles}
+    else:
+        plan = roles
+    return enhanced_query, intent, dynamic_weights, plan
+
+def _understand_query_legacy(model, query):
+    """Phân tích truy vấn bằng 4 prompt riêng lẻ; trọng số chạy song song với intent + kế hoạch."""
+    enhanced_query = enhance_query(model, query)
+
+    def intent_and_plan():
+        intent = classify_intent(model, enhanced_query)
+        return intent, get_ai_plan(model, enhanced_query, intent)
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="query-understanding") as executor:
+        weights_future = executor.submit(tracing.wrap(get_dynamic_weights), model, enhanced_query)
+        plan_future = executor.submit(tracing.wrap(intent_and_plan))
+        intent, plan = plan_future.result()
+        dynamic_weights = weights_future.result()
+    return enhanced_query, intent, dynamic_weights, plan
+
+def understand_query(model, query, mode=None):
+    """
+    Phân tích truy vấn tuyển dụng.
+    Trả về tuple (enhanced_query, intent, dynamic_weights, plan). Chế độ 'fused' tự động
+    quay về chế độ 'legacy' nếu lời gọi gộp thất bại.
+    """
+    mode = mode or config.QUERY_UNDERSTANDING_MODE
+    if mode == 'fused':
+        result = _understand_query_fused(model, query)
+        if result:
+            return result
+        print("⚠️ Phân tích gộp thất bại, chuyển sang chế độ 4 prompt riêng lẻ.")
+    return _understand_query_legacy(model, query)
+
+EVALUATION_COLUMNS = [
+    "experience", "language_skill", "certificate", "achievement",
+    "project", "activity", "professional_skill", "soft_skill", "education"
+]
+
+def prompt_version(template):
+    """Phiên bản của một prompt template, dùng làm khóa cache (đổi prompt => cache tự vô hiệu)."""
+    return hashlib.sha256(template.encode('utf-8')).hexdigest()[:12]
+
+# Điểm trong cache điểm có thể đến từ prompt đơn lẻ hoặc prompt theo lô: đổi một trong hai đều làm cache vô hiệu
+EVALUATION_PROMPT_VERSION = prompt_version(prompts.PROMPT_HYBRID_EVALUATION + prompts.PROMPT_HYBRID_EVALUATION_BATCH)
+
+def build_evaluation_text(candidate_row):
+    """Gộp các mục của CV thành một khối văn bản để đưa vào prompt đánh giá."""
     full_text_block = ""
-    columns_to_consolidate = [
-        "experience", "language_skill", "certificate", "achievement",
-        "project", "activity", "professional_skill", "soft_skill", "education"
-    ]
-    for col in columns_to_consolidate:
+    for col in EVALUATION_COLUMNS:
         content = candidate_row.get(col, "")
         if pd.notna(content) and str(content).strip() != "":
             full_text_block += f"### {col.upper()}\n{content}\n\n"
+    return full_text_block
 
-    if not full_text_block.strip():
-        print(f"⚠️ Bỏ qua ứng viên ID {candidate_row.get('id')} vì không có nội dung để đánh giá.")
-        return {}
+def build_evaluation_batches(items):
+    """
+    Chia các CV thành lô theo kích thước thích ứng.
+    `items` là list các tuple (resume_id, text_block). Một lô được đóng khi đạt
+    EVALUATION_BATCH_MAX_SIZE CV hoặc vượt ngân sách ký tự EVALUATION_BATCH_MAX_INPUT_CHARS;
+    CV dài hơn cả ngân sách sẽ nằm riêng một lô.
+    """
+    batches, current, current_chars = [], [], 0
+    for resume_id, text_block in items:
+        if current and (len(current) >= config.EVALUATION_BATCH_MAX_SIZE
+                        or current_chars + len(text_block) > config.EVALUATION_BATCH_MAX_INPUT_CHARS):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append((resume_id, text_block))
+        current_chars += len(text_block)
+    if current:
+        batches.append(current)
+    return batches
 
-    prompt = prompts.PROMPT_HYBRID_EVALUATION.format(text_input=full_text_block)
-    response = get_api_response_resilient(prompt, model)
-    if response:
+def _parse_batch_entries(raw_text):
+    """
+    Parse từng object trong mảng JSON trả về. Một object hỏng không làm mất các object còn lại,
+    nhờ đó chỉ cần đánh giá lại những CV bị lỗi.
+    """
+    text = raw_text.strip().replace("```json", "").replace("```", "")
+    decoder = json.JSONDecoder()
+    entries = []
+    idx = text.find('{')
+    while idx != -1:
+        try:
+            entry, end = decoder.raw_decode(text, idx)
+        except json.JSONDecodeError:
+            idx = text.find('{', idx + 1)
+            continue
+        if isinstance(entry, dict):
+            entries.append(entry)
+        idx = text.find('{', end)
+    return entries
+
+def _score_evaluation_batch(batch, model, timeout=100, refresh_cache=False):
+    """
+    Gửi một lô CV tới Gemini, trả về dict {resume_id: parsed_scores} cho các CV parse được.
+    Khi thử lại (`refresh_cache=True`), không dùng phản hồi trong cache LLM.
+    """
+    if len(batch) == 1:
+        # Lô một CV dùng prompt đơn lẻ quen thuộc, ổn định hơn khi thử lại
+        resume_id, text_block = batch[0]
+        prompt = prompts.PROMPT_HYBRID_EVALUATION.format(text_input=text_block)
+        response = get_api_response_resilient(
+            prompt, model, timeout=timeout, cache_template=prompts.PROMPT_HYBRID_EVALUATION,
+            validate=_is_json_object, refresh_cache=refresh_cache
+        )
+        if not response:
+            return {}
         try:
             clean_text = response.text.strip().replace("```json", "").replace("```", "")
-            return json.loads(clean_text)
+            parsed_scores = json.loads(clean_text)
         except json.JSONDecodeError:
-            print(f"⚠️ Lỗi parse JSON điểm chất lượng cho ID {candidate_row.get('id')}. Output thô: {response.text}")
+            print(f"⚠️ Lỗi parse JSON điểm chất lượng cho ID {resume_id}. Output thô: {response.text}")
             return {}
-    return {}
-
-def calculate_quality_score(parsed_scores, dynamic_weights, role_info, candidate_row):
-    """Tính điểm chất lượng dựa trên điểm đã phân tích và trọng số."""
-    score = 0
-    weights = dynamic_weights
-    
-    # Tính điểm từ các thành phần được LLM phân tích
-    score += parsed_scores.get('parsed_exp_years', 0) * weights.get('experience', 7)
-    score += parsed_scores.get('parsed_prof_skill_advanced', 0) * weights.get('professional_skill', 8)
-    score += parsed_scores.get('parsed_lang_score', 0) * weights.get('language', 5)
-    score += parsed_scores.get('parsed_certs_high_value', 0) * weights.get('certificate', 4)
-    score += parsed_scores.get('parsed_achievements_high_impact', 0) * weights.get('achievement', 4)
-    score += parsed_scores.get('parsed_projects_high_impact', 0) * weights.get('project', 5)
-    score += parsed_scores.get('parsed_soft_skill_count', 0) * weights.get('soft_skill', 3)
-    score += parsed_scores.get('parsed_activities_high_impact', 0) * weights.get('activity', 2)
-    
-    # Cộng điểm thưởng cho kỹ năng cứng khớp chính xác
-    required_skills = set([s.lower().strip() for s in role_info.get('hard_skills', [])])
-    candidate_skills_text = str(candidate_row.get('professional_skill', ''))
-    if pd.notna(candidate_skills_text):
-        candidate_skills = set([s.strip().lower() for s in candidate_skills_text.split(',')])
-        matched_skills_count = len(required_skills.intersection(candidate_skills))
-        # Mỗi kỹ năng khớp được thưởng 15 điểm
-        score += matched_skills_count * 15
-        
-    return score
\ No newline at end of file
+        return {resume_id: parsed_scores} if isinstance(parsed_scores, dict) and parsed_scores else {}
+
+    resumes_input = "\n".join(
+        f"---BEGIN RESUME id={resume_id}---\n{text_block}\n---END RESUME id={resume_id}---\n"
+        for resume_id, text_block in batch
+    )
+    prompt = prompts.PROMPT_HYBRID_EVALUATION_BATCH.format(resumes_input=resumes_input)
+    requested_ids = {resume_id for resume_id, _ in batch}
+
+    def parse_batch(text):
+        results = {}
+        for entry in _parse_batch_entries(text):
+            resume_id = str(entry.pop('resume_id', ''))
+            if resume_id in requested_ids and entry:
+                results[resume_id] = entry
+        return results
+
+    # Chỉ lưu vào cache LLM khi phản hồi có đủ kết quả cho mọi CV trong lô
+    response = get_api_response_resilient(
+        prompt, model, timeout=timeout, cache_template=prompts.PROMPT_HYBRID_EVALUATION_BATCH,
+        validate=lambda text: parse_batch(text).keys() == requested_ids, refresh_cache=refresh_cache
+    )
+    if not response:
+        return {}
+    return parse_batch(response.text)
+
+def get_batch_quality_scores(candidates, model, timeout=100, use_cache=True, budget=None, store=True):
+    """
+    Đánh giá chất lượng chi tiết của các ứng viên (ưu tiên lấy từ cache điểm), gửi Gemini theo lô.
+    `candidates` là list các tuple (resume_id, candidate_row). Trả về dict {resume_id (str): parsed_scores};
+    CV không có nội dung hoặc vẫn lỗi sau khi thử lại sẽ không có trong kết quả.
+    `store=False`: không ghi điểm mới vào cache điểm (người gọi tự ghi, vd. để biết lần ghi có thành công).
+    Nếu có `budget` (EvaluationBudget), mọi lời gọi đều được tính vào ngân sách; lần thử lại chỉ chạy khi còn ngân sách.
+    """
+    text_blocks, content_hashes = {}, {}
+    for resume_id, candidate_row in candidates:
+        text_block = build_evaluation_text(candidate_row)
+        if not text_block.strip():
+            print(f"⚠️ Bỏ qua ứng viên ID {resume_id} vì không có nội dung để đánh giá.")
+            continue
+        text_blocks[str(resume_id)] = text_block
+        content_hashes[str(resume_id)] = score_cache.compute_content_hash(text_block)
+
+    results = score_cache.get_cached_scores(content_hashes, EVALUATION_PROMPT_VERSION) if use_cache else {}
+    pending = [resume_id for resume_id in text_blocks if resume_id not in results]
+    new_scores, budget_exhausted = {}, False
+    for attempt in range(config.EVALUATION_BATCH_RETRIES + 1):
+        if not pending or budget_exhausted:
+            break
+        if attempt > 0:
+            print(f"⚠️ Thử lại đánh giá cho {len(pending)} CV bị lỗi (lần {attempt}/{config.EVALUATION_BATCH_RETRIES}).")
+        for batch in build_evaluation_batches([(resume_id, text_blocks[resume_id]) for resume_id in pending]):
+            if budget is not None:
+                # Lượt đầu đã nằm trong phần được chọn theo ngân sách; lượt thử lại phải còn ngân sách mới chạy
+                if attempt == 0:
+                    budget.charge(len(batch), _estimate_batch_tokens(batch))
+                elif not budget.try_charge(len(batch), _estimate_batch_tokens(batch)):
+                    print(f"⚠️ Hết ngân sách đánh giá của lần tìm kiếm, không thử lại cho {len(pending)} CV.")
+                    budget_exhausted = True
+                    break
+            new_scores.update(_score_evaluation_batch(batch, model, timeout, refresh_cache=attempt > 0))
+        pending = [resume_id for resume_id in pending if resume_id not in new_scores]
+    if pending:
+        print(f"⚠️ Không thể đánh giá các CV: {', '.join(pending)}")
+
+    if store:
+        score_cache.save_scores(
+            [(resume_id, content_hashes[resume_id], scores) for resume_id, scores in new_scores.items()],
+            EVALUATION_PROMPT_VERSION
+        )
+    results.update(new_scores)
+    return results
+
+def _get_evaluation_executor():
+    """Thread pool dùng chung cho việc đánh giá ứng viên (giới hạn số lời gọi Gemini đồng thời)."""
+    global _evaluation_executor
+    with _evaluation_executor_lock:
+        if _evaluation_executor is None:
+            _evaluation_executor = ThreadPoolExecutor(
+                max_workers=config.EVALUATION_MAX_WORKERS,
+                thread_name_prefix="evaluation"
+            )
+        return _evaluation_executor
+
+def lookup_cached_evaluations(candidates):
+    """Điểm đã lưu trong cache điểm cho các ứng viên [(resume_id, candidate_row)]: {resume_id (str): parsed_scores}."""
+    content_hashes = {
+        str(resume_id): score_cache.compute_content_hash(build_evaluation_text(candidate_row))
+        for resume_id, candidate_row in candidates
+    }
+    return score_cache.get_cached_scores(content_hashes, EVALUATION_PROMPT_VERSION)
+
+def _estimate_batch_tokens(batch):
+    """Số token đầu vào ước lượng (~4 ký tự một token) của lời gọi đánh giá lô `batch` [(resume_id, text_block)]."""
+    template = prompts.PROMPT_HYBRID_EVALUATION if len(batch) == 1 else prompts.PROMPT_HYBRID_EVALUATION_BATCH
+    return (sum(len(text_block) for _, text_block in batch) + len(template)) // 4
+
+def estimate_evaluation_cost(items):
+    """
+    Ước lượng chi phí đánh giá các CV `items` [(resume_id, text_block)] theo cách chia lô hiện tại:
+    trả về (số lời gọi Gemini, số token đầu vào ước lượng).
+    """
+    if config.EVALUATION_BATCH_ENABLED:
+        batches = build_evaluation_batches(items)
+    else:
+        batches = [[item] for item in items]
+    return len(batches), sum(_estimate_batch_tokens(batch) for batch in batches)
+
+def limit_to_evaluation_budget(candidates, max_resumes=None, max_tokens=None, min_count=0):
+    """
+    Giữ phần đầu dài nhất của `candidates` [(resume_id, candidate_row)] (đã sắp theo độ ưu tiên)
+    mà số CV và/hoặc số token đánh giá không vượt ngân sách (None: không giới hạn).
+    `min_count` CV đầu tiên luôn được giữ, kể cả khi vượt ngân sách.
+    """
+    if max_resumes:
+        candidates = candidates[:max(max_resumes, min_count)]
+    if not max_tokens:
+        return list(candidates)
+    items = [(str(resume_id), build_evaluation_text(candidate_row)) for resume_id, candidate_row in candidates]
+
+    # Chi phí tăng dần theo số CV nên tìm nhị phân độ dài lớn nhất còn trong ngân sách
+    low, high = min(min_count, len(items)), len(items)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_evaluation_cost(items[:middle])[1] <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return list(candidates[:low])
+
+class EvaluationBudget:
+    """
+    Ngân sách LLM cho phần đánh giá của một lần tìm kiếm: số CV gửi đi và/hoặc số token đầu vào ước lượng
+    (None: không giới hạn). Mọi lời gọi, kể cả lần thử lại, đều được tính; dùng chung giữa các luồng đánh giá.
+    """
+
+    def __init__(self, max_resumes=None, max_tokens=None):
+        self.max_resumes = max_resumes
+        self.max_tokens = max_tokens
+        self.resumes = 0
+        self.tokens = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def charge(self, resumes, tokens):
+        """Tính một lời gọi vào ngân sách, không kiểm tra giới hạn."""
+        with self._lock:
+            self.resumes += resumes
+            self.tokens += tokens
+            self.calls += 1
+
+    def try_charge(self, resumes, tokens):
+        """Tính một lời gọi vào ngân sách nếu còn đủ; trả về False (không tính) nếu vượt giới hạn."""
+        with self._lock:
+            if (self.max_resumes and self.resumes + resumes > self.max_resumes) or \
+                    (self.max_tokens and self.tokens + tokens > self.max_tokens):
+                return False
+            self.resumes += resumes
+            self.tokens += tokens
+            self.calls += 1
+            return True
+
+    def usage(self):
+        with self._lock:
+            return {"calls": self.calls, "resumes": self.resumes, "tokens": self.tokens}
+
+def iter_candidate_evaluations(candidates, model, timeout=None, cancel_event=None, cached=None, budget=None):
+    """
+    Đánh giá đồng thời nhiều ứng viên và trả về dần kết quả: mỗi lần yield một dict
+    {resume_id (str): parsed_scores} ngay khi có (đầu tiên là các điểm lấy được từ cache;
+    truyền `cached` nếu đã tra cache điểm trước đó). `budget` (EvaluationBudget) ghi nhận chi phí
+    các lời gọi và giới hạn các lần thử lại.
+    Dừng khi hết thời gian chờ hoặc khi `cancel_event` (threading.Event) được set; khi dừng sớm
+    (kể cả khi generator bị đóng), các tác vụ chưa chạy sẽ bị hủy.
+    """
+    if not candidates:
+        return
+    timeout = timeout if timeout is not None else config.EVALUATION_TOTAL_TIMEOUT
+
+    # Tra cache điểm cho tất cả ứng viên bằng một truy vấn, chỉ gọi Gemini cho phần còn thiếu
+    if cached is None:
+        cached = lookup_cached_evaluations(candidates)
+    candidate_ids = {str(resume_id) for resume_id, _ in candidates}
+    cached = {resume_id: scores for resume_id, scores in cached.items() if resume_id in candidate_ids}
+    if cached:
+        yield dict(cached)
+    if config.EVALUATION_CACHE_ONLY:
+        return
+
+    executor = _get_evaluation_executor()
+    pending_candidates = {}
+    for resume_id, candidate_row in candidates:
+        if str(resume_id) not in cached:
+            pending_candidates.setdefault(str(resume_id), candidate_row)
+
+    # Mỗi future trả về dict {resume_id: parsed_scores}; khi không gộp lô, mỗi CV là một lô riêng
+    # (dùng prompt đơn lẻ) để vẫn được thử lại và tính vào ngân sách như khi gộp lô
+    if config.EVALUATION_BATCH_ENABLED:
+        batches = build_evaluation_batches([
+            (resume_id, build_evaluation_text(candidate_row))
+            for resume_id, candidate_row in pending_candidates.items()
+        ])
+        batch_id_groups = [[resume_id for resume_id, _ in batch] for batch in batches]
+    else:
+        batch_id_groups = [[resume_id] for resume_id in pending_candidates]
+    futures = [
+        executor.submit(
+            tracing.wrap(get_batch_quality_scores),
+            [(resume_id, pending_candidates[resume_id]) for resume_id in batch_ids],
+            model, config.EVALUATION_CALL_TIMEOUT, False, budget
+        )
+        for batch_ids in batch_id_groups
+    ]
+
+    deadline = time.monotonic() + timeout
+    not_done = set(futures)
+    try:
+        while not_done:
+            if cancel_event is not None and cancel_event.is_set():
+                print(f"⚠️ Đã hủy tìm kiếm, bỏ qua {len(not_done)} tác vụ đánh giá chưa xong.")
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"⚠️ {len(not_done)} tác vụ đánh giá chưa xong sau {timeout} giây, bỏ qua.")
+                break
+            # Chờ theo từng khoảng ngắn để kịp phản hồi khi bị hủy
+            done, not_done = wait(not_done, timeout=min(remaining, config.SEARCH_CANCEL_POLL_SECONDS), return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    yield future.result()
+                except Exception as e:
+                    print(f"🔥 Lỗi khi đánh giá ứng viên: {e}")
+    finally:
+        for future in not_done:
+            future.cancel()
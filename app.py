@@ -2,29 +2,62 @@
 import streamlit as st
 import json # <-- Thêm import
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-import google.generativeai as genai
 
 import config
-import ai_services
 import db_manager
-from resume_manager import ResumeManager
+import scoring
+import search_engine
+import startup
+import tracing
 
 # --- Cấu hình trang và khởi tạo hệ thống (giữ nguyên) ---
 st.set_page_config(page_title="Nhà Tư vấn Nhân sự AI", page_icon="🤖", layout="wide")
 
 @st.cache_resource
 def initialize_system():
+    """
+    Bắt đầu khởi tạo các thành phần song song ở luồng nền và trả về ngay.
+    Trang đăng nhập không cần model nào nên hiển thị ngay; các thành phần chỉ được chờ khi cần dùng.
+    """
     print("--- KHỞI TẠO HỆ THỐNG (Chạy một lần) ---")
-    genai.configure(api_key=config.GEMINI_API_KEY)
-    llm_model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
-    embedding_model = SentenceTransformer(config.SENTENCE_MODEL_NAME)
-    resume_mgr = ResumeManager(embedding_model)
-    resume_mgr.load_resumes_from_db()
-    print("--- ✅ HỆ THỐNG ĐÃ SẴN SÀNG ---")
-    return llm_model, embedding_model, resume_mgr
+    loader = startup.build_system_loader()
+    loader.start()
+    if config.STARTUP_MODE == 'eager':
+        loader.wait_all()
+    return loader
 
-llm_model, embedding_model, resume_manager = initialize_system()
+system_loader = initialize_system()
+
+def mark_search_interrupted():
+    """Callback của nút "Dừng tìm kiếm" (chạy trước lần chạy lại script do nút gây ra)."""
+    st.session_state.search_interrupted = True
+
+def render_result_group(result_group):
+    """Hiển thị top ứng viên của một vị trí (dùng cả khi đang tìm kiếm lẫn khi đã có kết quả cuối cùng)."""
+    st.markdown(f"#### 🏆 Top ứng viên cho vị trí: **{result_group['role']}**")
+    if result_group.get('pending'):
+        st.caption(f"⏳ AI đang đánh giá ứng viên... (đã có điểm: {len(result_group['candidates'])})")
+    if not result_group['candidates']:
+        if not result_group.get('pending'):
+            st.info("Không tìm thấy ứng viên nào phù hợp.")
+        return
+    for i, result in enumerate(result_group['candidates'][:config.TOP_K_RESULTS]):
+        candidate = result['data']
+        parsed = result['parsed_scores']
+        with st.expander(f"**#{i+1}: {str(candidate.get('fullname', 'N/A')).title()}** | Điểm: {result['final_score']:.2f}", expanded= i < 2):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown(f"- **ID Hồ sơ:** `{result['id']}`\n- **Email:** `{candidate.get('email', 'N/A')}`\n- **Điện thoại:** `{candidate.get('phonenumber', 'N/A')}`")
+            with col2:
+                st.metric("Điểm Liên quan (Semantic)", f"{result['relevance_score']:.3f}")
+                st.metric("Điểm Chất lượng (LLM)", f"{result['quality_score']:.0f}")
+            st.markdown("---")
+            st.markdown("**Các chỉ số chính do AI phân tích:**")
+            key_metrics_cols = st.columns(4)
+            key_metrics_cols[0].metric("Số năm KN", f"{parsed.get('parsed_exp_years', 'N/A')}")
+            key_metrics_cols[1].metric("Kỹ năng Cứng (Nâng cao)", f"{parsed.get('parsed_prof_skill_advanced', 'N/A')}")
+            key_metrics_cols[2].metric("Chứng chỉ giá trị", f"{parsed.get('parsed_certs_high_value', 'N/A')}")
+            key_metrics_cols[3].metric("Điểm Ngoại ngữ", f"{parsed.get('parsed_lang_score', 'N/A')}")
 
 # --- Quản lý session state (giữ nguyên) ---
 if 'logged_in' not in st.session_state:
@@ -66,6 +99,16 @@ if not st.session_state.logged_in:
                     else: st.error(message)
 else:
     # --- GIAO DIỆN CHÍNH CỦA ỨNG DỤNG ---
+    try:
+        if not system_loader.is_ready():
+            with st.spinner("Đang khởi tạo hệ thống AI..."):
+                system_loader.wait_all()
+        llm_model = system_loader.get('llm_model')
+        resume_manager = system_loader.get('resume_manager')
+    except Exception as e:
+        initialize_system.clear()  # Lần tải trang sau sẽ khởi tạo lại
+        st.error(f"Không thể khởi tạo hệ thống: {e}")
+        st.stop()
     
     # --- THAY ĐỔI 1: HIỂN THỊ LỊCH SỬ TRÊN SIDEBAR ---
     st.sidebar.header(f"Xin chào, {st.session_state.user_info['email']}")
@@ -77,9 +120,10 @@ else:
 
     def load_past_results(search_id):
         user_id = st.session_state.user_info['id']
-        past_results = db_manager.get_past_search_result(search_id, user_id)
+        past_results = db_manager.get_past_search_result(search_id, user_id, resume_lookup=resume_manager.get_resume_records)
         if past_results:
             st.session_state.search_results = past_results
+            st.session_state.search_trace = None
         else:
             st.error("Không thể tải kết quả cũ.")
 
@@ -98,11 +142,15 @@ else:
             )
 
     st.sidebar.markdown("---")
+    with st.sidebar.expander("Thời gian khởi tạo hệ thống"):
+        for component_name, elapsed in system_loader.timings().items():
+            st.caption(f"{component_name}: {elapsed:.2f}s")
     if st.sidebar.button("Đăng xuất"):
         # ... (logic đăng xuất giữ nguyên)
         st.session_state.logged_in = False
         st.session_state.user_info = None
         st.session_state.search_results = None
+        st.session_state.search_trace = None
         st.rerun()
 
     st.title("🤖 Nhà Tư vấn Nhân sự AI")
@@ -114,74 +162,101 @@ else:
         if not user_query:
             st.warning("Vui lòng nhập yêu cầu tuyển dụng.")
         else:
-            with st.spinner("AI đang phân tích yêu cầu và tìm kiếm..."):
-                # --- Toàn bộ logic tìm kiếm giữ nguyên ---
-                enhanced_query = ai_services.enhance_query(llm_model, user_query)
-                intent = ai_services.classify_intent(llm_model, enhanced_query)
-                dynamic_weights = ai_services.get_dynamic_weights(llm_model, enhanced_query)
-                plan = ai_services.get_ai_plan(llm_model, enhanced_query, intent)
-                roles_to_find = plan.get('team_composition', []) if intent == 'project_description' else plan
-                
-                all_results = []
-                # ... (Vòng lặp for role in roles_to_find giữ nguyên) ...
-                for role in roles_to_find:
-                    role_title = role.get('position_title', 'KHÔNG XÁC ĐỊNH').upper()
-                    detailed_query = f"{role.get('position_title','')} with {role.get('experience_level','')} skills in {', '.join(role.get('hard_skills',[]))}"
-                    candidate_ids, relevance_scores = resume_manager.query_pinecone(detailed_query, top_k=config.SHORTLIST_SIZE)
-                    if not candidate_ids:
-                        continue
-                    shortlisted_resumes_df = resume_manager.get_resumes_by_ids(candidate_ids)
-                    candidate_results = []
-                    for i, (idx, candidate_row) in enumerate(shortlisted_resumes_df.iterrows()):
-                        relevance_score = relevance_scores.get(str(idx), 0)
-                        parsed_scores = ai_services.get_on_demand_quality_scores(candidate_row.to_dict(), llm_model)
-                        if not parsed_scores: continue
-                        quality_score = ai_services.calculate_quality_score(parsed_scores, dynamic_weights, role, candidate_row)
-                        normalized_quality_score = quality_score / 300.0
-                        final_score = (config.WEIGHT_RELEVANCE * relevance_score) + (config.WEIGHT_QUALITY * normalized_quality_score)
-                        candidate_results.append({
-                            "final_score": final_score, "relevance_score": relevance_score,
-                            "quality_score": quality_score, "data": candidate_row.to_dict(),
-                            "parsed_scores": parsed_scores, "id": idx
-                        })
-                    ranked_candidates = sorted(candidate_results, key=lambda x: x['final_score'], reverse=True)
-                    all_results.append({"role": role_title, "candidates": ranked_candidates})
-                
-                st.session_state.search_results = all_results
-                
+            st.session_state.search_results = None
+            st.session_state.search_trace = None
+            # Bấm "Dừng" sẽ chạy lại script: lần chạy hiện tại dừng ở lần cập nhật giao diện kế tiếp,
+            # generator bị đóng (hủy các lượt đánh giá chưa chạy) và kết quả đã có vẫn được giữ lại.
+            # Cờ dừng chỉ được đặt khi bấm nút, nên lỗi trong lúc tìm kiếm không bị hiển thị như bị dừng.
+            st.session_state.search_interrupted = False
+            status_area = st.empty()
+            stop_area = st.empty()
+            results_area = st.empty()
+            status_area.info("🔎 AI đang phân tích yêu cầu tuyển dụng...")
+            stop_area.button("⏹️ Dừng tìm kiếm", key="stop_search", on_click=mark_search_interrupted)
+            with tracing.start_trace() as search_trace:
+                search = search_engine.iter_search(llm_model, resume_manager, user_query)
+                try:
+                    for event in search:
+                        outcome = event["outcome"]
+                        st.session_state.search_results = outcome["results"]
+                        if event["type"] == "done":
+                            break
+                        evaluated = sum(len(group['candidates']) for group in outcome["results"])
+                        status_area.info(f"🔎 Đã lập kế hoạch cho {len(outcome['results'])} vị trí, "
+                                         f"đang đánh giá ứng viên (đã có điểm: {evaluated})...")
+                        with results_area.container():
+                            for result_group in outcome["results"]:
+                                render_result_group(result_group)
+                except Exception:
+                    # Lỗi giữa chừng (khác với bấm "Dừng", vốn không phải Exception): bỏ kết quả dở dang
+                    st.session_state.search_results = None
+                    raise
+                finally:
+                    search.close()
+                status_area.empty()
+                stop_area.empty()
+                results_area.empty()
+                all_results = outcome["results"]
+                if outcome["cache_hit"]:
+                    st.info(f"Kết quả được lấy từ một tìm kiếm tương tự trước đó: \"{outcome['cache_hit']['query']}\" "
+                            f"(độ tương đồng {outcome['cache_hit']['similarity']:.2f}).")
+
                 # --- THAY ĐỔI 2: GỬI KẾT QUẢ ĐỂ LƯU VÀO DB ---
                 db_manager.log_search_history(
                     user_id=st.session_state.user_info['id'],
                     query=user_query,
-                    enhanced_query=enhanced_query,
-                    intent=intent,
+                    enhanced_query=outcome["enhanced_query"],
+                    intent=outcome["intent"],
                     results_data=all_results # <-- Gửi kết quả đi
                 )
+            st.session_state.search_trace = search_trace.summary()
+
+    # Tìm kiếm trước đó bị dừng giữa chừng: giữ lại các ứng viên đã được đánh giá
+    if st.session_state.get('search_interrupted'):
+        st.session_state.search_interrupted = False
+        for result_group in st.session_state.search_results or []:
+            result_group.pop('pending', None)
+        st.warning("Tìm kiếm đã dừng giữa chừng. Kết quả bên dưới chỉ gồm các ứng viên đã được đánh giá.")
 
     # --- HIỂN THỊ KẾT QUẢ (giữ nguyên)---
     if st.session_state.search_results:
         st.markdown("---")
         st.subheader("Kết quả đề xuất")
+
+        # Chi tiết thời gian xử lý của lần tìm kiếm vừa chạy
+        search_trace = st.session_state.get('search_trace')
+        if search_trace:
+            with st.expander(f"⏱️ Thời gian xử lý: {search_trace['total_ms'] / 1000:.2f}s (search id: {search_trace['search_id']})"):
+                st.dataframe(pd.DataFrame([
+                    {"Bước": name, "Số lần": item['count'], "Lỗi": item['errors'], "Tổng (ms)": round(item['total_ms'], 1)}
+                    for name, item in sorted(search_trace['by_name'].items(), key=lambda kv: -kv[1]['total_ms'])
+                ]), use_container_width=True, hide_index=True)
+                st.dataframe(pd.DataFrame([
+                    {"Bước": record['name'], "Bắt đầu (ms)": round((record['start'] - search_trace['spans'][0]['start']) * 1000, 1),
+                     "Thời gian (ms)": round(record['duration_ms'], 1), "Kết quả": record['outcome'],
+                     "Chi tiết": json.dumps(record['attributes'], ensure_ascii=False)}
+                    for record in search_trace['spans']
+                ]), use_container_width=True, hide_index=True)
+
+        # Xếp hạng lại tức thì với trọng số mới (dùng điểm đã có, không gọi lại AI)
+        first_group = st.session_state.search_results[0]
+        current_weights = {**config.DEFAULT_DYNAMIC_WEIGHTS, **(first_group.get('dynamic_weights') or {})}
+        with st.expander("⚖️ Điều chỉnh trọng số và xếp hạng lại"):
+            with st.form("rerank_form"):
+                weight_cols = st.columns(4)
+                new_weights = {}
+                for i, (weight_key, weight_value) in enumerate(current_weights.items()):
+                    new_weights[weight_key] = weight_cols[i % 4].slider(
+                        weight_key, 0.0, 10.0, min(max(float(weight_value), 0.0), 10.0), 0.5
+                    )
+                new_weight_relevance = st.slider(
+                    "Tỷ trọng Liên quan (phần còn lại là Chất lượng)", 0.0, 1.0,
+                    float(first_group.get('weight_relevance', config.WEIGHT_RELEVANCE)), 0.05
+                )
+                if st.form_submit_button("Xếp hạng lại"):
+                    st.session_state.search_results = scoring.rerank_results(
+                        st.session_state.search_results, new_weights,
+                        weight_relevance=new_weight_relevance, weight_quality=1.0 - new_weight_relevance
+                    )
         for result_group in st.session_state.search_results:
-            st.markdown(f"#### 🏆 Top ứng viên cho vị trí: **{result_group['role']}**")
-            # ... (toàn bộ logic hiển thị kết quả giữ nguyên) ...
-            if not result_group['candidates']:
-                st.info("Không tìm thấy ứng viên nào phù hợp.")
-                continue
-            for i, result in enumerate(result_group['candidates'][:config.TOP_K_RESULTS]):
-                candidate = result['data']
-                parsed = result['parsed_scores']
-                with st.expander(f"**#{i+1}: {str(candidate.get('fullname', 'N/A')).title()}** | Điểm: {result['final_score']:.2f}", expanded= i < 2):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.markdown(f"- **ID Hồ sơ:** `{result['id']}`\n- **Email:** `{candidate.get('email', 'N/A')}`\n- **Điện thoại:** `{candidate.get('phonenumber', 'N/A')}`")
-                    with col2:
-                        st.metric("Điểm Liên quan (Semantic)", f"{result['relevance_score']:.3f}")
-                        st.metric("Điểm Chất lượng (LLM)", f"{result['quality_score']:.0f}")
-                    st.markdown("---")
-                    st.markdown("**Các chỉ số chính do AI phân tích:**")
-                    key_metrics_cols = st.columns(4)
-                    key_metrics_cols[0].metric("Số năm KN", f"{parsed.get('parsed_exp_years', 'N/A')}")
-                    key_metrics_cols[1].metric("Kỹ năng Cứng (Nâng cao)", f"{parsed.get('parsed_prof_skill_advanced', 'N/A')}")
-                    key_metrics_cols[2].metric("Chứng chỉ giá trị", f"{parsed.get('parsed_certs_high_value', 'N/A')}")
-                    key_metrics_cols[3].metric("Điểm Ngoại ngữ", f"{parsed.get('parsed_lang_score', 'N/A')}")
\ No newline at end of file
+            render_result_group(result_group)
\ No newline at end of file
@@ -0,0 +1,108 @@
+# batch_search.py
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm.auto import tqdm
+import config
+import search_engine
+
+# Tìm kiếm hàng loạt từ file JSON lines, mỗi dòng một yêu cầu tuyển dụng:
+#   {"id": "REQ-001", "query": "Cần 2 lập trình viên Java..."}   ("id" không bắt buộc, mặc định là số dòng)
+# Kết quả ghi ra file JSON lines theo thứ tự hoàn thành, mỗi dòng {"id", "query", ...} hoặc {"id", "error"}.
+# Các yêu cầu chạy song song trong một process nên dùng chung model, các cache và giới hạn gọi Gemini.
+
+def read_jobs(path):
+    """Đọc các yêu cầu từ file JSONL, trả về list (job_id, query); dòng lỗi được bỏ qua kèm cảnh báo."""
+    jobs = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"⚠️ Dòng {line_no}: JSON không hợp lệ, bỏ qua ({e}).")
+                continue
+            query = record.get("query") if isinstance(record, dict) else None
+            if not isinstance(query, str) or not query.strip():
+                print(f"⚠️ Dòng {line_no}: thiếu trường 'query', bỏ qua.")
+                continue
+            jobs.append((str(record.get("id", line_no)), query.strip()))
+    return jobs
+
+def read_finished_ids(path):
+    """Id các yêu cầu đã có kết quả (không lỗi) trong file output, để chạy tiếp sau khi bị dừng."""
+    if not os.path.exists(path):
+        return set()
+    finished = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Dòng cuối có thể bị ghi dở
+            if "error" not in record:
+                finished.add(str(record.get("id")))
+    return finished
+
+def run_batch(input_path, output_path, workers=None, top_k=None, use_result_cache=None, resume=False, engine=None):
+    """Chạy mọi yêu cầu trong `input_path`, ghi kết quả vào `output_path`. Trả về dict thống kê."""
+    workers = workers or config.SEARCH_MAX_CONCURRENT
+    jobs = read_jobs(input_path)
+    if resume:
+        finished = read_finished_ids(output_path)
+        jobs = [(job_id, query) for job_id, query in jobs if job_id not in finished]
+        print(f"   -> Bỏ qua {len(finished)} yêu cầu đã có kết quả.")
+    summary = {"total": len(jobs), "succeeded": 0, "failed": 0, "cache_hits": 0, "seconds": 0.0}
+    if not jobs:
+        print("✅ Không có yêu cầu nào cần chạy.")
+        return summary
+
+    engine = engine or search_engine.SearchEngine.from_config(max_concurrent=workers)
+    write_lock = threading.Lock()
+    start = time.time()
+
+    def run_job(job_id, query):
+        outcome = engine.search(query, use_result_cache=use_result_cache)
+        return {"id": job_id, "query": query, **search_engine.serialize_outcome(outcome, top_k)}
+
+    with open(output_path, 'a' if resume else 'w', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-search") as executor:
+        futures = {executor.submit(run_job, job_id, query): (job_id, query) for job_id, query in jobs}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Tìm kiếm"):
+            job_id, query = futures[future]
+            try:
+                record = future.result()
+                summary["succeeded"] += 1
+                summary["cache_hits"] += 1 if record["cache_hit"] else 0
+            except Exception as e:
+                print(f"🔥 Lỗi khi tìm kiếm cho yêu cầu '{job_id}': {e}")
+                record = {"id": job_id, "query": query, "error": str(e)}
+                summary["failed"] += 1
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                out.flush()
+    summary["seconds"] = time.time() - start
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tìm kiếm ứng viên hàng loạt từ file JSON lines.")
+    parser.add_argument("input", help="File JSONL, mỗi dòng {\"id\": ..., \"query\": ...}.")
+    parser.add_argument("output", help="File JSONL ghi kết quả.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Số yêu cầu chạy đồng thời (mặc định SEARCH_MAX_CONCURRENT).")
+    parser.add_argument("--top-k", type=int, default=None, help="Số ứng viên giữ lại cho mỗi vị trí.")
+    parser.add_argument("--no-result-cache", action="store_true", help="Không dùng lại kết quả của truy vấn tương tự.")
+    parser.add_argument("--resume", action="store_true", help="Bỏ qua các yêu cầu đã có kết quả trong file output.")
+    args = parser.parse_args()
+
+    print("--- BẮT ĐẦU TÌM KIẾM HÀNG LOẠT ---")
+    report = run_batch(
+        args.input, args.output, workers=args.workers, top_k=args.top_k,
+        use_result_cache=False if args.no_result_cache else None, resume=args.resume
+    )
+    print(f"--- ✅ HOÀN TẤT: {report['succeeded']}/{report['total']} yêu cầu thành công, {report['failed']} lỗi, "
+          f"{report['cache_hits']} lần dùng lại kết quả, {report['seconds']:.1f}s ---")
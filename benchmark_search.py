@@ -0,0 +1,386 @@
+# benchmark_search.py
+import os
+import re
+import json
+import time
+import zlib
+import random
+import sqlite3
+import argparse
+import resource
+import tempfile
+import threading
+import tracemalloc
+import numpy as np
+import google.api_core.exceptions
+import config
+import db_pool
+import prompts
+import search_engine
+import vector_store
+from resume_manager import ResumeManager
+
+# Benchmark toàn bộ pipeline tìm kiếm (search_engine.run_search) mà không cần dịch vụ thật:
+#   - Gemini  -> FakeLLM: độ trễ cấu hình được, lỗi rate limit ngẫu nhiên, JSON mẫu cho từng prompt
+#   - Pinecone -> LocalVectorStore trong thư mục tạm
+#   - TiDB    -> SQLite chứa bảng cleaned_resumes sinh ngẫu nhiên, dùng qua db_pool như thật
+# Báo cáo p50/p95 theo từng giai đoạn, số lời gọi LLM mỗi lần tìm kiếm và bộ nhớ sử dụng.
+
+SKILL_FAMILIES = {
+    "Backend Developer": ["Python", "Java", "Go", "SQL", "PostgreSQL", "Django", "Spring Boot", "Docker", "Kubernetes", "AWS"],
+    "Frontend Developer": ["JavaScript", "TypeScript", "React", "Vue", "HTML", "CSS", "Next.js", "Figma"],
+    "Data Analyst": ["SQL", "Python", "Excel", "Power BI", "Tableau", "Pandas", "Statistics"],
+    "Mobile Developer": ["Kotlin", "Swift", "Flutter", "React Native", "Firebase", "Android", "iOS"],
+    "DevOps Engineer": ["Linux", "Docker", "Kubernetes", "Terraform", "AWS", "CI/CD", "Prometheus"],
+    "Marketing Specialist": ["SEO", "Google Ads", "Content Marketing", "Facebook Ads", "Copywriting", "Analytics"],
+}
+SOFT_SKILLS = ["Communication", "Teamwork", "Leadership", "Problem Solving", "Time Management"]
+LANGUAGES = ["IELTS 6.5", "IELTS 7.5", "TOEIC 800", "JLPT N2", "HSK 4"]
+
+DEFAULT_JOB_DESCRIPTIONS = [
+    "Cần tuyển Senior Backend Developer 5 năm kinh nghiệm Python, Django, PostgreSQL, Docker",
+    "Looking for a frontend developer skilled in React, TypeScript and CSS",
+    "Tuyển data analyst biết SQL, Power BI, Excel, tiếng Anh tốt",
+    "We are building a food delivery app and need a team: mobile (Flutter, Firebase), backend (Go, Kubernetes) and marketing (SEO, Google Ads)",
+    "DevOps engineer with Terraform, AWS, Kubernetes and CI/CD experience",
+    "Mobile developer Kotlin Swift 3 years",
+    "Startup fintech cần đội ngũ: backend Java Spring Boot, frontend Vue, data analyst Tableau",
+    "Marketing specialist content marketing, copywriting, Facebook Ads",
+]
+
+# --- Embedding giả lập: hashing bag-of-words, xác định và nhanh ---
+class HashingEmbedder:
+    def __init__(self, dimension):
+        self.dimension = dimension
+
+    def encode(self, texts, show_progress_bar=False, batch_size=32):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in re.findall(r"\w+", str(text).lower()):
+                vectors[row, zlib.crc32(token.encode('utf-8')) % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+# --- LLM giả lập ---
+def _static_prefix(template):
+    return template[:template.index('{')]
+
+class FakeLLM:
+    """Thay cho genai.GenerativeModel: trả JSON mẫu theo prompt, có độ trễ và lỗi rate limit ngẫu nhiên."""
+
+    model_name = "fake-gemini"
+
+    def __init__(self, latency_ms=300, jitter_ms=100, rate_limit_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.rate_limited = 0
+        # Prefix tĩnh dài nhất khớp với prompt sẽ xác định prompt nào đang được gọi
+        self._prefixes = sorted(
+            ((_static_prefix(getattr(prompts, name)), name) for name in dir(prompts) if name.startswith('PROMPT_')),
+            key=lambda item: len(item[0]), reverse=True
+        )
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls, self.rate_limited = {}, 0
+
+    def _identify(self, prompt):
+        for prefix, name in self._prefixes:
+            if prompt.startswith(prefix):
+                return name
+        return 'UNKNOWN'
+
+    def generate_content(self, prompt, request_options=None, safety_settings=None):
+        prompt_name = self._identify(prompt)
+        with self._lock:
+            self.calls[prompt_name] = self.calls.get(prompt_name, 0) + 1
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+            rate_limited = self._random.random() < self.rate_limit_rate
+            if rate_limited:
+                self.rate_limited += 1
+        time.sleep(delay)
+        if rate_limited:
+            raise google.api_core.exceptions.ResourceExhausted("429 Resource has been exhausted (giả lập)")
+        return _FakeResponse(self._respond(prompt_name, prompt))
+
+    def _respond(self, prompt_name, prompt):
+        user_query = _extract_user_query(prompt)
+        if prompt_name == 'PROMPT_QUERY_ENHANCER':
+            return user_query
+        if prompt_name == 'PROMPT_INTENT_CLASSIFIER':
+            return _intent_of(user_query)
+        if prompt_name == 'PROMPT_WEIGHT_ADJUSTER':
+            return json.dumps(_weights_of(user_query))
+        if prompt_name == 'PROMPT_ROLE_EXTRACTOR':
+            return json.dumps(_roles_of(user_query)[:1])
+        if prompt_name == 'PROMPT_PROJECT_DECOMPOSER':
+            return json.dumps({"project_summary": user_query[:120], "team_composition": _roles_of(user_query)})
+        if prompt_name == 'PROMPT_QUERY_UNDERSTANDING':
+            intent = _intent_of(user_query)
+            roles = _roles_of(user_query)
+            return json.dumps({
+                "enhanced_query": user_query, "intent": intent, "weights": _weights_of(user_query),
+                "project_summary": user_query[:120] if intent == 'project_description' else "",
+                "roles": roles if intent == 'project_description' else roles[:1],
+            })
+        if prompt_name == 'PROMPT_HYBRID_EVALUATION':
+            return json.dumps(_scores_for(prompt))
+        if prompt_name == 'PROMPT_HYBRID_EVALUATION_BATCH':
+            resume_ids = re.findall(r"---BEGIN RESUME id=(\S+?)---", prompt)
+            return json.dumps([dict(_scores_for(resume_id), resume_id=resume_id) for resume_id in resume_ids])
+        return "{}"
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+def _extract_user_query(prompt):
+    match = re.search(r'(?:User request|Project Description|User Query|User\'s Raw Query): "(.*)"', prompt, re.S)
+    return match.group(1) if match else ""
+
+def _mentioned_families(user_query):
+    text = user_query.lower()
+    families = [
+        family for family, skills in SKILL_FAMILIES.items()
+        if family.split()[0].lower() in text or any(skill.lower() in text for skill in skills)
+    ]
+    return families or ["Backend Developer"]
+
+def _intent_of(user_query):
+    return 'project_description' if len(_mentioned_families(user_query)) > 1 else 'specific_role'
+
+def _weights_of(user_query):
+    weights = dict(config.DEFAULT_DYNAMIC_WEIGHTS)
+    if re.search(r"\d+\s*(năm|years)", user_query.lower()):
+        weights['experience'] = 9
+    return weights
+
+def _roles_of(user_query):
+    text = user_query.lower()
+    roles = []
+    for family in _mentioned_families(user_query):
+        skills = [skill for skill in SKILL_FAMILIES[family] if skill.lower() in text] or SKILL_FAMILIES[family][:3]
+        roles.append({
+            "position_title": family, "justification": "Giả lập", "experience_level": "3+ years of experience",
+            "hard_skills": skills, "responsibilities": ["Giả lập"],
+        })
+    return roles
+
+def _scores_for(seed_text):
+    rng = random.Random(zlib.crc32(seed_text.encode('utf-8')))
+    return {
+        "parsed_exp_years": rng.randint(0, 12), "parsed_lang_score": rng.randint(0, 10),
+        "parsed_education_score": rng.randint(0, 5), "parsed_prof_skill_advanced": rng.randint(0, 8),
+        "parsed_prof_skill_basic": rng.randint(0, 8), "parsed_soft_skill_count": rng.randint(0, 6),
+        "parsed_certs_high_value": rng.randint(0, 3), "parsed_certs_standard_value": rng.randint(0, 4),
+        "parsed_achievements_high_impact": rng.randint(0, 3), "parsed_achievements_standard_impact": rng.randint(0, 4),
+        "parsed_projects_high_impact": rng.randint(0, 4), "parsed_projects_standard_impact": rng.randint(0, 5),
+        "parsed_activities_high_impact": rng.randint(0, 2), "parsed_activities_standard_impact": rng.randint(0, 3),
+    }
+
+# --- TiDB giả lập bằng SQLite ---
+class _SQLiteCursor:
+    """Cursor kiểu mysql-connector trên SQLite (placeholder %s, hỗ trợ dictionary=True)."""
+
+    def __init__(self, raw_cursor, dictionary=False):
+        self._cursor = raw_cursor
+        self._dictionary = dictionary
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace('%s', '?'), tuple(params or ()))
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(sql.replace('%s', '?'), [tuple(row) for row in rows])
+
+    def _convert(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip([column[0] for column in self._cursor.description], row))
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+class SQLiteConnection:
+    """Kết nối SQLite có giao diện giống kết nối mysql-connector mà db_pool sử dụng."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+
+    def cursor(self, dictionary=False, **kwargs):
+        return _SQLiteCursor(self._conn.cursor(), dictionary=dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        self._conn.close()
+
+def build_synthetic_corpus(db_path, store, embedder, corpus_size, seed):
+    """Sinh `corpus_size` hồ sơ vào SQLite và đưa embedding của chúng vào vector store."""
+    rng = random.Random(seed)
+    families = list(SKILL_FAMILIES)
+    conn = sqlite3.connect(db_path)
+    columns = list(config.RESUME_COLUMNS) + ['full_text']
+    conn.execute(f"CREATE TABLE {config.TABLE_NAME} ({', '.join(f'{c} TEXT' for c in columns)})")
+    conn.execute(
+        f"CREATE TABLE {config.SYNC_STATE_TABLE} (index_name TEXT, resume_id TEXT, content_hash TEXT, "
+        "synced_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+    )
+
+    batch_rows = []
+    def flush():
+        placeholders = ", ".join(["?"] * len(columns))
+        conn.executemany(f"INSERT INTO {config.TABLE_NAME} VALUES ({placeholders})", batch_rows)
+        texts = [row[-1] for row in batch_rows]
+        store.upsert(list(zip([row[0] for row in batch_rows], embedder.encode(texts))))
+        batch_rows.clear()
+
+    for resume_id in range(1, corpus_size + 1):
+        family = rng.choice(families)
+        skills = rng.sample(SKILL_FAMILIES[family], k=min(len(SKILL_FAMILIES[family]), rng.randint(3, 6)))
+        years = rng.randint(0, 12)
+        record = {
+            'id': str(resume_id), 'fullname': f"ung vien {resume_id}",
+            'email': f"candidate{resume_id}@example.com", 'phonenumber': f"09{resume_id:08d}",
+            'experience': f"{years} years as {family} working with {', '.join(skills)}",
+            'language_skill': rng.choice(LANGUAGES), 'certificate': f"{rng.choice(skills)} certification",
+            'achievement': rng.choice(["Employee of the year", "Hackathon winner", ""]),
+            'project': f"Built a {rng.choice(['payment', 'e-commerce', 'analytics', 'chat'])} system using {', '.join(skills[:2])}",
+            'activity': rng.choice(["Volunteer teacher", "Tech community organizer", ""]),
+            'professional_skill': ", ".join(skills), 'soft_skill': ", ".join(rng.sample(SOFT_SKILLS, k=2)),
+            'education': rng.choice(["Bachelor of Computer Science", "Master of Information Systems", "Bachelor of Marketing"]),
+        }
+        record['full_text'] = " ".join(str(record[c]) for c in config.RESUME_COLUMNS if c not in ('id', 'email', 'phonenumber'))
+        batch_rows.append(tuple(record.get(c, "") for c in columns))
+        if len(batch_rows) >= 500:
+            flush()
+    if batch_rows:
+        flush()
+    conn.commit()
+    conn.close()
+    store.flush()
+
+# --- Chạy benchmark ---
+def _percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+def run_benchmark(corpus_size=2000, searches=20, job_descriptions=None, latency_ms=300, jitter_ms=100,
+                  rate_limit_rate=0.0, warm_caches=False, seed=0):
+    """Chạy benchmark, trả về dict báo cáo (thời gian theo mili giây)."""
+    job_descriptions = job_descriptions or DEFAULT_JOB_DESCRIPTIONS
+    workdir = tempfile.mkdtemp(prefix="hr-ai-bench-")
+
+    # Chỉ thay đổi cấu hình trong process benchmark
+    config.SCORE_CACHE_ENABLED = False  # Câu lệnh upsert của cache điểm dùng cú pháp riêng của MySQL
+    config.RESULT_CACHE_ENABLED = warm_caches
+    config.LLM_CACHE_ENABLED = warm_caches
+    config.LLM_CACHE_PATH = os.path.join(workdir, "llm_cache.sqlite3")
+    config.API_RETRY_INITIAL_WAIT = 0.05
+    config.VECTOR_STORE_BACKEND = 'local'
+    config.LOCAL_VECTOR_STORE_PATH = os.path.join(workdir, "vectors", "resumes")
+
+    print(f"--- CHUẨN BỊ DỮ LIỆU GIẢ LẬP ({corpus_size} hồ sơ) tại {workdir} ---")
+    db_path = os.path.join(workdir, "resumes.sqlite3")
+    embedder = HashingEmbedder(config.EMBEDDING_DIMENSION)
+    store = vector_store.LocalVectorStore()
+    build_synthetic_corpus(db_path, store, embedder, corpus_size, seed)
+    db_pool._pool = db_pool.ConnectionPool(connect=lambda: SQLiteConnection(db_path))
+
+    llm = FakeLLM(latency_ms=latency_ms, jitter_ms=jitter_ms, rate_limit_rate=rate_limit_rate, seed=seed)
+    resume_manager = ResumeManager(embedder, store=store)
+
+    print(f"--- CHẠY {searches} LẦN TÌM KIẾM ---")
+    stage_times = {stage: [] for stage in search_engine.STAGES}
+    totals, llm_calls, rate_limited, cache_hits = [], [], [], 0
+    tracemalloc.start()
+    for i in range(searches):
+        user_query = job_descriptions[i % len(job_descriptions)]
+        llm.reset_counters()
+        start = time.perf_counter()
+        outcome = search_engine.run_search(llm, resume_manager, user_query)
+        totals.append(time.perf_counter() - start)
+        for stage, seconds in outcome['timings'].items():
+            stage_times[stage].append(seconds)
+        llm_calls.append(sum(llm.calls.values()))
+        rate_limited.append(llm.rate_limited)
+        cache_hits += 1 if outcome['cache_hit'] else 0
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "corpus_size": corpus_size, "searches": searches,
+        "stages_ms": {
+            stage: {"p50": _percentile(values, 50), "p95": _percentile(values, 95), "runs": len(values)}
+            for stage, values in stage_times.items() if values
+        },
+        "total_ms": {"p50": _percentile(totals, 50), "p95": _percentile(totals, 95)},
+        "llm_calls_per_search": float(np.mean(llm_calls)) if llm_calls else 0.0,
+        "rate_limited_per_search": float(np.mean(rate_limited)) if rate_limited else 0.0,
+        "result_cache_hits": cache_hits,
+        "python_peak_mb": peak_bytes / 1024 / 1024,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def print_report(report):
+    print(f"\n--- KẾT QUẢ BENCHMARK ({report['searches']} lần tìm kiếm, {report['corpus_size']} hồ sơ) ---")
+    print(f"   {'Giai đoạn':<14}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for stage, values in report['stages_ms'].items():
+        print(f"   {stage:<14}{values['p50']:>12.1f}{values['p95']:>12.1f}")
+    print(f"   {'TỔNG':<14}{report['total_ms']['p50']:>12.1f}{report['total_ms']['p95']:>12.1f}")
+    print(f"   -> Lời gọi LLM mỗi lần tìm kiếm: {report['llm_calls_per_search']:.1f} "
+          f"(bị rate limit: {report['rate_limited_per_search']:.1f})")
+    print(f"   -> Dùng lại từ cache kết quả: {report['result_cache_hits']} lần")
+    print(f"   -> Bộ nhớ: Python peak {report['python_peak_mb']:.1f} MB, RSS tối đa {report['max_rss_mb']:.1f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pipeline tìm kiếm với Gemini/Pinecone/TiDB giả lập.")
+    parser.add_argument("--corpus-size", type=int, default=2000)
+    parser.add_argument("--searches", type=int, default=20)
+    parser.add_argument("--queries", help="File văn bản, mỗi dòng một mô tả công việc (mặc định: bộ mẫu có sẵn).")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Tỷ lệ lời gọi LLM bị lỗi rate limit (0-1).")
+    parser.add_argument("--understanding-mode", choices=['fused', 'legacy'], default=config.QUERY_UNDERSTANDING_MODE)
+    parser.add_argument("--warm-caches", action="store_true", help="Bật cache kết quả và cache phản hồi LLM.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-out", help="Ghi báo cáo dạng JSON vào file này.")
+    args = parser.parse_args()
+
+    config.QUERY_UNDERSTANDING_MODE = args.understanding_mode
+    queries = None
+    if args.queries:
+        with open(args.queries, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    report = run_benchmark(
+        corpus_size=args.corpus_size, searches=args.searches, job_descriptions=queries,
+        latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms, rate_limit_rate=args.rate_limit_rate,
+        warm_caches=args.warm_caches, seed=args.seed
+    )
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
@@ -8,6 +8,10 @@ load_dotenv()
 GEMINI_MODEL_NAME = 'gemini-1.5-flash'
 SENTENCE_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+API_MAX_RETRIES = 3 # Số lần gọi lại Gemini khi bị rate limit
+API_RETRY_INITIAL_WAIT = 5 # Thời gian chờ (giây) trước lần gọi lại đầu tiên, tăng gấp đôi sau mỗi lần
+LLM_REQUESTS_PER_MINUTE = 0 # Giới hạn số lời gọi Gemini mỗi phút của cả process (0: không giới hạn)
+LLM_RATE_LIMIT_BURST = None # Số lời gọi được dồn liền nhau (None: bằng lượng của 10 giây)
 
 # --- CẤU HÌNH DATABASE ---
 TABLE_NAME = 'cleaned_resumes'
@@ -24,6 +28,13 @@ DB_CONFIG = {
     "ssl_verify_identity": True
 }
 
+# --- CẤU HÌNH CONNECTION POOL ---
+DB_POOL_SIZE = None # Số kết nối tối đa mỗi process (None: tự tính theo số luồng có thể dùng DB cùng lúc)
+DB_POOL_WAIT_TIMEOUT = 10 # Thời gian (giây) tối đa chờ một kết nối rảnh
+DB_POOL_PING_AFTER = 30 # Kết nối rảnh lâu hơn (giây) sẽ được ping kiểm tra trước khi dùng lại
+DB_POOL_MAX_IDLE = 300 # Kết nối rảnh lâu hơn (giây) sẽ bị đóng và tạo mới
+DB_POOL_MAX_LIFETIME = 1800 # Tuổi thọ tối đa (giây) của một kết nối
+
 # --- CẤU HÌNH PINECONE ---
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
@@ -37,5 +48,119 @@ DEFAULT_DYNAMIC_WEIGHTS = {
     'certificate': 4, 'achievement': 4, 'project': 5,
     'soft_skill': 3, 'activity': 2
 }
-SHORTLIST_SIZE = 10 # Tăng shortlist cho Pinecone
-TOP_K_RESULTS = 5
\ No newline at end of file
+SHORTLIST_SIZE = 30 # Số ứng viên lấy từ vector store cho mỗi vị trí (chỉ một phần được LLM đánh giá, xem CASCADE_*)
+TOP_K_RESULTS = 5
+
+# --- CẤU HÌNH CACHE ĐIỂM CHẤT LƯỢNG ---
+SCORE_CACHE_ENABLED = True
+SCORE_CACHE_TABLE = 'resume_quality_scores' # Bảng phụ trên TiDB lưu điểm parsed_* theo hash nội dung
+
+# --- CẤU HÌNH ĐÁNH GIÁ ỨNG VIÊN SONG SONG ---
+EVALUATION_MAX_WORKERS = 8 # Số lời gọi Gemini đánh giá ứng viên chạy đồng thời
+EVALUATION_CALL_TIMEOUT = 60 # Timeout (giây) cho mỗi lời gọi API đánh giá
+EVALUATION_TOTAL_TIMEOUT = 120 # Thời gian tối đa (giây) chờ toàn bộ ứng viên của một lần tìm kiếm
+SEARCH_CANCEL_POLL_SECONDS = 0.5 # Chu kỳ (giây) kiểm tra yêu cầu hủy khi đang chờ kết quả đánh giá
+
+# --- CẤU HÌNH PHÂN TÍCH TRUY VẤN ---
+# 'fused': một lời gọi Gemini trả về query đã làm rõ, intent, trọng số và kế hoạch.
+# 'legacy': dùng 4 prompt riêng lẻ (các bước độc lập chạy song song).
+QUERY_UNDERSTANDING_MODE = 'fused'
+
+# --- CẤU HÌNH ĐÁNH GIÁ THEO LÔ ---
+EVALUATION_BATCH_ENABLED = True # Gộp nhiều CV vào một lời gọi Gemini
+EVALUATION_BATCH_MAX_SIZE = 10 # Số CV tối đa mỗi lô (giới hạn bởi độ dài output của model)
+EVALUATION_BATCH_MAX_INPUT_CHARS = 120000 # Ngân sách ký tự đầu vào mỗi lô (~30k token)
+EVALUATION_BATCH_RETRIES = 1 # Số lần thử lại cho các CV có kết quả lỗi/thiếu
+
+# --- CẤU HÌNH XẾP HẠNG NHIỀU TẦNG (CASCADE) ---
+# Ứng viên lấy từ vector store được chấm sơ bộ (relevance + độ trùng kỹ năng cứng), chỉ những CV tốt nhất
+# trong ngân sách mới được Gemini đánh giá chi tiết. CV đã có điểm trong cache luôn được dùng (không tốn lời gọi).
+# Mỗi vị trí luôn có ít nhất TOP_K_RESULTS CV được đánh giá; lần thử lại cũng được tính vào ngân sách.
+CASCADE_ENABLED = True
+CASCADE_PRESCORE_RELEVANCE_WEIGHT = 0.6 # Tỷ trọng relevance trong điểm sơ bộ (phần còn lại là độ trùng kỹ năng)
+CASCADE_LLM_RESUME_BUDGET = 40 # Số CV gửi Gemini đánh giá tối đa mỗi lần tìm kiếm, gồm cả thử lại (None: không giới hạn)
+CASCADE_LLM_TOKEN_BUDGET = None # Số token đầu vào (ước lượng) tối đa cho đánh giá mỗi lần tìm kiếm (None: không giới hạn)
+
+# --- CẤU HÌNH CHẤM ĐIỂM TRƯỚC (OFFLINE) ---
+PRESCORE_PAGE_SIZE = 200 # Số CV đọc từ TiDB mỗi trang
+PRESCORE_MAX_WORKERS = 4 # Số lô gửi Gemini đồng thời
+PRESCORE_CHECKPOINT_PATH = '.prescore_checkpoint.json'
+# True: khi tìm kiếm chỉ dùng điểm đã chấm trước trong cache, không gọi Gemini cho CV chưa có điểm
+EVALUATION_CACHE_ONLY = False
+
+# --- CẤU HÌNH ĐỒNG BỘ PINECONE ---
+SYNC_STATE_TABLE = 'pinecone_sync_state' # Lưu hash nội dung của từng CV đã đồng bộ lên index
+SYNC_BATCH_SIZE = 100
+SYNC_READ_QUEUE_SIZE = 4 # Số batch đọc sẵn từ TiDB chờ embedding (giới hạn bộ nhớ)
+SYNC_UPSERT_WORKERS = 4 # Số luồng upsert lên index chạy đồng thời
+SYNC_UPSERT_RETRIES = 3 # Số lần thử lại một batch upsert lỗi
+SYNC_ENCODE_PROCESSES = None # Số process encode song song (None: bằng số core; 1: encode trong process chính)
+SYNC_ENCODE_WINDOW = 2000 # Số CV gom lại để sắp theo độ dài trước khi encode
+SYNC_ENCODE_CHUNK_SIZE = 256 # Số CV (có độ dài gần nhau) giao cho mỗi process một lần
+SYNC_ENCODE_BATCH_SIZE = 32 # Batch size bên trong model.encode
+
+# --- CẤU HÌNH VECTOR STORE ---
+VECTOR_STORE_BACKEND = 'pinecone' # 'pinecone' hoặc 'local' (file memory-mapped, chạy offline/on-prem)
+EMBEDDING_DIMENSION = 384
+LOCAL_VECTOR_STORE_PATH = 'data/vector_index/resumes' # Tiền tố đường dẫn các file của local store
+LOCAL_VECTOR_DTYPE = 'float16' # 'float16' (tiết kiệm bộ nhớ) hoặc 'float32'
+LOCAL_ANN_INDEX = None # None: tìm kiếm chính xác bằng NumPy; 'hnsw': dùng hnswlib nếu đã cài
+
+# --- CẤU HÌNH TRUY VẤN VECTOR ---
+QUERY_EMBEDDING_CACHE_SIZE = 2048 # Số embedding truy vấn giữ trong LRU cache (theo văn bản đã chuẩn hóa)
+RETRIEVAL_MAX_WORKERS = 8 # Số truy vấn vector store chạy đồng thời trong một lần tìm kiếm
+
+# --- CẤU HÌNH TẢI HỒ SƠ ---
+# Các cột hồ sơ cần cho việc chấm điểm và hiển thị (không tải các cột khác)
+RESUME_COLUMNS = [
+    'id', 'fullname', 'email', 'phonenumber',
+    'experience', 'language_skill', 'certificate', 'achievement',
+    'project', 'activity', 'professional_skill', 'soft_skill', 'education'
+]
+RESUME_CACHE_SIZE = 5000 # Số hồ sơ "nóng" giữ trong LRU cache của mỗi process
+RESUME_CACHE_TTL = 600 # Thời gian (giây) trước khi một hồ sơ trong cache được tải lại từ DB
+RESUME_PREWARM = False # True: tải toàn bộ bảng vào bộ nhớ khi khởi động (chỉ nên dùng cho dữ liệu nhỏ)
+
+# --- CẤU HÌNH GHI LỊCH SỬ TÌM KIẾM ---
+HISTORY_FLUSH_SIZE = 20 # Ghi xuống DB khi hàng đợi có đủ số bản ghi này...
+HISTORY_FLUSH_INTERVAL = 2.0 # ...hoặc sau số giây này kể từ bản ghi đầu tiên đang chờ
+HISTORY_QUEUE_SIZE = 1000
+HISTORY_SPILL_PATH = 'data/search_history_spill.jsonl' # Nơi lưu tạm bản ghi khi DB không truy cập được
+
+# --- CẤU HÌNH CACHE KẾT QUẢ THEO NGỮ NGHĨA ---
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_SIMILARITY = 0.97 # Ngưỡng cosine giữa hai query đã làm rõ để dùng lại kết quả
+RESULT_CACHE_TTL = 3600 # Thời gian sống (giây) của một kết quả trong cache
+RESULT_CACHE_MAX_ENTRIES = 500
+
+# --- CẤU HÌNH CACHE PHẢN HỒI LLM (TRÊN ĐĨA) ---
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = 'data/llm_cache.sqlite3'
+LLM_CACHE_TTL = 7 * 24 * 3600 # Thời gian sống (giây) của một phản hồi đã lưu
+LLM_CACHE_MAX_ENTRIES = 20000 # Vượt quá thì loại các mục ít được dùng gần đây nhất
+
+# --- CẤU HÌNH KHỞI ĐỘNG ---
+# 'lazy': khởi tạo các thành phần song song ở nền, trang đăng nhập hiện ngay và chỉ chờ khi cần dùng
+# 'eager': chờ mọi thành phần khởi tạo xong trước khi hiển thị giao diện
+STARTUP_MODE = 'lazy'
+
+# --- CẤU HÌNH BACKEND EMBEDDING ---
+EMBEDDING_BACKEND = 'torch' # 'torch' (fp32 gốc), 'int8' (lượng tử hóa động, CPU) hoặc 'onnx' (onnxruntime)
+EMBEDDING_ONNX_FILE = None # File ONNX trong repo model, ví dụ 'onnx/model_qint8_avx512_vnni.onnx'; None: dùng 'onnx/model.onnx'
+EMBEDDING_NUM_THREADS = None # Số luồng CPU cho backend int8 (None: mặc định của PyTorch)
+EMBEDDING_PARITY_MIN_COSINE = 0.99 # Ngưỡng cosine nhỏ nhất với fp32 để coi backend là tương đương
+
+# --- CẤU HÌNH TRACING ---
+TRACING_ENABLED = True # Ghi span của mỗi lần tìm kiếm ra file (số liệu trong bộ nhớ luôn được thu thập)
+TRACE_LOG_PATH = 'data/traces.jsonl' # Mỗi dòng là một span (JSON) gắn với search_id
+TRACE_LOG_MAX_BYTES = 50 * 1024 * 1024 # Vượt kích thước này thì xoay vòng file trace (None: không giới hạn)
+TRACE_LOG_BACKUPS = 3 # Số file trace cũ giữ lại (traces.jsonl.1, .2, ...)
+TRACE_METRICS_PATH = 'data/metrics.prom' # Counter dạng Prometheus (textfile collector)
+
+# --- CẤU HÌNH DỊCH VỤ TÌM KIẾM (API HTTP VÀ BATCH) ---
+SEARCH_MAX_CONCURRENT = 4 # Số lần tìm kiếm chạy đồng thời trong một process
+SEARCH_QUEUE_TIMEOUT = 30 # Thời gian (giây) API chờ đến lượt trước khi trả về 503
+SEARCH_API_HOST = '127.0.0.1'
+SEARCH_API_PORT = 8080
+SEARCH_API_KEY = os.getenv("SEARCH_API_KEY") # Nếu đặt, mọi request /search phải gửi header X-API-Key
+SEARCH_API_MAX_BODY_BYTES = 1_000_000
@@ -1,17 +1,28 @@
 # db_manager.py
 import mysql.connector
 import config
+import db_pool
 from passlib.context import CryptContext # <-- Thêm thư viện
 import json # <--- THÊM DÒNG NÀY
+import threading
+import time
+from datetime import datetime, timezone
+from history_writer import SearchHistoryWriter
+import result_codec
+import tracing
 
 # --- Cấu hình băm mật khẩu ---
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+@tracing.traced('db.get_db_connection')
 def get_db_connection():
-    """Tạo và trả về một kết nối database."""
+    """Lấy một kết nối database từ connection pool (conn.close() sẽ trả kết nối về pool)."""
     try:
-        conn = mysql.connector.connect(**config.DB_CONFIG)
+        conn = db_pool.get_connection()
         return conn
+    except mysql.connector.errors.PoolError as err:
+        print(f"🔥 {err} Thao tác DB bị bỏ qua; hãy tăng DB_POOL_SIZE nếu lỗi lặp lại.")
+        return None
     except mysql.connector.Error as err:
         print(f"Lỗi kết nối DB: {err}")
         return None
@@ -24,6 +35,7 @@ def hash_password(password):
     """Băm mật khẩu."""
     return pwd_context.hash(password)
 
+@tracing.traced('db.create_user')
 def create_user(email: str, password: str):
     """Tạo người dùng mới với mật khẩu đã được băm."""
     conn = get_db_connection()
@@ -57,6 +69,7 @@ def create_user(email: str, password: str):
         cursor.close()
         conn.close()
 
+@tracing.traced('db.authenticate_user')
 def authenticate_user(email: str, password: str):
     """Xác thực người dùng bằng email và mật khẩu."""
     conn = get_db_connection()
@@ -84,31 +97,114 @@ def authenticate_user(email: str, password: str):
 
 
 # --- CẬP NHẬT HÀM GHI LOG ---
-def log_search_history(user_id: int, query: str, enhanced_query: str, intent: str, results_data: list):
-    """Ghi lại lịch sử và KẾT QUẢ tìm kiếm vào DB."""
+_history_writer = None
+_history_writer_lock = threading.Lock()
+
+def get_history_writer():
+    """Luồng ghi lịch sử dùng chung của process (khởi động khi cần lần đầu)."""
+    global _history_writer
+    with _history_writer_lock:
+        if _history_writer is None:
+            _history_writer = SearchHistoryWriter(insert_search_history_rows).start()
+        return _history_writer
+
+_history_schema_ready = False
+
+def ensure_compact_history_schema(conn):
+    """
+    Đảm bảo bảng search_history có cột search_results_compact (LONGBLOB) và cột JSON cũ
+    search_results cho phép NULL. Chỉ kiểm tra một lần mỗi process; được gọi lúc khởi động
+    (prepare_history_schema) và trong migrate_search_history.py, không chạy khi xử lý request.
+    """
+    global _history_schema_ready
+    if _history_schema_ready:
+        return
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE FROM INFORMATION_SCHEMA.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'search_history'"
+        )
+        columns = {row['COLUMN_NAME']: row for row in cursor.fetchall()}
+        if 'search_results_compact' not in columns:
+            cursor.execute("ALTER TABLE search_history ADD COLUMN search_results_compact LONGBLOB NULL")
+        legacy_column = columns.get('search_results')
+        if legacy_column and legacy_column['IS_NULLABLE'] == 'NO':
+            cursor.execute(f"ALTER TABLE search_history MODIFY COLUMN search_results {legacy_column['COLUMN_TYPE']} NULL")
+        conn.commit()
+        _history_schema_ready = True
+    finally:
+        cursor.close()
+
+def prepare_history_schema():
+    """Kiểm tra/cập nhật schema search_history một lần lúc khởi động. Trả về True nếu schema đã sẵn sàng."""
     conn = get_db_connection()
     if not conn:
-        return
-    
-    # Chuyển đổi kết quả Python dict/list thành chuỗi JSON
-    results_json = json.dumps(results_data)
-        
-    cursor = conn.cursor()
+        return False
+    try:
+        ensure_compact_history_schema(conn)
+        return True
+    except mysql.connector.Error as err:
+        print(f"⚠️ Không cập nhật được schema search_history: {err}. Hãy chạy migrate_search_history.py.")
+        return False
+    finally:
+        conn.close()
+
+def _epoch_seconds(search_timestamp):
+    """Thời điểm tìm kiếm dạng epoch; bản ghi lưu tạm từ phiên bản cũ dùng chuỗi UTC 'YYYY-mm-dd HH:MM:SS'."""
+    if isinstance(search_timestamp, str):
+        return datetime.strptime(search_timestamp, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+    return search_timestamp
+
+@tracing.traced('db.insert_search_history_rows')
+def insert_search_history_rows(records: list):
+    """Ghi nhiều bản ghi lịch sử bằng một câu INSERT nhiều dòng. Trả về True nếu thành công."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cursor = None
     try:
-        query_data = (user_id, query, enhanced_query, intent, results_json)
+        cursor = conn.cursor()
+        # FROM_UNIXTIME đổi thời điểm sang múi giờ của phiên DB, giống DEFAULT CURRENT_TIMESTAMP
+        # của các bản ghi cũ, nên thứ tự và giờ hiển thị nhất quán
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, FROM_UNIXTIME(%s))"] * len(records))
+        params = []
+        for record in records:
+            # Nén kết quả (chỉ id, điểm và parsed_scores) ở luồng nền, không chặn UI
+            results_blob = result_codec.encode_results(record['results_data'])
+            params.extend([
+                record['user_id'], record['query'], record['enhanced_query'],
+                record['intent'], results_blob, _epoch_seconds(record['search_timestamp'])
+            ])
         cursor.execute(
-            "INSERT INTO search_history (user_id, query_text, enhanced_query, intent, search_results) VALUES (%s, %s, %s, %s, %s)",
-            query_data
+            "INSERT INTO search_history (user_id, query_text, enhanced_query, intent, search_results_compact, search_timestamp) "
+            f"VALUES {placeholders}",
+            params
         )
         conn.commit()
-        print(f"Đã ghi log tìm kiếm và kết quả cho user_id: {user_id}")
+        print(f"Đã ghi {len(records)} bản ghi lịch sử tìm kiếm.")
+        return True
     except mysql.connector.Error as err:
         print(f"Lỗi DB khi ghi log: {err}")
+        return False
     finally:
-        cursor.close()
+        if cursor:
+            cursor.close()
         conn.close()
 
+@tracing.traced('db.log_search_history')
+def log_search_history(user_id: int, query: str, enhanced_query: str, intent: str, results_data: list):
+    """Ghi lại lịch sử và KẾT QUẢ tìm kiếm (bất đồng bộ, qua luồng ghi nền)."""
+    get_history_writer().submit({
+        "user_id": user_id, "query": query, "enhanced_query": enhanced_query,
+        "intent": intent, "results_data": results_data,
+        # Lưu thời điểm tìm kiếm thực tế (epoch), vì bản ghi có thể được ghi xuống DB muộn hơn
+        "search_timestamp": time.time(),
+    })
+
 # --- THÊM HÀM MỚI ĐỂ LẤY LỊCH SỬ ---
+@tracing.traced('db.get_search_history')
 def get_search_history(user_id: int):
     """Lấy danh sách lịch sử tìm kiếm của người dùng."""
     conn = get_db_connection()
@@ -131,9 +227,45 @@ def get_search_history(user_id: int):
         cursor.close()
         conn.close()
 
+@tracing.traced('db.fetch_resume_records')
+def fetch_resume_records(ids: list, columns: list = None):
+    """Tải dữ liệu các hồ sơ theo id bằng truy vấn WHERE id IN (...). Trả về dict {id: dict}."""
+    columns = columns or config.RESUME_COLUMNS
+    if not ids:
+        return {}
+    conn = get_db_connection()
+    if not conn:
+        return {}
+
+    cursor = conn.cursor(dictionary=True)
+    records = {}
+    try:
+        for i in range(0, len(ids), 1000):
+            chunk = [str(resume_id) for resume_id in ids[i:i + 1000]]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"SELECT {', '.join(columns)} FROM {config.TABLE_NAME} WHERE id IN ({placeholders})",
+                chunk
+            )
+            for row in cursor.fetchall():
+                row['id'] = str(row['id'])
+                records[row['id']] = row
+        return records
+    except mysql.connector.Error as err:
+        print(f"Lỗi DB khi tải hồ sơ: {err}")
+        return records
+    finally:
+        cursor.close()
+        conn.close()
+
 # --- THÊM HÀM MỚI ĐỂ LẤY LẠI KẾT QUẢ CŨ ---
-def get_past_search_result(search_id: int, user_id: int):
-    """Lấy kết quả đã lưu của một lần tìm kiếm trong quá khứ."""
+@tracing.traced('db.get_past_search_result')
+def get_past_search_result(search_id: int, user_id: int, resume_lookup=None):
+    """
+    Lấy kết quả đã lưu của một lần tìm kiếm trong quá khứ.
+    Với bản ghi định dạng gọn, nội dung CV được tải lại qua `resume_lookup`
+    (mặc định là fetch_resume_records).
+    """
     conn = get_db_connection()
     if not conn:
         return None
@@ -142,17 +274,26 @@ def get_past_search_result(search_id: int, user_id: int):
     try:
         # Thêm user_id để đảm bảo người dùng chỉ xem được lịch sử của chính mình
         cursor.execute(
-            "SELECT search_results FROM search_history WHERE id = %s AND user_id = %s",
+            "SELECT search_results, search_results_compact FROM search_history WHERE id = %s AND user_id = %s",
             (search_id, user_id)
         )
         result = cursor.fetchone()
-        if result and result['search_results']:
-            # Chuyển chuỗi JSON ngược lại thành Python dict/list
-            return json.loads(result['search_results'])
-        return None
-    except (mysql.connector.Error, json.JSONDecodeError) as err:
+    except mysql.connector.Error as err:
         print(f"Lỗi khi lấy kết quả cũ: {err}")
         return None
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        conn.close()  # Trả kết nối trước khi tra cứu hồ sơ
+
+    if not result:
+        return None
+    try:
+        if result['search_results_compact']:
+            groups = result_codec.decode_results(result['search_results_compact'])
+            return result_codec.rehydrate_results(groups, resume_lookup or fetch_resume_records)
+        if result['search_results']:
+            # Bản ghi cũ chưa chuyển đổi: chuỗi JSON đầy đủ
+            return json.loads(result['search_results'])
+    except (ValueError, RuntimeError) as err:
+        print(f"Lỗi khi giải mã kết quả cũ: {err}")
+    return None
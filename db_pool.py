@@ -0,0 +1,178 @@
+# db_pool.py
+import time
+import threading
+from collections import deque
+import mysql.connector
+import config
+
+# Mỗi lần mysql.connector.connect tới TiDB Cloud phải bắt tay TLS đầy đủ (hàng trăm ms).
+# Pool giữ lại các kết nối đã mở để dùng chung giữa các lời gọi trong cùng process.
+
+class PooledConnection:
+    """Bọc một kết nối MySQL; close() trả kết nối về pool thay vì đóng thật."""
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._raw_conn = raw_conn
+
+    def close(self):
+        if self._raw_conn is not None:
+            raw_conn, self._raw_conn = self._raw_conn, None
+            self._pool._release(raw_conn)
+
+    def __getattr__(self, name):
+        if self._raw_conn is None:
+            raise mysql.connector.errors.OperationalError("Kết nối đã được trả về pool.")
+        return getattr(self._raw_conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class ConnectionPool:
+    """
+    Pool kết nối có giới hạn kích thước, kiểm tra sức khỏe kết nối rảnh lâu,
+    tái tạo kết nối quá hạn và thống kê thời gian chờ.
+    """
+
+    def __init__(self, size=None, wait_timeout=None, ping_after=None, max_idle=None,
+                 max_lifetime=None, connect=None):
+        self.size = size or config.DB_POOL_SIZE or default_pool_size()
+        self.wait_timeout = wait_timeout if wait_timeout is not None else config.DB_POOL_WAIT_TIMEOUT
+        self.ping_after = ping_after if ping_after is not None else config.DB_POOL_PING_AFTER
+        self.max_idle = max_idle if max_idle is not None else config.DB_POOL_MAX_IDLE
+        self.max_lifetime = max_lifetime if max_lifetime is not None else config.DB_POOL_MAX_LIFETIME
+        self._connect = connect or (lambda: mysql.connector.connect(**config.DB_CONFIG))
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._idle = deque()  # (raw_conn, thời điểm tạo, thời điểm trả về pool)
+        self._created_at = {}
+        self._stats = {
+            'created': 0, 'reused': 0, 'recycled': 0, 'broken': 0,
+            'wait_count': 0, 'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0, 'wait_timeouts': 0,
+        }
+        self._in_use = 0
+
+    def get_connection(self, timeout=None):
+        """Lấy một kết nối từ pool, chờ tối đa `timeout` giây nếu pool đang dùng hết."""
+        timeout = self.wait_timeout if timeout is None else timeout
+        wait_started = time.time()
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self._stats['wait_timeouts'] += 1
+            raise mysql.connector.errors.PoolError(
+                f"Hết kết nối trong pool (size={self.size}) sau {timeout} giây chờ."
+            )
+        waited = time.time() - wait_started
+        with self._lock:
+            self._stats['wait_count'] += 1
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+            self._in_use += 1
+
+        try:
+            return PooledConnection(self, self._checkout())
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+            raise
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                raw_conn = self._connect()
+                with self._lock:
+                    self._stats['created'] += 1
+                    self._created_at[id(raw_conn)] = time.time()
+                return raw_conn
+
+            raw_conn, created_at, released_at = entry
+            now = time.time()
+            if now - released_at > self.max_idle or now - created_at > self.max_lifetime:
+                self._discard(raw_conn, 'recycled')
+                continue
+            if now - released_at > self.ping_after and not raw_conn.is_connected():
+                self._discard(raw_conn, 'broken')
+                continue
+            with self._lock:
+                self._stats['reused'] += 1
+            return raw_conn
+
+    def _release(self, raw_conn):
+        try:
+            # Kết thúc giao dịch dang dở để lần dùng sau không đọc phải snapshot cũ
+            if raw_conn.in_transaction:
+                raw_conn.rollback()
+            with self._lock:
+                created_at = self._created_at.get(id(raw_conn), time.time())
+                self._idle.append((raw_conn, created_at, time.time()))
+        except mysql.connector.Error:
+            self._discard(raw_conn, 'broken')
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def _discard(self, raw_conn, reason):
+        with self._lock:
+            self._stats[reason] += 1
+            self._created_at.pop(id(raw_conn), None)
+        try:
+            raw_conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        """Thống kê hiện tại của pool."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'size': self.size, 'in_use': self._in_use, 'idle': len(self._idle)})
+        stats['wait_seconds_avg'] = stats['wait_seconds_total'] / stats['wait_count'] if stats['wait_count'] else 0.0
+        return stats
+
+    def close_all(self):
+        """Đóng mọi kết nối đang rảnh (kết nối đang được dùng sẽ được đóng khi trả về)."""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for raw_conn, _, _ in idle:
+            self._discard(raw_conn, 'recycled')
+
+def default_pool_size():
+    """
+    Số kết nối đủ cho mọi luồng có thể dùng DB cùng lúc trong một process: các luồng đánh giá
+    (ghi cache điểm), các lần tìm kiếm đồng thời, luồng ghi lịch sử và luồng chính.
+    """
+    return config.EVALUATION_MAX_WORKERS + config.SEARCH_MAX_CONCURRENT + 2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def ensure_pool_size(min_size):
+    """
+    Đảm bảo pool dùng chung có ít nhất `min_size` kết nối; gọi trước khi dùng pool khi số luồng
+    được chọn lúc chạy (vd. --workers). Pool đã tạo không đổi được kích thước nên chỉ cảnh báo.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(size=max(min_size, config.DB_POOL_SIZE or default_pool_size()))
+        elif _pool.size < min_size:
+            print(f"⚠️ Pool kết nối đã tạo với size={_pool.size}, ít hơn {min_size} luồng có thể dùng DB cùng lúc.")
+        return _pool
+
+def get_pool():
+    """Pool dùng chung của process (tạo khi cần lần đầu)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+def get_connection(timeout=None):
+    """Lấy một kết nối từ pool dùng chung. Gọi conn.close() để trả kết nối về pool."""
+    return get_pool().get_connection(timeout=timeout)
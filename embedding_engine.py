@@ -0,0 +1,180 @@
+# embedding_engine.py
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import config
+
+# Các backend embedding cho cùng một model (config.SENTENCE_MODEL_NAME):
+#   'torch' : SentenceTransformer fp32 gốc (tự dùng GPU nếu có)
+#   'int8'  : lượng tử hóa động int8 các lớp Linear (torch.quantization.quantize_dynamic), chạy trên CPU
+#   'onnx'  : model xuất sang ONNX, chạy bằng onnxruntime (cần sentence-transformers>=3.2, optimum, onnxruntime)
+# Vector của mọi backend đều dùng chung index; dùng `python embedding_engine.py --backend ...`
+# để kiểm tra độ tương đồng cosine với fp32 trước khi chuyển backend.
+BACKENDS = ('torch', 'int8', 'onnx')
+
+def load_embedding_model(backend=None, device=None):
+    """Tải model embedding theo backend. Đối tượng trả về có `.encode(texts, ...)` như SentenceTransformer."""
+    from sentence_transformers import SentenceTransformer
+
+    backend = backend or config.EMBEDDING_BACKEND
+    if backend == 'torch':
+        if device is None:
+            import torch
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        return SentenceTransformer(config.SENTENCE_MODEL_NAME, device=device)
+    if backend == 'int8':
+        import torch
+        if config.EMBEDDING_NUM_THREADS:
+            torch.set_num_threads(config.EMBEDDING_NUM_THREADS)
+        model = SentenceTransformer(config.SENTENCE_MODEL_NAME, device='cpu')
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == 'onnx':
+        model_kwargs = {"file_name": config.EMBEDDING_ONNX_FILE} if config.EMBEDDING_ONNX_FILE else None
+        return SentenceTransformer(config.SENTENCE_MODEL_NAME, device='cpu', backend='onnx', model_kwargs=model_kwargs)
+    raise ValueError(f"EMBEDDING_BACKEND không hợp lệ: '{backend}' (hợp lệ: {', '.join(BACKENDS)})")
+
+def _encode_timed(model, texts, batch_size):
+    start = time.time()
+    vectors = np.asarray(model.encode(texts, batch_size=batch_size, show_progress_bar=False), dtype=np.float32)
+    return vectors, time.time() - start
+
+def parity_check(texts, backend, batch_size=32, reference_model=None, candidate_model=None):
+    """
+    So sánh embedding của backend với fp32 (torch, CPU) trên cùng các văn bản.
+    Trả về dict gồm cosine trung bình/nhỏ nhất/phân vị 1%, tốc độ của hai bên và kết quả đạt/không đạt
+    so với ngưỡng EMBEDDING_PARITY_MIN_COSINE.
+    """
+    reference_model = reference_model or load_embedding_model('torch', device='cpu')
+    candidate_model = candidate_model or load_embedding_model(backend)
+    reference, reference_seconds = _encode_timed(reference_model, texts, batch_size)
+    candidate, candidate_seconds = _encode_timed(candidate_model, texts, batch_size)
+
+    reference /= np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    candidate /= np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    cosines = np.sum(reference * candidate, axis=1)
+    return {
+        "backend": backend, "samples": len(texts),
+        "cosine_mean": float(cosines.mean()), "cosine_min": float(cosines.min()),
+        "cosine_p01": float(np.percentile(cosines, 1)),
+        "fp32_docs_per_second": len(texts) / reference_seconds if reference_seconds else 0.0,
+        "backend_docs_per_second": len(texts) / candidate_seconds if candidate_seconds else 0.0,
+        "passed": bool(cosines.min() >= config.EMBEDDING_PARITY_MIN_COSINE),
+    }
+
+# --- ENCODING SONG SONG NHIỀU PROCESS (DÙNG CHO SYNC) ---
+_worker_model = None
+
+def _init_encode_worker(backend, num_threads):
+    global _worker_model
+    import torch
+    _worker_model = load_embedding_model(backend, device='cpu')
+    torch.set_num_threads(num_threads)  # Chia đều số core cho các process, tránh tranh chấp luồng
+
+def _encode_in_worker(texts, batch_size):
+    start = time.time()
+    vectors = np.asarray(_worker_model.encode(texts, batch_size=batch_size, show_progress_bar=False), dtype=np.float32)
+    return os.getpid(), vectors, time.time() - start
+
+class ParallelEncoder:
+    """
+    Encode nhiều văn bản trên nhiều process CPU. Văn bản được sắp theo độ dài (như cách
+    sentence-transformers ước lượng độ dài) rồi chia thành các phần có độ dài gần nhau,
+    nên mỗi batch ít phải padding; kết quả được trả về theo đúng thứ tự đầu vào.
+    Với 1 process (hoặc khi có GPU), model chạy ngay trong process hiện tại.
+    """
+
+    def __init__(self, processes=None, backend=None, batch_size=None, chunk_size=None):
+        self.backend = backend or config.EMBEDDING_BACKEND
+        self.batch_size = batch_size or config.SYNC_ENCODE_BATCH_SIZE
+        self.chunk_size = chunk_size or config.SYNC_ENCODE_CHUNK_SIZE
+        self.processes = processes or config.SYNC_ENCODE_PROCESSES or os.cpu_count() or 1
+        self._stats = {}  # pid -> [số văn bản, số giây encode]
+        self._model = None
+        self._executor = None
+        if self.processes > 1 and not self._gpu_available():
+            threads_per_worker = max(1, (os.cpu_count() or 1) // self.processes)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_encode_worker, initargs=(self.backend, threads_per_worker)
+            )
+        else:
+            self.processes = 1
+            self._model = load_embedding_model(self.backend)
+
+    def _gpu_available(self):
+        if self.backend != 'torch':
+            return False
+        import torch
+        return torch.cuda.is_available()
+
+    def encode(self, texts):
+        """Trả về mảng (len(texts), dimension) theo thứ tự của `texts`."""
+        if not texts:
+            return np.empty((0, config.EMBEDDING_DIMENSION), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        chunks = [order[i:i + self.chunk_size] for i in range(0, len(order), self.chunk_size)]
+        if self._executor is not None:
+            results = self._executor.map(
+                _encode_in_worker, [[texts[i] for i in chunk] for chunk in chunks], [self.batch_size] * len(chunks)
+            )
+        else:
+            results = (
+                (os.getpid(),) + _encode_timed(self._model, [texts[i] for i in chunk], self.batch_size)
+                for chunk in chunks
+            )
+
+        embeddings = None
+        for chunk, (pid, vectors, seconds) in zip(chunks, results):
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            embeddings[chunk] = vectors  # Trả về đúng vị trí ban đầu
+            stats = self._stats.setdefault(pid, [0, 0.0])
+            stats[0] += len(chunk)
+            stats[1] += seconds
+        return embeddings
+
+    def worker_summary(self):
+        """Mô tả thông lượng (docs/s) của từng process encode."""
+        return " | ".join(
+            f"worker {pid}: {docs} CV, {docs / seconds if seconds else 0.0:.1f} docs/s"
+            for pid, (docs, seconds) in sorted(self._stats.items())
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+def load_sample_texts(limit):
+    """Lấy `limit` văn bản CV (full_text) từ TiDB để kiểm tra."""
+    import db_pool
+
+    conn = db_pool.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"SELECT full_text FROM {config.TABLE_NAME} WHERE full_text IS NOT NULL ORDER BY id LIMIT %s", (limit,)
+        )
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kiểm tra độ tương đồng giữa backend embedding và fp32.")
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != 'torch'], default='int8')
+    parser.add_argument("--samples", type=int, default=200, help="Số CV lấy từ TiDB để so sánh.")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    sample_texts = load_sample_texts(args.samples)
+    report = parity_check(sample_texts, args.backend, batch_size=args.batch_size)
+    print(f"--- KIỂM TRA BACKEND '{report['backend']}' TRÊN {report['samples']} CV ---")
+    print(f"   -> Cosine với fp32: trung bình {report['cosine_mean']:.5f}, nhỏ nhất {report['cosine_min']:.5f}, "
+          f"phân vị 1% {report['cosine_p01']:.5f}")
+    print(f"   -> Tốc độ: fp32 {report['fp32_docs_per_second']:.1f} CV/s, "
+          f"{report['backend']} {report['backend_docs_per_second']:.1f} CV/s")
+    status = "ĐẠT" if report['passed'] else "KHÔNG ĐẠT"
+    print(f"   -> {status} (ngưỡng cosine nhỏ nhất {config.EMBEDDING_PARITY_MIN_COSINE})")
@@ -0,0 +1,136 @@
+# history_writer.py
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import config
+
+class SearchHistoryWriter:
+    """
+    Ghi lịch sử tìm kiếm ở luồng nền: bản ghi được đưa vào hàng đợi và ghi xuống DB
+    theo lô (insert nhiều dòng) khi đủ số lượng hoặc hết thời gian chờ.
+    Nếu DB không truy cập được, bản ghi được lưu tạm ra file và ghi lại ở lần sau.
+    """
+
+    def __init__(self, insert_rows, flush_size=None, flush_interval=None, queue_size=None, spill_path=None):
+        self._insert_rows = insert_rows  # Hàm nhận list bản ghi, trả về True nếu ghi thành công
+        self.flush_size = flush_size or config.HISTORY_FLUSH_SIZE
+        self.flush_interval = flush_interval or config.HISTORY_FLUSH_INTERVAL
+        self.spill_path = spill_path or config.HISTORY_SPILL_PATH
+        self._queue = queue.Queue(maxsize=queue_size or config.HISTORY_QUEUE_SIZE)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="search-history-writer", daemon=True)
+        self._spill_lock = threading.Lock()
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.shutdown)
+        return self
+
+    def submit(self, record: dict):
+        """Đưa một bản ghi vào hàng đợi (không chặn). Hàng đợi đầy thì lưu tạm ra file."""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            print("⚠️ Hàng đợi ghi lịch sử đã đầy, lưu tạm bản ghi ra file.")
+            self._spill([record])
+
+    def shutdown(self, timeout=10):
+        """Ghi nốt các bản ghi còn trong hàng đợi rồi dừng luồng nền."""
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+    def _run(self):
+        pending = []
+        first_pending_at = None
+        while True:
+            try:
+                timeout = self.flush_interval if first_pending_at is None else \
+                    max(0.0, first_pending_at + self.flush_interval - time.time())
+                pending.append(self._queue.get(timeout=timeout))
+                if first_pending_at is None:
+                    first_pending_at = time.time()
+            except queue.Empty:
+                pass
+
+            stopping = self._stop_event.is_set()
+            if stopping:
+                # Lấy nốt mọi bản ghi còn lại trước khi dừng
+                while True:
+                    try:
+                        pending.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+            due = first_pending_at is not None and time.time() - first_pending_at >= self.flush_interval
+            if pending and (len(pending) >= self.flush_size or due or stopping):
+                # Lỗi ngoài dự kiến (vd. không ghi được file lưu tạm) không được làm chết luồng nền
+                try:
+                    self._flush(pending)
+                except Exception as e:
+                    print(f"🔥 Lỗi khi ghi {len(pending)} bản ghi lịch sử, bỏ qua lô này: {e}")
+                pending, first_pending_at = [], None
+            if stopping:
+                return
+
+    def _flush(self, records):
+        if not self._write(records):
+            self._spill(records)
+            return
+        self._replay_spilled()
+
+    def _write(self, records):
+        try:
+            return bool(self._insert_rows(records))
+        except Exception as e:
+            print(f"Lỗi khi ghi lịch sử tìm kiếm theo lô: {e}")
+            return False
+
+    def _spill(self, records):
+        with self._spill_lock:
+            directory = os.path.dirname(self.spill_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"⚠️ Đã lưu tạm {len(records)} bản ghi lịch sử vào '{self.spill_path}'.")
+
+    def _replay_spilled(self):
+        """Ghi lại các bản ghi đã lưu tạm (chỉ gọi khi vừa ghi DB thành công)."""
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return
+            records, corrupt_lines = [], []
+            with open(self.spill_path, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        corrupt_lines.append(line if line.endswith("\n") else line + "\n")
+            if corrupt_lines:
+                # Dòng hỏng (vd. ghi dở khi process bị dừng) được chuyển sang file riêng để không chặn các dòng còn lại
+                with open(self.spill_path + ".corrupt", 'a', encoding='utf-8') as f:
+                    f.writelines(corrupt_lines)
+                print(f"⚠️ Bỏ qua {len(corrupt_lines)} dòng lỗi trong file lưu tạm, đã chuyển sang '{self.spill_path}.corrupt'.")
+            remaining = []
+            for i in range(0, len(records), self.flush_size):
+                chunk = records[i:i + self.flush_size]
+                if not self._write(chunk):
+                    remaining = records[i:]
+                    break
+            if remaining:
+                with open(self.spill_path, 'w', encoding='utf-8') as f:
+                    for record in remaining:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            else:
+                os.remove(self.spill_path)
+        if records:
+            print(f"Đã ghi lại {len(records) - len(remaining)} bản ghi lịch sử từ file lưu tạm.")
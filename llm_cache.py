@@ -0,0 +1,139 @@
+# llm_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+import config
+
+class CachedResponse:
+    """Response lấy từ cache, có thuộc tính `.text` giống response của Gemini."""
+
+    def __init__(self, text):
+        self.text = text
+
+class LLMResponseCache:
+    """
+    Cache phản hồi của LLM lưu trên đĩa (SQLite), dùng chung giữa các lần khởi động lại.
+    Khóa gồm tên model, phiên bản prompt template và hash của prompt đã format.
+    Mục hết hạn theo TTL; khi vượt số mục tối đa thì loại các mục ít được dùng gần đây nhất.
+    """
+
+    _EVICT_EVERY = 100 # Kiểm tra kích thước sau mỗi số lần ghi này
+
+    def __init__(self, path=None, ttl=None, max_entries=None):
+        self.path = path or config.LLM_CACHE_PATH
+        self.ttl = ttl or config.LLM_CACHE_TTL
+        self.max_entries = max_entries or config.LLM_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                cache_key TEXT PRIMARY KEY,
+                model_name TEXT NOT NULL,
+                template_version TEXT NOT NULL,
+                response_text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access ON llm_responses (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name, template_version, prompt):
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        return f"{model_name}:{template_version}:{prompt_hash}"
+
+    def get(self, model_name, template_version, prompt):
+        """Trả về CachedResponse nếu có và chưa hết hạn, ngược lại None."""
+        key = self.make_key(model_name, template_version, prompt)
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT response_text, created_at FROM llm_responses WHERE cache_key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] < self.ttl:
+                    self._conn.execute("UPDATE llm_responses SET last_access = ? WHERE cache_key = ?", (now, key))
+                    self._conn.commit()
+                    self.hits += 1
+                    return CachedResponse(row[0])
+            except sqlite3.Error as e:
+                print(f"⚠️ Lỗi khi đọc cache phản hồi LLM: {e}")
+            self.misses += 1
+            return None
+
+    def put(self, model_name, template_version, prompt, response_text):
+        key = self.make_key(model_name, template_version, prompt)
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_responses "
+                    "(cache_key, model_name, template_version, response_text, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model_name, template_version, response_text, now, now)
+                )
+                self._writes += 1
+                if self._writes % self._EVICT_EVERY == 0:
+                    self._evict(now)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Lỗi khi ghi cache phản hồi LLM: {e}")
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM llm_responses WHERE cache_key IN ("
+            "SELECT cache_key FROM llm_responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "entries": entries,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses")
+            self._conn.commit()
+            self.hits = self.misses = 0
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    """Cache phản hồi LLM dùng chung của process (None nếu đã tắt trong config)."""
+    global _llm_cache
+    if not config.LLM_CACHE_ENABLED:
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache()
+        return _llm_cache
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quản lý cache phản hồi LLM trên đĩa.")
+    parser.add_argument("--clear", action="store_true", help="Xóa toàn bộ cache.")
+    args = parser.parse_args()
+    cache = LLMResponseCache()
+    if args.clear:
+        cache.clear()
+        print(f"Đã xóa cache phản hồi LLM tại '{cache.path}'.")
+    print(f"Số mục trong cache '{cache.path}': {cache.stats()['entries']}")
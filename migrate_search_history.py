@@ -0,0 +1,76 @@
+# migrate_search_history.py
+import json
+import argparse
+import mysql.connector
+import db_manager
+import result_codec
+
+def migrate_search_history(batch_size=100, dry_run=False):
+    """
+    Chuyển các bản ghi search_history cũ (JSON đầy đủ trong cột search_results) sang
+    định dạng gọn trong cột search_results_compact, sau đó xóa JSON cũ.
+    Có thể chạy lại nhiều lần: chỉ xử lý các bản ghi chưa được chuyển đổi.
+    """
+    print("--- BẮT ĐẦU CHUYỂN ĐỔI LỊCH SỬ TÌM KIẾM SANG ĐỊNH DẠNG GỌN ---")
+    codec_name = "msgpack + zstd" if result_codec.msgpack is not None else "json + zlib"
+    print(f"   -> Codec: {codec_name}")
+
+    conn = db_manager.get_db_connection()
+    if not conn:
+        return
+    db_manager.ensure_compact_history_schema(conn)
+    cursor = conn.cursor(dictionary=True)
+
+    migrated, failed, bytes_before, bytes_after = 0, 0, 0, 0
+    last_id = 0
+    try:
+        while True:
+            cursor.execute(
+                "SELECT id, search_results FROM search_history "
+                "WHERE id > %s AND search_results IS NOT NULL AND search_results_compact IS NULL "
+                "ORDER BY id LIMIT %s",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+
+            updates = []
+            for row in rows:
+                raw = row['search_results']
+                raw_text = raw.decode('utf-8') if isinstance(raw, (bytes, bytearray)) else str(raw)
+                try:
+                    blob = result_codec.encode_results(json.loads(raw_text))
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"⚠️ Bỏ qua bản ghi {row['id']}: không đọc được kết quả cũ ({e}).")
+                    failed += 1
+                    continue
+                bytes_before += len(raw_text.encode('utf-8'))
+                bytes_after += len(blob)
+                updates.append((blob, row['id']))
+
+            if updates and not dry_run:
+                cursor.executemany(
+                    "UPDATE search_history SET search_results_compact = %s, search_results = NULL WHERE id = %s",
+                    updates
+                )
+                conn.commit()
+            migrated += len(updates)
+            print(f"   -> Đã xử lý đến id {last_id} ({migrated} bản ghi).")
+    except mysql.connector.Error as err:
+        print(f"Lỗi DB khi chuyển đổi lịch sử: {err}")
+    finally:
+        cursor.close()
+        conn.close()
+
+    ratio = (bytes_before / bytes_after) if bytes_after else 0
+    print(f"\n--- ✅ {'(DRY-RUN) ' if dry_run else ''}HOÀN TẤT: {migrated} bản ghi, lỗi {failed} ---")
+    print(f"   -> Dung lượng: {bytes_before / 1024:.1f} KB -> {bytes_after / 1024:.1f} KB (nhỏ hơn {ratio:.1f} lần)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chuyển lịch sử tìm kiếm cũ sang định dạng gọn.")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ ước tính dung lượng, không chuyển đổi dữ liệu.")
+    args = parser.parse_args()
+    migrate_search_history(batch_size=args.batch_size, dry_run=args.dry_run)
@@ -0,0 +1,152 @@
+# prescore_resumes.py
+import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait
+import pandas as pd
+import google.generativeai as genai
+from tqdm.auto import tqdm
+import config
+import db_pool
+import ai_services
+import score_cache
+
+def load_checkpoint(path):
+    """Đọc id cuối cùng đã xử lý xong từ file checkpoint (None nếu chưa có)."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('last_id')
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠️ Không đọc được checkpoint '{path}', bắt đầu lại từ đầu: {e}")
+        return None
+
+def save_checkpoint(path, last_id):
+    """Ghi checkpoint một cách nguyên tử (ghi file tạm rồi đổi tên)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'last_id': last_id}, f)
+    os.replace(tmp_path, path)
+
+def iter_resume_pages(conn, page_size, start_after=None):
+    """Đọc bảng CV theo từng trang bằng keyset pagination trên cột id."""
+    columns = ", ".join(["id"] + ai_services.EVALUATION_COLUMNS)
+    last_id = start_after
+    while True:
+        if last_id is None:
+            query = f"SELECT {columns} FROM {config.TABLE_NAME} ORDER BY id LIMIT %s"
+            params = (page_size,)
+        else:
+            query = f"SELECT {columns} FROM {config.TABLE_NAME} WHERE id > %s ORDER BY id LIMIT %s"
+            params = (last_id, page_size)
+        page = pd.read_sql(query, conn, params=params)
+        if page.empty:
+            return
+        last_id = page['id'].iloc[-1]
+        if hasattr(last_id, 'item'):
+            last_id = last_id.item()  # numpy scalar -> kiểu Python để ghi được JSON
+        yield page, last_id
+
+def select_changed_rows(page):
+    """Chỉ giữ các CV chưa có điểm hoặc đã thay đổi nội dung/phiên bản prompt kể từ lần chấm trước."""
+    candidates, content_hashes = [], {}
+    for row in page.to_dict('records'):
+        text_block = ai_services.build_evaluation_text(row)
+        if not text_block.strip():
+            continue
+        resume_id = str(row['id'])
+        content_hashes[resume_id] = score_cache.compute_content_hash(text_block)
+        candidates.append((resume_id, row))
+    cached = score_cache.get_cached_scores(content_hashes, ai_services.EVALUATION_PROMPT_VERSION)
+    return [(resume_id, row) for resume_id, row in candidates if resume_id not in cached]
+
+def prescore_all_resumes(page_size=None, max_workers=None, checkpoint_path=None, restart=False):
+    """
+    Chấm điểm trước toàn bộ CV trong bảng và lưu điểm parsed_* vào bảng cache điểm.
+    Có thể dừng giữa chừng và chạy lại: job tiếp tục từ checkpoint và bỏ qua CV đã có điểm.
+    """
+    page_size = page_size or config.PRESCORE_PAGE_SIZE
+    max_workers = max_workers or config.PRESCORE_MAX_WORKERS
+    checkpoint_path = checkpoint_path or config.PRESCORE_CHECKPOINT_PATH
+    print("--- BẮT ĐẦU CHẤM ĐIỂM TRƯỚC TOÀN BỘ HỒ SƠ ---")
+
+    print("1. Đang khởi tạo Gemini...")
+    genai.configure(api_key=config.GEMINI_API_KEY)
+    llm_model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
+
+    start_after = None if restart else load_checkpoint(checkpoint_path)
+    if start_after is not None:
+        print(f"   -> Tiếp tục từ checkpoint, sau id = {start_after}.")
+
+    print("2. Đang kết nối TiDB...")
+    # Luồng chính giữ một kết nối để đọc trang và dùng thêm một kết nối để ghi điểm
+    db_pool.ensure_pool_size(max_workers + 2)
+    conn = db_pool.get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {config.TABLE_NAME}")
+    total_rows = cursor.fetchone()[0]
+    cursor.close()
+    print(f"   -> Bảng có {total_rows} hồ sơ.")
+
+    print(f"3. Đang chấm điểm (page_size={page_size}, workers={max_workers})...")
+    scored_count, skipped_count, failed_count = 0, 0, 0
+    progress = tqdm(total=total_rows)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prescore") as executor:
+            for page, last_id in iter_resume_pages(conn, page_size, start_after):
+                changed_rows = select_changed_rows(page)
+                skipped_count += len(page) - len(changed_rows)
+
+                batches = ai_services.build_evaluation_batches([
+                    (resume_id, ai_services.build_evaluation_text(row)) for resume_id, row in changed_rows
+                ])
+                rows_by_id = dict(changed_rows)
+                futures = [
+                    executor.submit(
+                        ai_services.get_batch_quality_scores,
+                        [(resume_id, rows_by_id[resume_id]) for resume_id, _ in batch],
+                        llm_model, config.EVALUATION_CALL_TIMEOUT, use_cache=False, store=False
+                    )
+                    for batch in batches
+                ]
+                wait(futures)
+                page_scores = {}
+                for future in futures:
+                    try:
+                        page_scores.update(future.result())
+                    except Exception as e:
+                        print(f"🔥 Lỗi khi chấm điểm một lô: {e}")
+
+                # Ghi điểm của cả trang một lần; chỉ tính là đã chấm khi ghi DB thành công
+                saved = score_cache.save_scores([
+                    (resume_id, score_cache.compute_content_hash(ai_services.build_evaluation_text(rows_by_id[resume_id])), scores)
+                    for resume_id, scores in page_scores.items()
+                ], ai_services.EVALUATION_PROMPT_VERSION)
+                page_scored = len(page_scores) if saved else 0
+                if not saved:
+                    print(f"🔥 Không ghi được điểm của {len(page_scores)} CV vào cache điểm.")
+                scored_count += page_scored
+                failed_count += len(changed_rows) - page_scored
+
+                # Chỉ ghi checkpoint khi toàn bộ trang đã xử lý xong
+                save_checkpoint(checkpoint_path, last_id)
+                progress.update(len(page))
+    finally:
+        progress.close()
+        conn.close()
+
+    # Chạy xong toàn bộ bảng: xóa checkpoint để lần sau quét lại từ đầu (CV không đổi sẽ được bỏ qua)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print("\n--- ✅ CHẤM ĐIỂM TRƯỚC HOÀN TẤT! ---")
+    print(f"   -> Chấm mới: {scored_count} | Không đổi (bỏ qua): {skipped_count} | Lỗi: {failed_count}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chấm điểm trước toàn bộ hồ sơ bằng Gemini.")
+    parser.add_argument("--page-size", type=int, default=None, help="Số CV đọc mỗi trang.")
+    parser.add_argument("--workers", type=int, default=None, help="Số lô gửi Gemini đồng thời.")
+    parser.add_argument("--checkpoint", default=None, help="Đường dẫn file checkpoint.")
+    parser.add_argument("--restart", action="store_true", help="Bỏ qua checkpoint và quét lại từ đầu.")
+    args = parser.parse_args()
+    prescore_all_resumes(args.page_size, args.workers, args.checkpoint, args.restart)
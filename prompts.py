@@ -40,6 +40,47 @@ Input Text Block:
 Your JSON Output:
 """
 
+# --- A2. Biến thể theo lô: đánh giá nhiều CV trong một lần gọi ---
+PROMPT_HYBRID_EVALUATION_BATCH = """
+### OVERALL CONTEXT
+You are an expert HR data structuring bot. Your task is to analyze several resumes at once. Each resume is a comprehensive block of text containing multiple sections, delimited by its own BEGIN/END markers with a unique resume id. Evaluate every resume independently and extract a full, structured JSON object with all required metrics for each of them.
+
+### EVALUATION PRINCIPLES
+- **Experience:** Calculate the total years of relevant work experience.
+- **Language:** Evaluate the highest non-native language proficiency on a 1-10 scale, considering international standards (IELTS, HSK, etc.).
+- **Skills (Professional/Soft):** Distinguish between 'advanced' and 'basic' skills based on proficiency descriptions for professional skills, and count the total for soft skills.
+- **Certificates, Achievements, Projects, Activities:** Distinguish between "high-impact" (quantifiable, leadership, prestigious awards/certs) and "standard-impact" items.
+- **Education:** Provide a numerical score based on the highest degree obtained (PhD=5, Master=4, Bachelor=3).
+
+### TASK
+Analyze each resume block below. Respond ONLY with a single, valid JSON array containing exactly one object per resume, in the same order as the input. Copy each resume's id into "resume_id" exactly as given. If a section is empty or not applicable, return a default value of 0.
+
+Each object in the array must have this structure:
+{{
+  "resume_id": "<id exactly as given>",
+  "parsed_exp_years": <number>,
+  "parsed_lang_score": <number>,
+  "parsed_education_score": <number>,
+  "parsed_prof_skill_advanced": <number>,
+  "parsed_prof_skill_basic": <number>,
+  "parsed_soft_skill_count": <number>,
+  "parsed_certs_high_value": <number>,
+  "parsed_certs_standard_value": <number>,
+  "parsed_achievements_high_impact": <number>,
+  "parsed_achievements_standard_impact": <number>,
+  "parsed_projects_high_impact": <number>,
+  "parsed_projects_standard_impact": <number>,
+  "parsed_activities_high_impact": <number>,
+  "parsed_activities_standard_impact": <number>
+}}
+
+### YOUR TASK
+Input Resumes:
+{resumes_input}
+
+Your JSON Array Output:
+"""
+
 # --- B. Prompts cho giai đoạn Tìm kiếm (Real-time) ---
 PROMPT_INTENT_CLASSIFIER = """
 ### CONTEXT
@@ -122,4 +163,43 @@ Analyze the user's raw query. Your goal is to do two things:
 ### YOUR TASK
 User's Raw Query: "{user_query}"
 Your Enhanced Search Query Output:
-"""
\ No newline at end of file
+"""
+# --- C. Prompt gộp: hiểu truy vấn trong MỘT lần gọi (thay cho 4 prompt ở mục B khi dùng chế độ 'fused') ---
+PROMPT_QUERY_UNDERSTANDING = """
+### CONTEXT
+You are an AI-powered HR assistant, a world-class CTO and an expert HR Analyst at the same time. You receive a raw recruitment query that may be messy, incomplete, or grammatically incorrect, and you must fully understand it in a single pass.
+
+### TASK
+Perform ALL of the following steps and return the results together in ONE valid JSON object.
+1.  **enhanced_query**: Correct all spelling and grammatical errors, then rephrase the query into a clear, concise English search query that captures the user's true intent. Infer the job title and key skills.
+2.  **intent**: Classify the enhanced query as 'project_description' (a broad goal, product or campaign that needs multiple, diverse roles) or 'specific_role' (a single job title with specific skills, qualifications or years of experience).
+3.  **weights**: Weights between 0 and 10 (10 is most important) for the ranking criteria 'experience', 'professional_skill', 'language', 'certificate', 'achievement', 'project', 'soft_skill', 'activity'.
+    - If the query emphasizes years of work, increase 'experience'.
+    - If it emphasizes specific tools or technologies, increase 'professional_skill'.
+    - If it asks for a translator or multilingual abilities, maximize 'language'.
+    - If it mentions leadership or community work, increase 'soft_skill' and 'activity'.
+4.  **project_summary**: For 'project_description', a concise, 2-3 sentence summary of the project and its core staffing needs. For 'specific_role', an empty string.
+5.  **roles**: An array of positions to hire. For 'project_description', list every position the project needs. For 'specific_role', a single position extracted from the request. Each position has: "position_title", "justification", "experience_level", "hard_skills" (array of strings) and "responsibilities" (array of strings).
+
+### OUTPUT FORMAT
+You MUST respond ONLY with a valid JSON object. Do not include any introductory text or markdown formatting.
+{{
+  "enhanced_query": "<string>",
+  "intent": "project_description" | "specific_role",
+  "weights": {{"experience": <number>, "professional_skill": <number>, "language": <number>, "certificate": <number>, "achievement": <number>, "project": <number>, "soft_skill": <number>, "activity": <number>}},
+  "project_summary": "<string>",
+  "roles": [
+    {{
+      "position_title": "<string>",
+      "justification": "<string>",
+      "experience_level": "<string>",
+      "hard_skills": ["<string>"],
+      "responsibilities": ["<string>"]
+    }}
+  ]
+}}
+
+### YOUR TASK
+User's Raw Query: "{user_query}"
+Your JSON Output:
+"""
@@ -0,0 +1,45 @@
+# rate_limiter.py
+import time
+import threading
+import config
+
+class RateLimiter:
+    """
+    Giới hạn số lời gọi mỗi phút theo kiểu token bucket, dùng chung cho mọi luồng trong process.
+    Cho phép dồn tối đa `burst` lời gọi liền nhau, sau đó các lời gọi được giãn đều theo tốc độ cấu hình.
+    """
+
+    def __init__(self, requests_per_minute, burst=None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(requests_per_minute // 6)))  # Mặc định: lượng của 10 giây
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Chờ đến khi được phép gọi. Trả về số giây đã phải chờ."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+_llm_rate_limiter = None
+_llm_rate_limiter_lock = threading.Lock()
+
+def get_llm_rate_limiter():
+    """Bộ giới hạn lời gọi Gemini dùng chung của process (None nếu không giới hạn)."""
+    global _llm_rate_limiter
+    if not config.LLM_REQUESTS_PER_MINUTE:
+        return None
+    with _llm_rate_limiter_lock:
+        if _llm_rate_limiter is None:
+            _llm_rate_limiter = RateLimiter(config.LLM_REQUESTS_PER_MINUTE, config.LLM_RATE_LIMIT_BURST)
+        return _llm_rate_limiter
@@ -0,0 +1,149 @@
+# result_cache.py
+import copy
+import time
+import threading
+import numpy as np
+import mysql.connector
+from mysql.connector import errorcode
+import config
+import db_manager
+import vector_store
+
+class SemanticResultCache:
+    """
+    Cache kết quả tìm kiếm theo ngữ nghĩa: khóa là embedding của query đã làm rõ, và một truy vấn
+    mới được coi là trùng nếu độ tương đồng cosine với một truy vấn đã lưu vượt ngưỡng.
+    Mục trong cache hết hạn theo TTL, bị loại theo LRU khi vượt kích thước, và bị vô hiệu
+    khi lần đồng bộ vector sau đó đã cập nhật/xóa một trong các ứng viên của kết quả.
+    Trạng thái đồng bộ được so sánh bằng chính các giá trị synced_at trong DB (không dùng đồng hồ
+    của ứng dụng); nếu không đọc được trạng thái đồng bộ, kết quả vẫn được dùng (giới hạn bởi TTL).
+    """
+
+    def __init__(self, similarity_threshold=None, ttl=None, max_entries=None):
+        self.similarity_threshold = similarity_threshold or config.RESULT_CACHE_SIMILARITY
+        self.ttl = ttl or config.RESULT_CACHE_TTL
+        self.max_entries = max_entries or config.RESULT_CACHE_MAX_ENTRIES
+        self._lock = threading.Lock()
+        self._entries = []  # Mỗi mục: dict embedding, results, candidate_ids, created_at, last_hit_at, sync_state
+        self._matrix = None  # Ma trận embedding (đã chuẩn hóa) của các mục, dựng lại khi danh sách thay đổi
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _evict_expired(self, now):
+        kept = [entry for entry in self._entries if now - entry['created_at'] < self.ttl]
+        if len(kept) != len(self._entries):
+            self._entries = kept
+            self._matrix = None
+
+    def lookup(self, embedding):
+        """Trả về (kết quả, độ tương đồng, query đã lưu) của mục gần nhất vượt ngưỡng, hoặc None."""
+        query_vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            if not self._entries:
+                return None
+            if self._matrix is None:
+                self._matrix = np.stack([entry['embedding'] for entry in self._entries])
+            similarities = self._matrix @ query_vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            entry = self._entries[best]
+
+        # Kiểm tra dữ liệu ứng viên còn mới (truy vấn DB) ngoài khóa để không chặn các luồng khác
+        if not self._is_still_valid(entry):
+            print("Kết quả trong cache đã cũ do dữ liệu ứng viên vừa được đồng bộ lại, bỏ qua.")
+            with self._lock:
+                self._entries = [e for e in self._entries if e is not entry]
+                self._matrix = None
+            return None
+        with self._lock:
+            entry['last_hit_at'] = now
+        return copy.deepcopy(entry['results']), float(similarities[best]), entry['enhanced_query']
+
+    def store(self, embedding, enhanced_query, results):
+        """Lưu kết quả của một lần tìm kiếm."""
+        candidate_ids = list(dict.fromkeys(
+            str(candidate['id']) for group in results for candidate in group.get('candidates', [])
+        ))
+        sync_state = _sync_state_of(candidate_ids)
+        now = time.time()
+        entry = {
+            'embedding': self._normalize(embedding), 'enhanced_query': enhanced_query,
+            'results': copy.deepcopy(results), 'candidate_ids': candidate_ids,
+            'created_at': now, 'last_hit_at': now, 'sync_state': sync_state,
+        }
+        with self._lock:
+            self._evict_expired(now)
+            self._entries.append(entry)
+            if len(self._entries) > self.max_entries:
+                self._entries.sort(key=lambda e: e['last_hit_at'])
+                self._entries = self._entries[len(self._entries) - self.max_entries:]
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries, self._matrix = [], None
+
+    def _is_still_valid(self, entry):
+        if not entry['candidate_ids']:
+            return True
+        current_state = _sync_state_of(entry['candidate_ids'])
+        if current_state is None:
+            return True  # Không kiểm tra được: dùng kết quả, độ cũ bị giới hạn bởi TTL
+        if entry['sync_state'] is None:
+            return False  # Không biết trạng thái lúc lưu nên không thể biết đã đổi hay chưa
+        # Ứng viên bị xóa khỏi index làm giảm số lượng; được đồng bộ lại làm synced_at mới nhất tăng lên
+        return current_state == entry['sync_state']
+
+_sync_state_unavailable_logged = False
+
+def _sync_state_of(resume_ids):
+    """
+    Đọc trạng thái đồng bộ vector của các hồ sơ: (số hồ sơ đang có trong index, synced_at mới nhất
+    theo đồng hồ của DB). Trả về None nếu không đọc được (lỗi DB, chưa có bảng trạng thái đồng bộ).
+    """
+    global _sync_state_unavailable_logged
+    if not resume_ids:
+        return 0, None
+    conn = db_manager.get_db_connection()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        placeholders = ", ".join(["%s"] * len(resume_ids))
+        cursor.execute(
+            f"SELECT COUNT(*), MAX(synced_at) FROM {config.SYNC_STATE_TABLE} "
+            f"WHERE index_name = %s AND resume_id IN ({placeholders})",
+            [vector_store.configured_store_name()] + list(resume_ids)
+        )
+        synced_count, last_synced_at = cursor.fetchone()
+        return int(synced_count), last_synced_at
+    except mysql.connector.Error as err:
+        if err.errno == errorcode.ER_NO_SUCH_TABLE:
+            # Chưa chạy sync_pinecone.py lần nào: không có gì để vô hiệu, chỉ báo một lần
+            if not _sync_state_unavailable_logged:
+                _sync_state_unavailable_logged = True
+                print(f"⚠️ Chưa có bảng {config.SYNC_STATE_TABLE}, cache kết quả chỉ hết hạn theo TTL.")
+        else:
+            print(f"⚠️ Lỗi khi kiểm tra trạng thái đồng bộ cho cache kết quả: {err}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """Cache kết quả dùng chung của process."""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = SemanticResultCache()
+        return _result_cache
@@ -0,0 +1,84 @@
+# result_codec.py
+import json
+import zlib
+
+# Định dạng gọn cho kết quả tìm kiếm lưu trong search_history: chỉ giữ id hồ sơ, các điểm
+# và parsed_scores (không lưu nội dung CV), nén thành nhị phân. Byte đầu tiên cho biết codec.
+# msgpack + zstandard là định dạng chính; nếu chưa cài, dùng json + zlib của thư viện chuẩn.
+try:
+    import msgpack
+    import zstandard
+except ImportError:
+    msgpack = None
+    zstandard = None
+
+# Lỗi khi giải nén/giải mã dữ liệu hỏng, được chuyển thành ValueError trong decode_results
+_DECODE_ERRORS = (zlib.error, ValueError, KeyError, TypeError, IndexError)
+if msgpack is not None:
+    _DECODE_ERRORS += (zstandard.ZstdError, msgpack.exceptions.UnpackException)
+
+CODEC_MSGPACK_ZSTD = 1
+CODEC_JSON_ZLIB = 2
+FORMAT_VERSION = 1
+
+def compact_results(all_results: list):
+    """Bỏ phần `data` (nội dung CV) khỏi kết quả, chỉ giữ những gì không thể tra cứu lại."""
+    groups = []
+    for group in all_results:
+        compact_group = {k: v for k, v in group.items() if k != 'candidates'}
+        compact_group['candidates'] = [
+            {
+                "id": str(candidate['id']),
+                "final_score": float(candidate['final_score']),
+                "relevance_score": float(candidate['relevance_score']),
+                "quality_score": float(candidate['quality_score']),
+                "parsed_scores": candidate.get('parsed_scores', {}),
+            }
+            for candidate in group.get('candidates', [])
+        ]
+        groups.append(compact_group)
+    return {"v": FORMAT_VERSION, "groups": groups}
+
+def encode_results(all_results: list):
+    """Chuyển kết quả tìm kiếm thành chuỗi bytes nén."""
+    payload = compact_results(all_results)
+    if msgpack is not None:
+        packed = msgpack.packb(payload, use_bin_type=True)
+        return bytes([CODEC_MSGPACK_ZSTD]) + zstandard.ZstdCompressor(level=6).compress(packed)
+    packed = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    return bytes([CODEC_JSON_ZLIB]) + zlib.compress(packed, 6)
+
+def decode_results(blob: bytes):
+    """
+    Giải nén chuỗi bytes thành kết quả dạng gọn (các ứng viên chưa có `data`).
+    Dữ liệu hỏng gây ValueError; thiếu thư viện cho codec đã dùng gây RuntimeError.
+    """
+    if not blob:
+        raise ValueError("Kết quả tìm kiếm đã lưu bị rỗng.")
+    codec, body = blob[0], bytes(blob[1:])
+    if codec == CODEC_MSGPACK_ZSTD and msgpack is None:
+        raise RuntimeError("Cần cài 'msgpack' và 'zstandard' để đọc kết quả đã lưu ở định dạng này.")
+    if codec not in (CODEC_MSGPACK_ZSTD, CODEC_JSON_ZLIB):
+        raise ValueError(f"Codec kết quả tìm kiếm không hợp lệ: {codec}")
+    try:
+        if codec == CODEC_MSGPACK_ZSTD:
+            payload = msgpack.unpackb(zstandard.ZstdDecompressor().decompress(body), raw=False)
+        else:
+            payload = json.loads(zlib.decompress(body).decode('utf-8'))
+        return payload['groups']
+    except _DECODE_ERRORS as e:
+        raise ValueError(f"Kết quả tìm kiếm đã lưu bị hỏng: {e}") from e
+
+def rehydrate_results(groups: list, resume_lookup):
+    """
+    Gắn lại nội dung CV (`data`) cho các ứng viên bằng một lần tra cứu theo lô.
+    `resume_lookup` nhận list id và trả về dict {id: dict dữ liệu hồ sơ}.
+    """
+    resume_ids = list(dict.fromkeys(
+        candidate['id'] for group in groups for candidate in group.get('candidates', [])
+    ))
+    records = resume_lookup(resume_ids) if resume_ids else {}
+    for group in groups:
+        for candidate in group.get('candidates', []):
+            candidate['data'] = records.get(candidate['id'], {})
+    return groups
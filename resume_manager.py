@@ -1,46 +1,45 @@
 # resume_manager.py
-import mysql.connector
+import re
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from pinecone import Pinecone, ServerlessSpec  # <-- THAY ĐỔI 1: Import ServerlessSpec
 import config
+import db_pool
+import db_manager
+import tracing
+import vector_store
 
 class ResumeManager:
-    """Quản lý dữ liệu hồ sơ từ TiDB và đồng bộ vector với Pinecone."""
+    """Quản lý dữ liệu hồ sơ từ TiDB và truy vấn vector trên vector store (Pinecone hoặc local)."""
 
-    def __init__(self, embedding_model):
+    def __init__(self, embedding_model, store=None):
         print("Khởi tạo ResumeManager...")
         self.db_config = config.DB_CONFIG
         self.table_name = config.TABLE_NAME
         self.embedding_model = embedding_model
         self.df_resumes = pd.DataFrame()
+        self.resume_columns = config.RESUME_COLUMNS
+        self._resume_cache = OrderedDict()  # id -> (thời điểm tải, dict dữ liệu hồ sơ)
+        self._resume_cache_lock = threading.Lock()
+        self._query_embedding_cache = OrderedDict()
+        self._query_embedding_lock = threading.Lock()
+        self._retrieval_executor = ThreadPoolExecutor(
+            max_workers=config.RETRIEVAL_MAX_WORKERS, thread_name_prefix="retrieval"
+        )
+
+        # Vector store theo cấu hình (Pinecone hoặc local memory-mapped). Phía phục vụ không tạo index:
+        # việc quản trị index thuộc về sync_pinecone.py.
+        self.vector_store = store if store is not None else vector_store.get_vector_store()
+        print(f"✅ Kết nối tới vector store '{self.vector_store.name}' thành công.")
 
-        self.pc = Pinecone(api_key=config.PINECONE_API_KEY)
-        self.index_name = config.PINECONE_INDEX_NAME
-
-        if self.index_name not in self.pc.list_indexes().names():
-            print(f"CẢNH BÁO: Index '{self.index_name}' không tồn tại. Đang tạo tạm thời (Serverless).")
-            print("Vui lòng chạy script sync_pinecone.py để đồng bộ dữ liệu.")
-            # --- THAY ĐỔI 2: Sử dụng ServerlessSpec với giá trị cố định ---
-            self.pc.create_index(
-                name=self.index_name,
-                dimension=384,
-                metric='cosine',
-                spec=ServerlessSpec(
-                    cloud='aws',
-                    region='us-east-1'
-                )
-            )
-            # -----------------------------------------------------------
-
-        self.index = self.pc.Index(self.index_name)
-        print(f"✅ Kết nối tới Pinecone index '{self.index_name}' thành công.")
-
-    # ... các hàm còn lại giữ nguyên ...
     def load_resumes_from_db(self):
+        """Tải trước toàn bộ bảng hồ sơ vào bộ nhớ (chế độ prewarm cho dữ liệu nhỏ)."""
         print("\n--- Đang tải dữ liệu hồ sơ từ TiDB... ---")
         try:
-            conn = mysql.connector.connect(**self.db_config)
-            query = f"SELECT * FROM {self.table_name}"
+            conn = db_pool.get_connection()
+            query = f"SELECT {', '.join(self.resume_columns)} FROM {self.table_name}"
             self.df_resumes = pd.read_sql(query, conn)
             self.df_resumes['id'] = self.df_resumes['id'].astype(str)
             self.df_resumes.set_index('id', inplace=True)
@@ -50,25 +49,113 @@ class ResumeManager:
             print(f"❌ LỖI KHI TẢI DỮ LIỆU TỪ DB: {e}")
             return False
         finally:
-            if 'conn' in locals() and conn.is_connected():
-                conn.close()
+            if 'conn' in locals():
+                conn.close()  # Trả kết nối về pool
+
+    def get_resume_records(self, ids: list):
+        """
+        Trả về dict {id: dữ liệu hồ sơ} cho các id được yêu cầu (id không tồn tại bị bỏ qua).
+        Hồ sơ "nóng" được lấy từ LRU cache; phần còn lại được tải bằng một truy vấn duy nhất.
+        """
+        str_ids = list(dict.fromkeys(str(i) for i in ids))
+        if not self.df_resumes.empty:
+            valid_ids = [id for id in str_ids if id in self.df_resumes.index]
+            return {id: dict(self.df_resumes.loc[id].to_dict(), id=id) for id in valid_ids}
+
+        now = time.time()
+        found = {}
+        with self._resume_cache_lock:
+            for resume_id in str_ids:
+                cached = self._resume_cache.get(resume_id)
+                if cached and now - cached[0] < config.RESUME_CACHE_TTL:
+                    self._resume_cache.move_to_end(resume_id)
+                    found[resume_id] = cached[1]
+
+        missing_ids = [resume_id for resume_id in str_ids if resume_id not in found]
+        if missing_ids:
+            fetched = db_manager.fetch_resume_records(missing_ids, self.resume_columns)
+            found.update(fetched)
+            with self._resume_cache_lock:
+                for resume_id, row in fetched.items():
+                    self._resume_cache[resume_id] = (now, row)
+                    self._resume_cache.move_to_end(resume_id)
+                while len(self._resume_cache) > config.RESUME_CACHE_SIZE:
+                    self._resume_cache.popitem(last=False)
+        return found
 
     def get_resumes_by_ids(self, ids: list):
-        if self.df_resumes.empty:
-            self.load_resumes_from_db()
-        str_ids = [str(i) for i in ids]
-        valid_ids = [id for id in str_ids if id in self.df_resumes.index]
-        return self.df_resumes.loc[valid_ids]
+        """Trả về DataFrame (index là id) của các hồ sơ được yêu cầu, theo đúng thứ tự đầu vào."""
+        str_ids = list(dict.fromkeys(str(i) for i in ids))
+        if not self.df_resumes.empty:
+            valid_ids = [id for id in str_ids if id in self.df_resumes.index]
+            return self.df_resumes.loc[valid_ids]
+
+        found = self.get_resume_records(str_ids)
+        valid_ids = [resume_id for resume_id in str_ids if resume_id in found]
+        columns = [col for col in self.resume_columns if col != 'id']
+        df = pd.DataFrame([found[resume_id] for resume_id in valid_ids], columns=self.resume_columns)
+        return df.set_index('id')[columns]
+
+    @staticmethod
+    def _normalize_query_text(query_text: str):
+        return re.sub(r"\s+", " ", query_text).strip().lower()
+
+    def encode_queries(self, query_texts: list):
+        """
+        Tạo embedding cho nhiều truy vấn bằng một lần gọi encode.
+        Truy vấn đã gặp (sau khi chuẩn hóa khoảng trắng/chữ hoa) được lấy từ LRU cache.
+        """
+        keys = [self._normalize_query_text(text) for text in query_texts]
+        embeddings = {}
+        with self._query_embedding_lock:
+            for key in keys:
+                if key in self._query_embedding_cache:
+                    self._query_embedding_cache.move_to_end(key)
+                    embeddings[key] = self._query_embedding_cache[key]
+
+        # Encode văn bản gốc (chỉ gộp khoảng trắng) của lần xuất hiện đầu tiên cho mỗi khóa
+        missing = {}
+        for key, text in zip(keys, query_texts):
+            if key not in embeddings and key not in missing:
+                missing[key] = re.sub(r"\s+", " ", text).strip()
+        missing_keys = list(missing)
+        if missing_keys:
+            with tracing.span('embedding.encode', texts=len(missing)):
+                encoded = self.embedding_model.encode(list(missing.values()), show_progress_bar=False)
+            with self._query_embedding_lock:
+                for key, embedding in zip(missing_keys, encoded):
+                    embeddings[key] = embedding.tolist()
+                    self._query_embedding_cache[key] = embeddings[key]
+                    self._query_embedding_cache.move_to_end(key)
+                while len(self._query_embedding_cache) > config.QUERY_EMBEDDING_CACHE_SIZE:
+                    self._query_embedding_cache.popitem(last=False)
+        return [embeddings[key] for key in keys]
+
+    def query_pinecone_batch(self, query_texts: list, top_k: int):
+        """
+        Truy vấn vector store cho nhiều truy vấn (ví dụ: mọi vị trí của một lần tìm kiếm).
+        Embedding được tạo một lần cho cả lô, các truy vấn index chạy đồng thời.
+        Trả về list các tuple (candidate_ids, relevance_scores) theo đúng thứ tự đầu vào.
+        """
+        if not query_texts:
+            return []
+        print(f"--- Đang truy vấn vector store cho {len(query_texts)} truy vấn với top_k={top_k}... ---")
+        query_embeddings = self.encode_queries(query_texts)
+
+        def query_store(embedding):
+            with tracing.span('vector.query', store=self.vector_store.name, top_k=top_k) as span_attributes:
+                matches = self.vector_store.query(embedding, top_k)
+                span_attributes['matches'] = len(matches)
+                return matches
+
+        all_matches = list(self._retrieval_executor.map(tracing.wrap(query_store), query_embeddings))
+        results = []
+        for matches in all_matches:
+            candidate_ids = [match_id for match_id, _ in matches]
+            relevance_scores = {match_id: score for match_id, score in matches}
+            results.append((candidate_ids, relevance_scores))
+        print(f"✅ Vector store trả về {sum(len(ids) for ids, _ in results)} kết quả.")
+        return results
 
     def query_pinecone(self, query_text: str, top_k: int):
-        print(f"--- Đang truy vấn Pinecone với top_k={top_k}... ---")
-        query_embedding = self.embedding_model.encode(query_text).tolist()
-        results = self.index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=False
-        )
-        candidate_ids = [match['id'] for match in results['matches']]
-        relevance_scores = {match['id']: match['score'] for match in results['matches']}
-        print(f"✅ Pinecone trả về {len(candidate_ids)} kết quả.")
-        return candidate_ids, relevance_scores
\ No newline at end of file
+        return self.query_pinecone_batch([query_text], top_k)[0]
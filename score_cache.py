@@ -0,0 +1,111 @@
+# score_cache.py
+import json
+import hashlib
+import mysql.connector
+import config
+import tracing
+from db_manager import get_db_connection
+
+# Điểm parsed_* chỉ phụ thuộc vào nội dung CV và phiên bản prompt (không phụ thuộc query),
+# nên có thể lưu lại và dùng chung giữa các lần tìm kiếm / các worker.
+_table_ready = False
+
+def compute_content_hash(text_block: str):
+    """Tạo hash SHA-256 cho khối nội dung CV đã gộp."""
+    return hashlib.sha256(text_block.encode('utf-8')).hexdigest()
+
+def ensure_score_table(conn):
+    """Tạo bảng lưu điểm nếu chưa tồn tại (chỉ chạy một lần mỗi process)."""
+    global _table_ready
+    if _table_ready:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""CREATE TABLE IF NOT EXISTS {config.SCORE_CACHE_TABLE} (
+                resume_id VARCHAR(64) PRIMARY KEY,
+                content_hash CHAR(64) NOT NULL,
+                prompt_version VARCHAR(32) NOT NULL,
+                scores_json TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            )"""
+        )
+        conn.commit()
+        _table_ready = True
+    finally:
+        cursor.close()
+
+@tracing.traced('db.score_cache.get')
+def get_cached_scores(content_hashes: dict, prompt_version: str):
+    """
+    Lấy điểm đã lưu cho nhiều CV cùng lúc.
+    `content_hashes` là dict {resume_id: content_hash}. Chỉ trả về các CV có hash
+    và phiên bản prompt khớp; CV đã thay đổi nội dung được coi là chưa có trong cache.
+    """
+    if not config.SCORE_CACHE_ENABLED or not content_hashes:
+        return {}
+    conn = get_db_connection()
+    if not conn:
+        return {}
+
+    cursor = None
+    try:
+        ensure_score_table(conn)
+        cursor = conn.cursor(dictionary=True)
+        resume_ids = list(content_hashes.keys())
+        placeholders = ", ".join(["%s"] * len(resume_ids))
+        cursor.execute(
+            f"SELECT resume_id, content_hash, prompt_version, scores_json FROM {config.SCORE_CACHE_TABLE} WHERE resume_id IN ({placeholders})",
+            resume_ids
+        )
+        cached = {}
+        for row in cursor.fetchall():
+            resume_id = row['resume_id']
+            if row['content_hash'] == content_hashes.get(resume_id) and row['prompt_version'] == prompt_version:
+                cached[resume_id] = json.loads(row['scores_json'])
+        return cached
+    except (mysql.connector.Error, json.JSONDecodeError) as err:
+        print(f"⚠️ Lỗi khi đọc cache điểm chất lượng: {err}")
+        return {}
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
+
+@tracing.traced('db.score_cache.save')
+def save_scores(entries: list, prompt_version: str):
+    """
+    Ghi (hoặc ghi đè) điểm cho nhiều CV.
+    `entries` là list các tuple (resume_id, content_hash, parsed_scores).
+    Trả về True nếu đã ghi xuống DB (hoặc không có gì cần ghi).
+    """
+    if not config.SCORE_CACHE_ENABLED or not entries:
+        return not entries
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cursor = None
+    try:
+        ensure_score_table(conn)
+        cursor = conn.cursor()
+        rows = [
+            (str(resume_id), content_hash, prompt_version, json.dumps(scores))
+            for resume_id, content_hash, scores in entries
+        ]
+        cursor.executemany(
+            f"""INSERT INTO {config.SCORE_CACHE_TABLE} (resume_id, content_hash, prompt_version, scores_json)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE content_hash = VALUES(content_hash),
+                    prompt_version = VALUES(prompt_version), scores_json = VALUES(scores_json)""",
+            rows
+        )
+        conn.commit()
+        return True
+    except mysql.connector.Error as err:
+        print(f"⚠️ Lỗi khi ghi cache điểm chất lượng: {err}")
+        return False
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
@@ -0,0 +1,161 @@
+# scoring.py
+import re
+from functools import lru_cache
+import numpy as np
+import config
+
+# Ánh xạ chỉ số parsed_* do LLM trả về -> khóa trọng số động (và trọng số mặc định nếu thiếu)
+METRIC_WEIGHTS = [
+    ('parsed_exp_years', 'experience', 7),
+    ('parsed_prof_skill_advanced', 'professional_skill', 8),
+    ('parsed_lang_score', 'language', 5),
+    ('parsed_certs_high_value', 'certificate', 4),
+    ('parsed_achievements_high_impact', 'achievement', 4),
+    ('parsed_projects_high_impact', 'project', 5),
+    ('parsed_soft_skill_count', 'soft_skill', 3),
+    ('parsed_activities_high_impact', 'activity', 2),
+]
+METRIC_COLUMNS = [metric for metric, _, _ in METRIC_WEIGHTS]
+SKILL_MATCH_BONUS = 15 # Điểm thưởng cho mỗi kỹ năng cứng khớp chính xác
+QUALITY_SCORE_SCALE = 300.0 # Chia điểm chất lượng cho hằng số này để đưa về cùng thang với relevance
+
+_EMPTY_SKILLS = frozenset()
+
+@lru_cache(maxsize=20000)
+def _tokenize_skills_cached(skills_text):
+    skills = frozenset(s.strip().lower() for s in skills_text.split(','))
+    return skills - {''}
+
+def tokenize_skills(skills):
+    """
+    Chuyển danh sách kỹ năng (chuỗi phân tách bằng dấu phẩy hoặc list) thành tập kỹ năng (chữ thường).
+    Kết quả cho cùng một chuỗi được cache (giới hạn số mục), nên mỗi CV chỉ phải tách chuỗi một lần.
+    """
+    if skills is None or (isinstance(skills, float) and np.isnan(skills)):
+        return _EMPTY_SKILLS
+    if isinstance(skills, (list, tuple, set)):
+        skills = ','.join(str(s) for s in skills)
+    return _tokenize_skills_cached(str(skills))
+
+def _to_float(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if np.isnan(number) else number
+
+def build_metric_matrix(parsed_scores_list):
+    """Ma trận (số ứng viên x số chỉ số) các điểm parsed_*; chỉ số thiếu/không hợp lệ được tính là 0."""
+    matrix = np.zeros((len(parsed_scores_list), len(METRIC_COLUMNS)), dtype=np.float64)
+    for row, parsed_scores in enumerate(parsed_scores_list):
+        if parsed_scores:
+            matrix[row] = [_to_float(parsed_scores.get(metric, 0)) for metric in METRIC_COLUMNS]
+    return matrix
+
+def build_weight_vector(dynamic_weights):
+    dynamic_weights = dynamic_weights or {}
+    return np.array(
+        [_to_float(dynamic_weights.get(key, default)) for _, key, default in METRIC_WEIGHTS],
+        dtype=np.float64
+    )
+
+def skill_match_counts(required_skills, candidate_skill_sets):
+    """Số kỹ năng cứng yêu cầu mà mỗi ứng viên có (so khớp chính xác, không phân biệt hoa thường)."""
+    required = tokenize_skills(list(required_skills or []))
+    if not required:
+        return np.zeros(len(candidate_skill_sets), dtype=np.float64)
+    return np.fromiter(
+        (len(required & skills) for skills in candidate_skill_sets), dtype=np.float64, count=len(candidate_skill_sets)
+    )
+
+_SKILL_WORD_PATTERN = re.compile(r"[^\W_][\w+#.]*")  # Giữ các ký tự trong tên như c++, c#, node.js
+
+@lru_cache(maxsize=20000)
+def _skill_words(text):
+    return frozenset(word.rstrip('.') for word in _SKILL_WORD_PATTERN.findall(text.lower()))
+
+def skill_overlap(required_skills, candidate_skills):
+    """
+    Tỷ lệ kỹ năng cứng yêu cầu xuất hiện trong professional_skill của từng ứng viên. So khớp theo từ
+    nên "Spring Boot" khớp với "Java, Spring Boot 3" (skill_match_counts chỉ đếm kỹ năng khớp chính xác).
+    """
+    required = [words for words in (_skill_words(str(skill)) for skill in required_skills or []) if words]
+    overlap = np.zeros(len(candidate_skills), dtype=np.float64)
+    if not required:
+        return overlap
+    for row, skills in enumerate(candidate_skills):
+        if skills is None or (isinstance(skills, float) and np.isnan(skills)):
+            continue
+        if isinstance(skills, (list, tuple, set)):
+            skills = ', '.join(str(s) for s in skills)
+        words = _skill_words(str(skills))
+        overlap[row] = sum(skill <= words for skill in required) / len(required)
+    return overlap
+
+def prescore_candidates(relevance_scores, candidate_skills, required_skills):
+    """
+    Điểm sơ bộ (không cần LLM) để chọn ứng viên đáng được đánh giá chi tiết:
+    kết hợp relevance từ vector store với tỷ lệ kỹ năng cứng yêu cầu có trong CV.
+    """
+    weight_relevance = config.CASCADE_PRESCORE_RELEVANCE_WEIGHT
+    relevance = np.array([_to_float(score) for score in relevance_scores], dtype=np.float64)
+    return weight_relevance * relevance + (1 - weight_relevance) * skill_overlap(required_skills, candidate_skills)
+
+def quality_scores(parsed_scores_list, candidate_skills, dynamic_weights, required_skills):
+    """
+    Điểm chất lượng của nhiều ứng viên: tích ma trận chỉ số với vector trọng số động,
+    cộng điểm thưởng kỹ năng cứng khớp chính xác.
+    """
+    metrics = build_metric_matrix(parsed_scores_list)
+    skill_sets = [tokenize_skills(skills) for skills in candidate_skills]
+    return metrics @ build_weight_vector(dynamic_weights) + SKILL_MATCH_BONUS * skill_match_counts(required_skills, skill_sets)
+
+def final_scores(relevance_scores, quality, weight_relevance=None, weight_quality=None):
+    """Kết hợp relevance và điểm chất lượng (đã chuẩn hóa) thành điểm cuối cùng."""
+    weight_relevance = config.WEIGHT_RELEVANCE if weight_relevance is None else weight_relevance
+    weight_quality = config.WEIGHT_QUALITY if weight_quality is None else weight_quality
+    relevance = np.asarray(relevance_scores, dtype=np.float64)
+    return weight_relevance * relevance + weight_quality * (np.asarray(quality, dtype=np.float64) / QUALITY_SCORE_SCALE)
+
+def rank_candidates(candidates, dynamic_weights, required_skills, weight_relevance=None, weight_quality=None):
+    """
+    Tính lại quality_score/final_score cho các ứng viên của một vị trí và sắp xếp giảm dần theo final_score.
+    `candidates` là list dict có 'parsed_scores', 'relevance_score' và 'data' (nội dung CV);
+    trả về list dict mới, không sửa list đầu vào.
+    """
+    if not candidates:
+        return []
+    quality = quality_scores(
+        [candidate.get('parsed_scores') or {} for candidate in candidates],
+        [(candidate.get('data') or {}).get('professional_skill') for candidate in candidates],
+        dynamic_weights, required_skills
+    )
+    final = final_scores([_to_float(c.get('relevance_score', 0)) for c in candidates], quality, weight_relevance, weight_quality)
+    order = np.argsort(-final, kind='stable')
+    return [
+        {**candidates[i], "quality_score": float(quality[i]), "final_score": float(final[i])}
+        for i in order
+    ]
+
+def rerank_results(all_results, dynamic_weights=None, weight_relevance=None, weight_quality=None):
+    """
+    Xếp hạng lại kết quả của một lần tìm kiếm với trọng số mới mà không chạy lại pipeline:
+    chỉ dùng parsed_scores và relevance_score đã lưu của từng ứng viên.
+    `dynamic_weights` là None thì giữ trọng số động đã lưu trong từng nhóm. Kết quả cũ không lưu
+    kỹ năng cứng của vị trí (`hard_skills`) sẽ không được cộng điểm thưởng kỹ năng khi xếp hạng lại.
+    """
+    weight_relevance = config.WEIGHT_RELEVANCE if weight_relevance is None else weight_relevance
+    weight_quality = config.WEIGHT_QUALITY if weight_quality is None else weight_quality
+    reranked = []
+    for group in all_results:
+        group_weights = dynamic_weights or group.get('dynamic_weights') or config.DEFAULT_DYNAMIC_WEIGHTS
+        reranked.append({
+            **group,
+            "dynamic_weights": dict(group_weights),
+            "weight_relevance": weight_relevance, "weight_quality": weight_quality,
+            "candidates": rank_candidates(
+                group.get('candidates', []), group_weights, group.get('hard_skills', []),
+                weight_relevance, weight_quality
+            ),
+        })
+    return reranked
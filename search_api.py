@@ -0,0 +1,129 @@
+# search_api.py
+import hmac
+import json
+import argparse
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+import search_engine
+import tracing
+
+# API HTTP cho pipeline tìm kiếm (không cần Streamlit), dùng cho các hệ thống tích hợp:
+#   POST /search   body JSON {"query": "...", "top_k": 5, "use_result_cache": true}
+#   GET  /health   trạng thái và số lần tìm kiếm đang chạy/đã xong
+#   GET  /metrics  counter dạng Prometheus (xem tracing.py)
+# Mỗi request chạy trên một luồng riêng; số lần tìm kiếm đồng thời do SearchEngine giới hạn.
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    engine = None  # SearchEngine dùng chung, gán trước khi chạy server
+    server_version = "HRAISearch/1.0"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        if not config.SEARCH_API_KEY:
+            return True
+        return hmac.compare_digest(self.headers.get("X-API-Key", ""), config.SEARCH_API_KEY)
+
+    def _read_json_body(self):
+        """Trả về (dict body, None) hoặc (None, (status, thông báo lỗi))."""
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            return None, (400, "Content-Length không hợp lệ.")
+        if length > config.SEARCH_API_MAX_BODY_BYTES:
+            return None, (413, "Request quá lớn.")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None, (400, "Body không phải JSON hợp lệ.")
+        if not isinstance(body, dict):
+            return None, (400, "Body phải là một object JSON.")
+        return body, None
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send_json(200, {"status": "ok", **self.engine.stats()})
+        elif path == "/metrics":
+            body = tracing.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": "Không tìm thấy."})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/search":
+            self._send_json(404, {"error": "Không tìm thấy."})
+            return
+        if not self._authorized():
+            self._send_json(401, {"error": "Thiếu hoặc sai X-API-Key."})
+            return
+        body, error = self._read_json_body()
+        if error:
+            status, message = error
+            self._send_json(status, {"error": message})
+            return
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            self._send_json(400, {"error": "Thiếu trường 'query'."})
+            return
+        top_k = body.get("top_k")
+        if top_k is not None and (not isinstance(top_k, int) or isinstance(top_k, bool) or top_k <= 0):
+            self._send_json(400, {"error": "'top_k' phải là số nguyên dương."})
+            return
+        use_result_cache = body.get("use_result_cache")
+        if use_result_cache is not None and not isinstance(use_result_cache, bool):
+            self._send_json(400, {"error": "'use_result_cache' phải là true hoặc false."})
+            return
+
+        try:
+            outcome = self.engine.search(query.strip(), use_result_cache=use_result_cache)
+        except Exception as e:
+            print(f"🔥 Lỗi khi tìm kiếm qua API: {e}")
+            self._send_json(500, {"error": "Lỗi khi tìm kiếm."})
+            return
+        if outcome is None:
+            self._send_json(503, {"error": "Hệ thống đang bận, vui lòng thử lại sau."})
+            return
+        self._send_json(200, search_engine.serialize_outcome(outcome, top_k))
+
+    def log_message(self, format, *args):
+        print(f"   -> [api] {self.address_string()} {format % args}")
+
+def create_server(engine, host=None, port=None):
+    """Tạo ThreadingHTTPServer phục vụ `engine` (chưa chạy; gọi serve_forever() để chạy)."""
+    handler = type("BoundSearchRequestHandler", (SearchRequestHandler,), {"engine": engine})
+    server = ThreadingHTTPServer((host or config.SEARCH_API_HOST, port or config.SEARCH_API_PORT), handler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chạy API HTTP cho pipeline tìm kiếm ứng viên.")
+    parser.add_argument("--host", default=config.SEARCH_API_HOST)
+    parser.add_argument("--port", type=int, default=config.SEARCH_API_PORT)
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="Số lần tìm kiếm chạy đồng thời (mặc định SEARCH_MAX_CONCURRENT).")
+    args = parser.parse_args()
+
+    print("--- KHỞI TẠO HỆ THỐNG ---")
+    engine = search_engine.SearchEngine.from_config(args.max_concurrent, queue_timeout=config.SEARCH_QUEUE_TIMEOUT)
+    server = create_server(engine, args.host, args.port)
+    print(f"--- ✅ API tìm kiếm đang chạy tại http://{args.host}:{args.port} ---")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n--- Đang dừng API... ---")
+    finally:
+        server.server_close()
@@ -0,0 +1,331 @@
+# search_engine.py
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+import config
+import db_pool
+import ai_services
+import result_cache
+import result_codec
+import scoring
+import startup
+import tracing
+
+# Pipeline tìm kiếm ứng viên (tách khỏi giao diện Streamlit để dùng lại trong benchmark/API):
+# phân tích truy vấn -> (cache kết quả) -> truy vấn vector store -> chấm sơ bộ -> đánh giá bằng LLM -> xếp hạng.
+STAGES = ('understand', 'cache_lookup', 'retrieval', 'prescore', 'evaluation', 'ranking')
+
+@contextmanager
+def _timed_stage(timings, stage):
+    start = time.perf_counter()
+    try:
+        with tracing.span(f"search.{stage}"):
+            yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def build_role_queries(intent, plan):
+    """Từ kế hoạch tuyển dụng, tạo list các tuple (role, role_title, detailed_query) cho từng vị trí."""
+    if intent == 'project_description':
+        roles_to_find = (plan or {}).get('team_composition', []) if isinstance(plan, dict) else []
+    else:
+        roles_to_find = plan if isinstance(plan, list) else []
+    role_queries = []
+    for role in roles_to_find:
+        role_title = role.get('position_title', 'KHÔNG XÁC ĐỊNH').upper()
+        detailed_query = f"{role.get('position_title','')} with {role.get('experience_level','')} skills in {', '.join(role.get('hard_skills',[]))}"
+        role_queries.append((role, role_title, detailed_query))
+    return role_queries
+
+def retrieve_shortlists(resume_manager, role_queries, top_k=None):
+    """
+    Truy vấn vector store cho mọi vị trí cùng lúc. Trả về list các tuple
+    (role, role_title, shortlisted_resumes_df, relevance_scores) cho các vị trí có ứng viên.
+    """
+    retrieval_results = resume_manager.query_pinecone_batch(
+        [detailed_query for _, _, detailed_query in role_queries], top_k=top_k or config.SHORTLIST_SIZE
+    )
+    role_shortlists = []
+    for (role, role_title, _), (candidate_ids, relevance_scores) in zip(role_queries, retrieval_results):
+        if not candidate_ids:
+            continue
+        shortlisted_resumes_df = resume_manager.get_resumes_by_ids(candidate_ids)
+        role_shortlists.append((role, role_title, shortlisted_resumes_df, relevance_scores))
+    return role_shortlists
+
+def _unique_candidates(role_shortlists):
+    unique_candidates = {}
+    for _, _, shortlisted_resumes_df, _ in role_shortlists:
+        for idx, candidate_row in shortlisted_resumes_df.iterrows():
+            unique_candidates.setdefault(idx, candidate_row.to_dict())
+    return unique_candidates
+
+def _interleave(id_lists, seen):
+    """Lấy lần lượt phần tử cùng hạng của mỗi list, bỏ qua id đã có trong `seen` (được cập nhật)."""
+    ordered_ids = []
+    for same_rank_ids in itertools.zip_longest(*id_lists):
+        for idx in same_rank_ids:
+            if idx is not None and idx not in seen:
+                seen.add(idx)
+                ordered_ids.append(idx)
+    return ordered_ids
+
+def select_candidates_for_evaluation(role_shortlists, unique_candidates):
+    """
+    Xếp hạng nhiều tầng: CV đã có điểm trong cache điểm luôn được dùng (không tốn lời gọi Gemini);
+    các CV còn lại của mỗi vị trí được sắp theo điểm sơ bộ (scoring.prescore_candidates). Mỗi vị trí luôn
+    có ít nhất TOP_K_RESULTS CV được đánh giá (tính cả CV đã cache), kể cả khi vượt ngân sách; phần ngân sách
+    còn lại được chia bằng cách lần lượt lấy CV tốt nhất tiếp theo của từng vị trí.
+    Trả về (list (id, candidate_row) cần đánh giá, dict điểm đã cache, dict thống kê).
+    """
+    cached = ai_services.lookup_cached_evaluations(list(unique_candidates.items()))
+    guaranteed_per_role, rest_per_role = [], []
+    for role, _, shortlisted_resumes_df, relevance_scores in role_shortlists:
+        ids = [idx for idx in shortlisted_resumes_df.index if str(idx) not in cached]
+        prescores = scoring.prescore_candidates(
+            [relevance_scores.get(str(idx), 0) for idx in ids],
+            [unique_candidates[idx].get('professional_skill') for idx in ids],
+            role.get('hard_skills', [])
+        )
+        ranked_ids = [ids[i] for i in sorted(range(len(ids)), key=lambda i: -prescores[i])]
+        required = max(0, config.TOP_K_RESULTS - (len(shortlisted_resumes_df.index) - len(ids)))
+        guaranteed_per_role.append(ranked_ids[:required])
+        rest_per_role.append(ranked_ids[required:])
+
+    # Xen kẽ giữa các vị trí để khi ngân sách nhỏ, vị trí nào cũng có ứng viên được đánh giá
+    seen = set()
+    guaranteed_ids = _interleave(guaranteed_per_role, seen)
+    ordered_ids = guaranteed_ids + _interleave(rest_per_role, seen)
+    selected = ai_services.limit_to_evaluation_budget(
+        [(idx, unique_candidates[idx]) for idx in ordered_ids],
+        config.CASCADE_LLM_RESUME_BUDGET, config.CASCADE_LLM_TOKEN_BUDGET, min_count=len(guaranteed_ids)
+    )
+    cached_candidates = [(idx, row) for idx, row in unique_candidates.items() if str(idx) in cached]
+    stats = {
+        "retrieved": len(unique_candidates), "cached": len(cached_candidates),
+        "llm_evaluated": len(selected), "skipped": len(ordered_ids) - len(selected),
+    }
+    return cached_candidates + selected, cached, stats
+
+def rank_shortlists(role_shortlists, parsed_scores_by_id, dynamic_weights):
+    """Tính điểm và xếp hạng cho từng vị trí (tính theo lô trên toàn bộ shortlist)."""
+    all_results = []
+    for role, role_title, shortlisted_resumes_df, relevance_scores in role_shortlists:
+        # Chỉ dựng dữ liệu cho các CV đã có điểm (shortlist rộng hơn nhiều so với số CV được đánh giá)
+        evaluated_ids = [idx for idx in shortlisted_resumes_df.index if parsed_scores_by_id.get(idx)]
+        candidate_results = [
+            {
+                "relevance_score": relevance_scores.get(str(idx), 0), "data": candidate_data,
+                "parsed_scores": parsed_scores_by_id[idx], "id": idx
+            }
+            for idx, candidate_data in shortlisted_resumes_df.loc[evaluated_ids].to_dict('index').items()
+        ]
+        ranked_candidates = scoring.rank_candidates(candidate_results, dynamic_weights, role.get('hard_skills', []))
+        # Lưu kèm kỹ năng cứng và trọng số để có thể xếp hạng lại mà không cần tìm kiếm lại
+        all_results.append({
+            "role": role_title, "hard_skills": role.get('hard_skills', []),
+            "dynamic_weights": dynamic_weights, "candidates": ranked_candidates
+        })
+    return all_results
+
+def run_search(llm_model, resume_manager, user_query, use_result_cache=None, cancel_event=None):
+    """
+    Chạy toàn bộ pipeline tìm kiếm cho một yêu cầu tuyển dụng.
+    Trả về dict gồm enhanced_query, intent, dynamic_weights, plan, results (list nhóm theo vị trí),
+    cache_hit (None hoặc dict similarity/query khi dùng lại kết quả cũ), timings (giây theo từng giai đoạn),
+    cancelled, cascade (số CV lấy về/có sẵn điểm/được LLM đánh giá/bị bỏ qua và chi phí LLM thực tế khi bật CASCADE_ENABLED),
+    search_id và trace (tóm tắt các span của lần tìm kiếm, xem tracing.Trace.summary).
+    """
+    with tracing.start_trace() as trace:
+        for event in iter_search(llm_model, resume_manager, user_query, use_result_cache, cancel_event):
+            outcome = event["outcome"]
+        outcome["search_id"] = trace.search_id
+        outcome["trace"] = trace.summary()
+        return outcome
+
+def iter_search(llm_model, resume_manager, user_query, use_result_cache=None, cancel_event=None):
+    """
+    Chạy pipeline tìm kiếm và trả về dần trạng thái để giao diện hiển thị ngay khi có kết quả.
+    Mỗi event là dict {"type": ..., "outcome": ...}, trong đó outcome có cùng cấu trúc với kết quả
+    của run_search và được cập nhật tại chỗ. Thứ tự các event:
+      'plan'     : đã có kế hoạch tuyển dụng; outcome["results"] gồm các vị trí chưa có ứng viên
+      'ranking'  : (lặp lại) một phần ứng viên vừa được đánh giá, các vị trí liên quan đã được xếp hạng lại
+      'done'     : kết thúc (outcome["cancelled"] cho biết tìm kiếm có bị hủy giữa chừng không)
+    Có thể hủy bằng cách set `cancel_event` (threading.Event) hoặc đóng generator; kết quả dở dang
+    không được lưu vào cache kết quả.
+    """
+    use_result_cache = config.RESULT_CACHE_ENABLED if use_result_cache is None else use_result_cache
+    timings = {}
+    with _timed_stage(timings, 'understand'):
+        enhanced_query, intent, dynamic_weights, plan = ai_services.understand_query(llm_model, user_query)
+    role_queries = build_role_queries(intent, plan)
+    outcome = {
+        "enhanced_query": enhanced_query, "intent": intent, "dynamic_weights": dynamic_weights,
+        "plan": plan, "results": [], "cache_hit": None, "timings": timings, "cancelled": False,
+        "cascade": None,
+    }
+
+    def cancelled():
+        outcome["cancelled"] = cancel_event is not None and cancel_event.is_set()
+        return outcome["cancelled"]
+
+    def done_event():
+        for group in outcome["results"]:
+            group.pop("pending", None)
+        return {"type": "done", "outcome": outcome}
+
+    # Dùng lại kết quả của một truy vấn gần như trùng lặp (nếu có) thay vì chạy lại toàn bộ pipeline
+    query_embedding = None
+    if use_result_cache and not cancelled():
+        with _timed_stage(timings, 'cache_lookup'):
+            query_embedding = resume_manager.encode_queries([enhanced_query])[0]
+            cached = result_cache.get_result_cache().lookup(query_embedding)
+        if cached:
+            outcome["results"], similarity, cached_query = cached
+            outcome["cache_hit"] = {"similarity": similarity, "query": cached_query}
+            yield {"type": "done", "outcome": outcome}
+            return
+
+    def pending_group(role, role_title):
+        return {
+            "role": role_title, "hard_skills": role.get('hard_skills', []), "dynamic_weights": dynamic_weights,
+            "candidates": [], "pending": True,
+        }
+
+    outcome["results"] = [pending_group(role, role_title) for role, role_title, _ in role_queries]
+    yield {"type": "plan", "outcome": outcome}
+    if cancelled():
+        yield done_event()
+        return
+
+    with _timed_stage(timings, 'retrieval'):
+        role_shortlists = retrieve_shortlists(resume_manager, role_queries)
+    # Vị trí không có ứng viên nào trong vector store thì bỏ khỏi kết quả (như run_search trước đây)
+    outcome["results"] = [pending_group(role, role_title) for role, role_title, _, _ in role_shortlists]
+    if cancelled():
+        yield done_event()
+        return
+
+    unique_candidates = _unique_candidates(role_shortlists)
+    candidates_to_evaluate, cached_scores, budget = list(unique_candidates.items()), None, None
+    if config.CASCADE_ENABLED:
+        with _timed_stage(timings, 'prescore'):
+            candidates_to_evaluate, cached_scores, outcome["cascade"] = select_candidates_for_evaluation(
+                role_shortlists, unique_candidates
+            )
+        budget = ai_services.EvaluationBudget(config.CASCADE_LLM_RESUME_BUDGET, config.CASCADE_LLM_TOKEN_BUDGET)
+    evaluations = ai_services.iter_candidate_evaluations(
+        candidates_to_evaluate, llm_model, cancel_event=cancel_event, cached=cached_scores, budget=budget
+    )
+    parsed_scores_by_id = {}
+    try:
+        while not cancelled():
+            with _timed_stage(timings, 'evaluation'):
+                scores = next(evaluations, None)
+            if scores is None:
+                break
+            parsed_scores_by_id.update({idx: scores.get(str(idx)) for idx in unique_candidates if str(idx) in scores})
+            # Chỉ xếp hạng lại các vị trí có ứng viên vừa được đánh giá
+            touched = [
+                position for position, (_, _, shortlisted_resumes_df, _) in enumerate(role_shortlists)
+                if any(str(idx) in scores for idx in shortlisted_resumes_df.index)
+            ]
+            with _timed_stage(timings, 'ranking'):
+                ranked = rank_shortlists([role_shortlists[position] for position in touched], parsed_scores_by_id, dynamic_weights)
+            for position, group in zip(touched, ranked):
+                outcome["results"][position] = {**group, "pending": True}
+            yield {"type": "ranking", "outcome": outcome}
+    finally:
+        evaluations.close()
+    if budget is not None:
+        outcome["cascade"]["llm_usage"] = budget.usage()
+
+    event = done_event()
+    if use_result_cache and not outcome["cancelled"]:
+        result_cache.get_result_cache().store(query_embedding, enhanced_query, outcome["results"])
+    yield event
+
+# --- DÙNG PIPELINE NGOÀI GIAO DIỆN (API HTTP, CLI BATCH) ---
+RESULT_CONTACT_FIELDS = ('fullname', 'email', 'phonenumber')
+
+def _text_field(value):
+    if value is None or (isinstance(value, float) and value != value):  # None/NaN từ pandas
+        return None
+    return str(value)
+
+def serialize_outcome(outcome, top_k=None):
+    """
+    Chuyển kết quả của run_search thành dict JSON được: mỗi vị trí giữ top_k ứng viên
+    (id, các điểm, parsed_scores và thông tin liên hệ), không kèm toàn bộ nội dung CV.
+    """
+    top_k = top_k or config.TOP_K_RESULTS
+    top_groups = [{**group, "candidates": group["candidates"][:top_k]} for group in outcome["results"]]
+    compact_groups = result_codec.compact_results(top_groups)["groups"]
+    for group, compact_group in zip(top_groups, compact_groups):
+        for candidate, compact_candidate in zip(group["candidates"], compact_group["candidates"]):
+            data = candidate.get("data") or {}
+            compact_candidate.update({field: _text_field(data.get(field)) for field in RESULT_CONTACT_FIELDS})
+    return {
+        "search_id": outcome.get("search_id"), "enhanced_query": outcome["enhanced_query"],
+        "intent": outcome["intent"], "dynamic_weights": outcome["dynamic_weights"], "plan": outcome["plan"],
+        "cache_hit": outcome["cache_hit"], "cancelled": outcome.get("cancelled", False),
+        "cascade": outcome.get("cascade"),
+        "timings_ms": {stage: seconds * 1000 for stage, seconds in outcome["timings"].items()},
+        "results": compact_groups,
+    }
+
+class SearchEngine:
+    """
+    Pipeline tìm kiếm dùng chung cho nhiều luồng (API HTTP, CLI batch).
+    Model Gemini và ResumeManager được khởi tạo một lần; cache điểm, cache kết quả, cache phản hồi LLM
+    và giới hạn tốc độ gọi Gemini là của cả process nên mọi lần tìm kiếm đều dùng chung.
+    Số lần tìm kiếm chạy đồng thời bị giới hạn bởi `max_concurrent`; khi hết lượt, lời gọi chờ tối đa
+    `queue_timeout` giây (None: chờ đến khi có lượt).
+    """
+
+    def __init__(self, llm_model, resume_manager, max_concurrent=None, queue_timeout=None):
+        self.llm_model = llm_model
+        self.resume_manager = resume_manager
+        self.max_concurrent = max_concurrent or config.SEARCH_MAX_CONCURRENT
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._stats_lock = threading.Lock()
+        self._stats = {"active": 0, "completed": 0, "failed": 0, "rejected": 0, "cache_hits": 0}
+
+    @classmethod
+    def from_config(cls, max_concurrent=None, queue_timeout=None):
+        """Khởi tạo các thành phần theo config (chờ đến khi xong) và tạo SearchEngine."""
+        # Mỗi lần tìm kiếm và mỗi luồng đánh giá có thể cùng lúc giữ một kết nối DB
+        db_pool.ensure_pool_size(config.EVALUATION_MAX_WORKERS + (max_concurrent or config.SEARCH_MAX_CONCURRENT) + 2)
+        loader = startup.build_system_loader().start()
+        loader.wait_all()
+        return cls(loader.get('llm_model'), loader.get('resume_manager'), max_concurrent, queue_timeout)
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def search(self, user_query, use_result_cache=None, cancel_event=None):
+        """Chạy run_search khi có lượt. Trả về None nếu chờ quá queue_timeout mà chưa đến lượt."""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count("rejected")
+            print(f"⚠️ Đã có {self.max_concurrent} lần tìm kiếm đang chạy, từ chối yêu cầu sau {self.queue_timeout} giây chờ.")
+            return None
+        self._count("active")
+        try:
+            outcome = run_search(self.llm_model, self.resume_manager, user_query, use_result_cache, cancel_event)
+        except Exception:
+            self._count("failed")
+            raise
+        finally:
+            self._count("active", -1)
+            self._slots.release()
+        self._count("completed")
+        if outcome["cache_hit"]:
+            self._count("cache_hits")
+        return outcome
+
+    def stats(self):
+        with self._stats_lock:
+            return {"max_concurrent": self.max_concurrent, **self._stats}
@@ -0,0 +1,88 @@
+# startup.py
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+import db_manager
+import embedding_engine
+import vector_store
+from resume_manager import ResumeManager
+
+class ComponentLoader:
+    """
+    Khởi tạo các thành phần của hệ thống song song ở luồng nền.
+    Mỗi thành phần là một hàm factory; factory có thể lấy thành phần khác qua `loader.get(name)`.
+    `get` chỉ chặn khi thành phần đó chưa sẵn sàng, nên các trang không cần đến nó
+    (ví dụ trang đăng nhập) hiển thị ngay mà không phải chờ.
+    """
+
+    def __init__(self, factories: dict):
+        self._factories = factories
+        self._timings = {}
+        self._timings_lock = threading.Lock()
+        self._started_at = None
+        # Mỗi thành phần một luồng để factory chờ thành phần khác không gây deadlock
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(factories)), thread_name_prefix="startup")
+        self._futures = {}
+
+    def start(self):
+        self._started_at = time.time()
+        for name, factory in self._factories.items():
+            self._futures[name] = self._executor.submit(self._run, name, factory)
+        self._executor.shutdown(wait=False)
+        return self
+
+    def _run(self, name, factory):
+        start = time.time()
+        try:
+            return factory()
+        finally:
+            elapsed = time.time() - start
+            with self._timings_lock:
+                self._timings[name] = elapsed
+            print(f"   -> [startup] {name}: {elapsed:.2f}s")
+
+    def get(self, name, timeout=None):
+        """Trả về thành phần đã khởi tạo (chờ nếu chưa xong; ném lại lỗi nếu factory thất bại)."""
+        return self._futures[name].result(timeout=timeout)
+
+    def is_ready(self, name=None):
+        futures = [self._futures[name]] if name else self._futures.values()
+        return all(future.done() for future in futures)
+
+    def wait_all(self):
+        for name in self._futures:
+            self.get(name)
+        print(f"--- ✅ Khởi tạo xong sau {time.time() - self._started_at:.2f}s ---")
+
+    def timings(self):
+        """Thời gian khởi tạo (giây) của các thành phần đã xong."""
+        with self._timings_lock:
+            return dict(self._timings)
+
+def build_system_loader():
+    """
+    Tạo ComponentLoader (chưa chạy) cho các thành phần dùng chung của hệ thống:
+    llm_model (Gemini), embedding_model, vector_store, resume_manager và history_schema
+    (schema bảng search_history, kiểm tra một lần thay vì ở mỗi lần đọc/ghi lịch sử).
+    Dùng chung cho giao diện Streamlit, API tìm kiếm và CLI batch.
+    """
+    def load_llm_model():
+        import google.generativeai as genai
+        genai.configure(api_key=config.GEMINI_API_KEY)
+        return genai.GenerativeModel(config.GEMINI_MODEL_NAME)
+
+    def load_resume_manager():
+        resume_mgr = ResumeManager(loader.get('embedding_model'), store=loader.get('vector_store'))
+        if config.RESUME_PREWARM:
+            resume_mgr.load_resumes_from_db()
+        return resume_mgr
+
+    loader = ComponentLoader({
+        'llm_model': load_llm_model,
+        'embedding_model': embedding_engine.load_embedding_model,
+        'vector_store': vector_store.get_vector_store,
+        'resume_manager': load_resume_manager,
+        'history_schema': db_manager.prepare_history_schema,
+    })
+    return loader
@@ -1,72 +1,344 @@
 # sync_pinecone.py
+import argparse
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
-import mysql.connector
-from sentence_transformers import SentenceTransformer
 from tqdm.auto import tqdm
-from pinecone import Pinecone, ServerlessSpec  # <-- THAY ĐỔI 1: Import ServerlessSpec
 import config
-import torch
+import embedding_engine
+import db_pool
+import vector_store
 import time
 
-def sync_data_to_pinecone():
+# --- QUẢN LÝ TRẠNG THÁI ĐỒNG BỘ ---
+# Hash nội dung (SHA-256 của full_text) được tính ngay trên TiDB, nên việc so sánh chỉ cần
+# đọc id + hash; full_text chỉ được tải về cho những CV mới hoặc đã thay đổi.
+
+def ensure_sync_state_table(conn):
+    """Tạo bảng trạng thái đồng bộ nếu chưa tồn tại."""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""CREATE TABLE IF NOT EXISTS {config.SYNC_STATE_TABLE} (
+            index_name VARCHAR(64) NOT NULL,
+            resume_id VARCHAR(64) NOT NULL,
+            content_hash CHAR(64) NOT NULL,
+            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (index_name, resume_id)
+        )"""
+    )
+    conn.commit()
+    cursor.close()
+
+_CONTENT_HASH_SQL = "SHA2(COALESCE(r.full_text, ''), 256)"
+
+def _changed_rows_sql(columns, full, after_id):
+    """Dựng câu truy vấn lấy các CV mới/đã thay đổi so với trạng thái đồng bộ."""
+    query = f"""
+        SELECT {columns}
+        FROM {config.TABLE_NAME} r
+        LEFT JOIN {config.SYNC_STATE_TABLE} s
+            ON s.index_name = %s AND s.resume_id = CAST(r.id AS CHAR)
+    """
+    conditions = []
+    if not full:
+        conditions.append(f"(s.resume_id IS NULL OR s.content_hash <> {_CONTENT_HASH_SQL})")
+    if after_id is not None:
+        conditions.append("r.id > %s")
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query
+
+def count_changed_rows(conn, index_name, full=False):
+    """Đếm số CV cần embedding theo trạng thái: {'new': n, 'changed': m}."""
+    status_sql = "CASE WHEN s.resume_id IS NULL THEN 'new' ELSE 'changed' END"
+    query = _changed_rows_sql(f"{status_sql} AS status, COUNT(*) AS total", full, None)
+    query += f" GROUP BY {status_sql}"
+    cursor = conn.cursor()
+    cursor.execute(query, (index_name,))
+    counts = {status: total for status, total in cursor.fetchall()}
+    cursor.close()
+    return {'new': counts.get('new', 0), 'changed': counts.get('changed', 0)}
+
+def iter_changed_batches(conn, index_name, batch_size, full=False, with_text=True):
+    """
+    Đọc lần lượt từng batch CV mới/đã thay đổi bằng keyset pagination trên id,
+    nên bộ nhớ không phụ thuộc vào kích thước bảng.
+    Mỗi batch là DataFrame (id, [full_text,] content_hash, status).
+    """
+    columns = "r.id, " + ("r.full_text, " if with_text else "") + f"{_CONTENT_HASH_SQL} AS content_hash, " \
+              "CASE WHEN s.resume_id IS NULL THEN 'new' ELSE 'changed' END AS status"
+    last_id = None
+    while True:
+        query = _changed_rows_sql(columns, full, last_id) + " ORDER BY r.id LIMIT %s"
+        params = (index_name,) + ((last_id,) if last_id is not None else ()) + (batch_size,)
+        batch = pd.read_sql(query, conn, params=params)
+        if batch.empty:
+            return
+        last_id = batch['id'].iloc[-1]
+        if hasattr(last_id, 'item'):
+            last_id = last_id.item()
+        yield batch
+
+def find_deleted_ids(conn, index_name):
+    """Trả về id của các CV đã đồng bộ lên index nhưng không còn trong bảng TiDB."""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""SELECT s.resume_id FROM {config.SYNC_STATE_TABLE} s
+            LEFT JOIN {config.TABLE_NAME} r ON CAST(r.id AS CHAR) = s.resume_id
+            WHERE s.index_name = %s AND r.id IS NULL""",
+        (index_name,)
+    )
+    deleted_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return deleted_ids
+
+def record_synced_rows(conn, index_name, rows):
+    """Ghi nhận các CV vừa upsert thành công. `rows` là list các tuple (resume_id, content_hash)."""
+    cursor = conn.cursor()
+    cursor.executemany(
+        f"""INSERT INTO {config.SYNC_STATE_TABLE} (index_name, resume_id, content_hash)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE content_hash = VALUES(content_hash), synced_at = CURRENT_TIMESTAMP""",
+        [(index_name, str(resume_id), content_hash) for resume_id, content_hash in rows]
+    )
+    conn.commit()
+    cursor.close()
+
+def remove_synced_rows(conn, index_name, resume_ids):
+    """Xóa trạng thái đồng bộ của các CV đã bị xóa khỏi index."""
+    cursor = conn.cursor()
+    cursor.executemany(
+        f"DELETE FROM {config.SYNC_STATE_TABLE} WHERE index_name = %s AND resume_id = %s",
+        [(index_name, str(resume_id)) for resume_id in resume_ids]
+    )
+    conn.commit()
+    cursor.close()
+
+def print_diff_report(conn, index_name, counts, deleted_ids, full=False, sample_size=20):
+    """In báo cáo chênh lệch giữa TiDB và index (dùng cho chế độ dry-run)."""
+    sample = next(iter_changed_batches(conn, index_name, sample_size * 10, full=full, with_text=False), pd.DataFrame())
+    print("\n--- BÁO CÁO CHÊNH LỆCH (DRY-RUN) ---")
+    for label, status in (("Mới", 'new'), ("Đã thay đổi", 'changed')):
+        ids = sample.loc[sample['status'] == status, 'id'].astype(str).tolist()[:sample_size] if not sample.empty else []
+        total = counts[status]
+        print(f"   -> {label}: {total} hồ sơ" + (f" [{', '.join(ids)}{' ...' if total > len(ids) else ''}]" if ids else ""))
+    sample_deleted = ", ".join(deleted_ids[:sample_size]) + (" ..." if len(deleted_ids) > sample_size else "")
+    print(f"   -> Đã bị xóa: {len(deleted_ids)} hồ sơ" + (f" [{sample_deleted}]" if deleted_ids else ""))
+    print("   -> Không có thay đổi nào được ghi (dry-run).")
+
+# --- PIPELINE ĐỒNG BỘ DẠNG LUỒNG ---
+# Đọc TiDB (luồng riêng) -> hàng đợi có giới hạn -> embedding (luồng chính) -> các luồng upsert.
+# Hàng đợi đọc và số batch upsert đang chạy đều có giới hạn, nên khi một giai đoạn chậm,
+# các giai đoạn phía trước tự động chờ (backpressure) và bộ nhớ luôn ổn định.
+_END_OF_STREAM = object()
+
+class SyncMetrics:
+    """Thống kê thông lượng của pipeline đồng bộ."""
+
+    def __init__(self, total):
+        self.total = total
+        self.started_at = time.time()
+        self.read_wait_seconds = 0.0
+        self.encode_seconds = 0.0
+        self.upserted = 0
+        self.failed = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def docs_per_second(self):
+        elapsed = time.time() - self.started_at
+        return self.upserted / elapsed if elapsed > 0 else 0.0
+
+    def eta_seconds(self):
+        rate = self.docs_per_second()
+        remaining = self.total - self.upserted - self.failed
+        return remaining / rate if rate > 0 else float('inf')
+
+    def summary(self):
+        elapsed = time.time() - self.started_at
+        return (f"{self.upserted}/{self.total} hồ sơ trong {elapsed:.1f}s ({self.docs_per_second():.1f} docs/s) | "
+                f"chờ đọc: {self.read_wait_seconds:.1f}s | embedding: {self.encode_seconds:.1f}s | "
+                f"thử lại: {self.retries} | lỗi: {self.failed}")
+
+def _read_batches_worker(index_name, batch_size, full, out_queue, stop_event):
+    """Luồng đọc: dùng kết nối TiDB riêng, đẩy từng batch vào hàng đợi có giới hạn."""
+    conn = None
+    try:
+        conn = db_pool.get_connection()
+        for batch in iter_changed_batches(conn, index_name, batch_size, full=full):
+            while not stop_event.is_set():
+                try:
+                    out_queue.put(batch, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+            if stop_event.is_set():
+                return
+    except Exception as e:
+        out_queue.put(e)
+    finally:
+        try:
+            if conn is not None:
+                conn.close()
+        finally:
+            out_queue.put(_END_OF_STREAM)  # Luôn báo kết thúc để luồng chính không chờ mãi
+
+def _upsert_with_retry(store, ids, embeddings, metrics):
+    """Upsert một batch, thử lại với backoff khi lỗi. Trả về True nếu thành công."""
+    vectors_to_upsert = list(zip(ids, embeddings))
+    for attempt in range(config.SYNC_UPSERT_RETRIES + 1):
+        try:
+            store.upsert(vectors_to_upsert)
+            return True
+        except Exception as e:
+            if attempt == config.SYNC_UPSERT_RETRIES:
+                print(f"🔥 Upsert thất bại sau {attempt + 1} lần ({len(ids)} hồ sơ, id đầu: {ids[0]}): {e}")
+                return False
+            wait_time = 2 ** attempt
+            with metrics.lock:
+                metrics.retries += 1
+            print(f"⚠️ Lỗi upsert, thử lại sau {wait_time} giây... ({e})")
+            time.sleep(wait_time)
+
+def sync_data_to_pinecone(full=False, dry_run=False):
     """
-    Đọc tất cả hồ sơ từ TiDB, tạo embedding, và đẩy lên Pinecone.
-    Tự động tạo index nếu chưa có.
+    Đồng bộ gia tăng hồ sơ từ TiDB lên vector store (Pinecone hoặc local): chỉ embedding CV mới/đã thay đổi
+    và xóa khỏi index các CV không còn trong TiDB. Tự động tạo index nếu chưa có.
+    Dữ liệu được xử lý theo luồng (đọc, embedding, upsert chạy chồng lên nhau).
     """
     print("--- BẮT ĐẦU QUÁ TRÌNH ĐỒNG BỘ ---")
-    
-    # 1. & 2. Tải dữ liệu và model (giữ nguyên)
-    print("1. Đang kết nối TiDB và tải dữ liệu...")
-    conn = mysql.connector.connect(**config.DB_CONFIG)
-    df = pd.read_sql(f"SELECT id, full_text FROM {config.TABLE_NAME}", conn)
-    conn.close()
-    print(f"   -> Tải thành công {len(df)} hồ sơ.")
-
-    print("2. Đang tải model embedding...")
-    model = SentenceTransformer(config.SENTENCE_MODEL_NAME, device='cuda' if torch.cuda.is_available() else 'cpu')
-    print("   -> Tải model thành công.")
-
-    # 3. Kết nối Pinecone và kiểm tra/tạo index
-    print("3. Đang kết nối tới Pinecone...")
-    pc = Pinecone(api_key=config.PINECONE_API_KEY)
-    index_name = config.PINECONE_INDEX_NAME
-
-    if index_name not in pc.list_indexes().names():
-        print(f"   -> Index '{index_name}' không tồn tại. Đang tạo index mới (Serverless)...")
-        # --- THAY ĐỔI 2: Sử dụng ServerlessSpec với giá trị cố định ---
-        pc.create_index(
-            name=index_name,
-            dimension=384,
-            metric='cosine',
-            spec=ServerlessSpec(
-                cloud='aws',
-                region='us-east-1'
-            )
-        )
-        # -----------------------------------------------------------
-        print("   -> Đã gửi yêu cầu tạo index. Chờ index khởi tạo...")
-        while not pc.describe_index(index_name).status['ready']:
-            time.sleep(10)
-    else:
-        print(f"   -> Đã tìm thấy index '{index_name}'.")
-
-    index = pc.Index(index_name)
-    print("   -> Kết nối Pinecone thành công.")
-
-    # 4. Tạo embedding và upsert (giữ nguyên)
-    print(f"4. Đang tạo embedding và upsert lên Pinecone (batch_size=100)...")
-    batch_size = 100
-    for i in tqdm(range(0, len(df), batch_size)):
-        i_end = min(i + batch_size, len(df))
-        batch = df.iloc[i:i_end]
-        texts = batch['full_text'].fillna('').tolist()
-        ids = batch['id'].astype(str).tolist()
-        embeddings = model.encode(texts, show_progress_bar=False).tolist()
-        vectors_to_upsert = list(zip(ids, embeddings))
-        index.upsert(vectors=vectors_to_upsert)
+    index_name = vector_store.configured_store_name()
+
+    # 1. So sánh dữ liệu TiDB với trạng thái đồng bộ
+    print("1. Đang kết nối TiDB và xác định hồ sơ cần đồng bộ...")
+    conn = db_pool.get_connection()
+    ensure_sync_state_table(conn)
+    counts = count_changed_rows(conn, index_name, full=full)
+    total_changed = counts['new'] + counts['changed']
+    deleted_ids = find_deleted_ids(conn, index_name)
+    print(f"   -> {total_changed} hồ sơ cần embedding, {len(deleted_ids)} hồ sơ cần xóa khỏi index.")
+
+    if dry_run:
+        print_diff_report(conn, index_name, counts, deleted_ids, full=full)
+        conn.close()
+        return
+    if total_changed == 0 and not deleted_ids:
+        print("\n--- ✅ DỮ LIỆU ĐÃ ĐỒNG BỘ, KHÔNG CÓ GÌ ĐỂ CẬP NHẬT. ---")
+        conn.close()
+        return
+
+    # 2. Tải model
+    print(f"2. Đang tải model embedding (backend: {config.EMBEDDING_BACKEND})...")
+    encoder = embedding_engine.ParallelEncoder()
+    print(f"   -> Tải model thành công ({encoder.processes} process encode).")
+
+    # 3. Kết nối vector store (tự động tạo index Pinecone nếu chưa có)
+    print(f"3. Đang kết nối tới vector store (backend: {config.VECTOR_STORE_BACKEND})...")
+    store = vector_store.get_vector_store(create_if_missing=True, wait_until_ready=True)
+    print(f"   -> Kết nối vector store '{store.name}' thành công.")
+
+    # 4. Pipeline: đọc theo trang -> embedding -> upsert song song
+    batch_size = config.SYNC_BATCH_SIZE
+    max_in_flight = config.SYNC_UPSERT_WORKERS * 2
+    print(f"4. Đang tạo embedding và upsert lên vector store (batch_size={batch_size}, "
+          f"upsert_workers={config.SYNC_UPSERT_WORKERS})...")
+    metrics = SyncMetrics(total_changed)
+    read_queue = queue.Queue(maxsize=config.SYNC_READ_QUEUE_SIZE)
+    stop_event = threading.Event()
+    reader = threading.Thread(
+        target=_read_batches_worker,
+        args=(index_name, batch_size, full, read_queue, stop_event),
+        name="sync-reader", daemon=True
+    )
+    progress = tqdm(total=total_changed)
+    failed_ids = []
+
+    def collect(done_futures):
+        # Chỉ ghi trạng thái sau khi upsert thành công, để lần chạy sau làm lại batch lỗi
+        for future in done_futures:
+            ids, content_hashes, succeeded = future.result()
+            if succeeded:
+                record_synced_rows(conn, index_name, zip(ids, content_hashes))
+                metrics.upserted += len(ids)
+            else:
+                failed_ids.extend(ids)
+                metrics.failed += len(ids)
+            progress.update(len(ids))
+            progress.set_postfix(docs_s=f"{metrics.docs_per_second():.1f}", eta_s=f"{metrics.eta_seconds():.0f}")
+
+    def upsert_batch(ids, embeddings, content_hashes):
+        return ids, content_hashes, _upsert_with_retry(store, ids, embeddings, metrics)
+
+    def encode_and_submit(window, executor, in_flight):
+        # Encode cả cửa sổ một lần (sắp theo độ dài, chia cho các process), rồi upsert lại theo từng batch đọc
+        encode_started = time.time()
+        embeddings = encoder.encode([text for batch in window for text in batch['full_text'].fillna('').tolist()])
+        metrics.encode_seconds += time.time() - encode_started
+
+        offset = 0
+        for batch in window:
+            ids = batch['id'].astype(str).tolist()
+            batch_embeddings = embeddings[offset:offset + len(ids)].tolist()
+            offset += len(ids)
+            # Backpressure: chờ bớt batch upsert đang chạy trước khi gửi thêm
+            while len(in_flight) >= max_in_flight:
+                done, remaining = wait(in_flight, return_when=FIRST_COMPLETED)
+                in_flight.clear()
+                in_flight.update(remaining)
+                collect(done)
+            in_flight.add(executor.submit(upsert_batch, ids, batch_embeddings, batch['content_hash'].tolist()))
+
+    try:
+        reader.start()
+        with ThreadPoolExecutor(max_workers=config.SYNC_UPSERT_WORKERS, thread_name_prefix="sync-upsert") as executor:
+            in_flight = set()
+            window, window_rows = [], 0
+            while True:
+                wait_started = time.time()
+                batch = read_queue.get()
+                metrics.read_wait_seconds += time.time() - wait_started
+                if batch is _END_OF_STREAM:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+
+                window.append(batch)
+                window_rows += len(batch)
+                if window_rows >= config.SYNC_ENCODE_WINDOW:
+                    encode_and_submit(window, executor, in_flight)
+                    window, window_rows = [], 0
+            if window:
+                encode_and_submit(window, executor, in_flight)
+
+            done, _ = wait(in_flight)
+            collect(done)
+        progress.close()
+        print(f"   -> {metrics.summary()}")
+        print(f"   -> Encode: {encoder.worker_summary()}")
+        if failed_ids:
+            print(f"⚠️ {len(failed_ids)} hồ sơ upsert thất bại, sẽ được đồng bộ lại ở lần chạy sau.")
+
+        # 5. Xóa khỏi index các hồ sơ đã bị xóa trong TiDB
+        if deleted_ids:
+            print(f"5. Đang xóa {len(deleted_ids)} hồ sơ khỏi vector store...")
+            for i in range(0, len(deleted_ids), 1000):
+                ids_to_delete = deleted_ids[i:i + 1000]
+                store.delete(ids_to_delete)
+                remove_synced_rows(conn, index_name, ids_to_delete)
+        store.flush()
+    finally:
+        stop_event.set()
+        progress.close()
+        encoder.close()
+        conn.close()
 
     print("\n--- ✅ QUÁ TRÌNH ĐỒNG BỘ HOÀN TẤT! ---")
-    print(f"   -> Tổng số vector trong index: {index.describe_index_stats()['total_vector_count']}")
+    print(f"   -> Tổng số vector trong index: {store.count()}")
 
 if __name__ == "__main__":
-    sync_data_to_pinecone()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Đồng bộ hồ sơ từ TiDB lên Pinecone.")
+    parser.add_argument("--full", action="store_true", help="Embedding lại toàn bộ hồ sơ, bỏ qua so sánh hash.")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ in báo cáo chênh lệch, không ghi gì.")
+    args = parser.parse_args()
+    sync_data_to_pinecone(full=args.full, dry_run=args.dry_run)
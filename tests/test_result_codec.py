@@ -0,0 +1,95 @@
+# tests/test_result_codec.py
+import json
+import pytest
+import db_manager
+import result_codec
+
+RESULTS = [{
+    "role": "BACKEND DEVELOPER", "hard_skills": ["Python"], "dynamic_weights": {"experience": 8},
+    "candidates": [
+        {"id": 12, "final_score": 0.9, "relevance_score": 0.8, "quality_score": 0.7,
+         "parsed_scores": {"parsed_exp_years": 5}, "data": {"fullname": "A", "full_text": "..."}},
+        {"id": "7", "final_score": 0.5, "relevance_score": 0.4, "quality_score": 0.3, "data": {"fullname": "B"}},
+    ],
+}]
+RECORDS = {"12": {"id": "12", "fullname": "A"}, "7": {"id": "7", "fullname": "B"}}
+
+@pytest.fixture(params=["msgpack", "json"])
+def codec(request, monkeypatch):
+    if request.param == "msgpack":
+        if result_codec.msgpack is None:
+            pytest.skip("chưa cài msgpack/zstandard")
+    else:
+        monkeypatch.setattr(result_codec, "msgpack", None)
+    return request.param
+
+def test_round_trip_keeps_scores_and_rehydrates_data(codec):
+    blob = result_codec.encode_results(RESULTS)
+    assert blob[0] == (result_codec.CODEC_MSGPACK_ZSTD if codec == "msgpack" else result_codec.CODEC_JSON_ZLIB)
+    groups = result_codec.decode_results(blob)
+    assert all('data' not in candidate for candidate in groups[0]['candidates'])
+
+    requested = []
+    groups = result_codec.rehydrate_results(groups, lambda ids: requested.extend(ids) or RECORDS)
+    assert requested == ["12", "7"]
+    assert groups[0]['role'] == "BACKEND DEVELOPER"
+    assert [c['id'] for c in groups[0]['candidates']] == ["12", "7"]
+    assert groups[0]['candidates'][0]['parsed_scores'] == {"parsed_exp_years": 5}
+    assert groups[0]['candidates'][1]['parsed_scores'] == {}
+    assert groups[0]['candidates'][0]['data'] == RECORDS["12"]
+
+@pytest.mark.parametrize("blob", [b"", bytes([result_codec.CODEC_JSON_ZLIB]) + b"not zlib", bytes([99]) + b"x"])
+def test_corrupt_blob_raises_value_error(blob):
+    with pytest.raises(ValueError):
+        result_codec.decode_results(blob)
+
+def test_truncated_blob_raises_value_error(codec):
+    blob = result_codec.encode_results(RESULTS)
+    with pytest.raises(ValueError):
+        result_codec.decode_results(blob[:len(blob) // 2])
+
+def test_msgpack_blob_without_msgpack_raises_runtime_error(monkeypatch):
+    blob = bytes([result_codec.CODEC_MSGPACK_ZSTD]) + b"payload"
+    monkeypatch.setattr(result_codec, "msgpack", None)
+    with pytest.raises(RuntimeError):
+        result_codec.decode_results(blob)
+
+class _FakeCursor:
+    def __init__(self, row):
+        self._row = row
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchone(self):
+        return self._row
+
+    def close(self):
+        pass
+
+class _FakeConnection:
+    def __init__(self, row):
+        self._row = row
+
+    def cursor(self, dictionary=False):
+        return _FakeCursor(self._row)
+
+    def close(self):
+        pass
+
+def _past_result(monkeypatch, row):
+    monkeypatch.setattr(db_manager, "get_db_connection", lambda: _FakeConnection(row))
+    return db_manager.get_past_search_result(1, 1, resume_lookup=lambda ids: RECORDS)
+
+def test_past_result_reads_compact_format(monkeypatch):
+    row = {"search_results": None, "search_results_compact": result_codec.encode_results(RESULTS)}
+    groups = _past_result(monkeypatch, row)
+    assert groups[0]['candidates'][1]['data'] == RECORDS["7"]
+
+def test_past_result_falls_back_to_legacy_json(monkeypatch):
+    row = {"search_results": json.dumps(RESULTS), "search_results_compact": None}
+    assert _past_result(monkeypatch, row) == RESULTS
+
+def test_past_result_with_corrupt_blob_returns_none(monkeypatch):
+    row = {"search_results": None, "search_results_compact": bytes([result_codec.CODEC_JSON_ZLIB]) + b"broken"}
+    assert _past_result(monkeypatch, row) is None
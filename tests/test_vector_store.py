@@ -0,0 +1,82 @@
+# tests/test_vector_store.py
+import numpy as np
+import pytest
+import vector_store
+
+DIMENSION = 32
+
+@pytest.fixture(params=[None, 'hnsw'])
+def open_store(request, tmp_path):
+    """Mở (thêm) một LocalVectorStore trên cùng thư mục, như một process khác."""
+    if request.param == 'hnsw':
+        pytest.importorskip("hnswlib")
+    return lambda: vector_store.LocalVectorStore(
+        path=str(tmp_path / "resumes"), dimension=DIMENSION, dtype='float32', ann_index=request.param or 'none'
+    )
+
+@pytest.fixture
+def store(open_store):
+    return open_store()
+
+def _random_vectors(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return {str(i): rng.normal(size=DIMENSION).astype(np.float32) for i in range(count)}
+
+def _ids(matches):
+    return [resume_id for resume_id, _ in matches]
+
+def test_update_after_delete_replaces_old_vector(store):
+    vectors = _random_vectors(20)
+    store.upsert(list(vectors.items()))
+    store.delete(['7'])
+    new_vector = _random_vectors(1, seed=1)['0']
+    store.upsert([('8', new_vector)])
+
+    top_id, top_score = store.query(new_vector, 1)[0]
+    assert top_id == '8' and top_score == pytest.approx(1.0, abs=1e-4)
+    # Vector cũ của '8' không còn tìm thấy được
+    matches = store.query(vectors['8'], 5)
+    assert not any(resume_id == '8' and score > 0.99 for resume_id, score in matches)
+    assert len(_ids(matches)) == len(set(_ids(matches)))
+    assert store.count() == 19
+
+def test_deleted_vector_is_not_returned_for_new_id(store):
+    vectors = _random_vectors(20)
+    store.upsert(list(vectors.items()))
+    store.delete(['7'])
+    new_vector = _random_vectors(1, seed=2)['0']
+    store.upsert([('99', new_vector)])
+
+    assert '7' not in _ids(store.query(vectors['7'], 5))
+    assert store.query(vectors['7'], 1)[0][1] < 0.99
+    assert store.query(new_vector, 1)[0][0] == '99'
+    assert store.count() == 20
+
+def test_reader_sees_changes_written_by_another_store(open_store):
+    writer, reader = open_store(), open_store()
+    vectors = _random_vectors(20)
+    writer.upsert(list(vectors.items()))
+    assert reader.count() == 20
+
+    writer.delete(['7'])
+    new_vector = _random_vectors(1, seed=3)['0']
+    writer.upsert([('99', new_vector), ('3', vectors['5'])])
+
+    assert '7' not in _ids(reader.query(vectors['7'], 5))
+    assert reader.query(new_vector, 1)[0][0] == '99'
+    assert set(_ids(reader.query(vectors['5'], 2))) == {'3', '5'}
+    assert reader.count() == 20
+
+def test_saved_hnsw_index_is_reused(tmp_path):
+    pytest.importorskip("hnswlib")
+    path = str(tmp_path / "resumes")
+    writer = vector_store.LocalVectorStore(path=path, dimension=DIMENSION, dtype='float32', ann_index='hnsw')
+    vectors = _random_vectors(20)
+    writer.upsert(list(vectors.items()))
+    writer.flush()
+    writer.delete(['4'])  # Ghi sau lần lưu chỉ mục: được áp dụng khi mở lại
+
+    reopened = vector_store.LocalVectorStore(path=path, dimension=DIMENSION, dtype='float32', ann_index='hnsw')
+    assert reopened._ann.get_current_count() == 20  # Nạp từ file, không dựng lại
+    assert reopened.query(vectors['9'], 1)[0][0] == '9'
+    assert '4' not in _ids(reopened.query(vectors['4'], 5))
@@ -0,0 +1,181 @@
+# tracing.py
+import os
+import json
+import time
+import uuid
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+import config
+
+# Ghi lại thời gian và kết quả của từng bước trong một lần tìm kiếm (gọi LLM, truy vấn vector store,
+# truy vấn DB, xếp hạng...). Mỗi bản ghi (span) gắn với search id của lần tìm kiếm hiện tại thông qua
+# contextvars; khi chạy ở thread pool, dùng `wrap(fn)` để mang ngữ cảnh sang luồng khác.
+# Kết quả được ghi ra file JSON lines và cộng dồn vào các counter dạng Prometheus.
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class Trace:
+    """Các span của một lần tìm kiếm."""
+
+    def __init__(self, search_id=None):
+        self.search_id = search_id or uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def summary(self):
+        """Tổng thời gian/số lần/số lỗi theo tên span, cùng danh sách span (theo thời điểm bắt đầu)."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda record: record['start'])
+        by_name = {}
+        for record in spans:
+            item = by_name.setdefault(record['name'], {"count": 0, "errors": 0, "total_ms": 0.0})
+            item["count"] += 1
+            item["errors"] += record['outcome'] != 'ok'
+            item["total_ms"] += record['duration_ms']
+        return {
+            "search_id": self.search_id, "total_ms": (time.time() - self.started_at) * 1000,
+            "by_name": by_name, "spans": spans,
+        }
+
+class _Metrics:
+    """Counter cộng dồn trong process, xuất theo định dạng text của Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # (tên metric, tuple nhãn) -> giá trị
+
+    def inc(self, metric, value=1.0, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._counters.items())
+        lines, typed = [], set()
+        for (name, labels), value in items:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            label_text = ",".join(f'{key}="{str(val)}"' for key, val in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = _Metrics()
+_output_lock = threading.Lock()
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def start_trace(search_id=None):
+    """
+    Bắt đầu ghi trace cho một lần tìm kiếm. Nếu đang có trace (lồng nhau) thì dùng lại trace đó.
+    Khi trace ngoài cùng kết thúc, các span được ghi ra TRACE_LOG_PATH và file metrics.
+    """
+    existing = _current_trace.get()
+    if existing is not None:
+        yield existing
+        return
+    trace = Trace(search_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        metrics.inc("hr_ai_searches_total")
+        if config.TRACING_ENABLED:
+            _export(trace)
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Ghi thời gian và kết quả (ok/tên lỗi) của một bước. Trả về dict thuộc tính để bước đó
+    bổ sung thông tin (ví dụ số token) trong lúc chạy; đặt attributes['outcome'] để ghi kết quả
+    không thành công mà không cần ném lỗi.
+    """
+    start = time.time()
+    outcome = 'ok'
+    try:
+        yield attributes
+    except BaseException as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        duration = time.time() - start
+        if outcome == 'ok':
+            outcome = attributes.pop('outcome', outcome)
+        metrics.inc("hr_ai_span_total", name=name, outcome=outcome)
+        metrics.inc("hr_ai_span_seconds_total", duration, name=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add({
+                "search_id": trace.search_id, "name": name, "start": start,
+                "duration_ms": duration * 1000, "outcome": outcome,
+                "attributes": {key: value for key, value in attributes.items() if value is not None},
+            })
+
+def traced(name):
+    """Decorator: ghi span cho mỗi lần gọi hàm."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def wrap(fn):
+    """Mang ngữ cảnh trace hiện tại sang hàm sẽ chạy ở luồng khác (thread pool)."""
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+def record_tokens(attributes, prompt_tokens, response_tokens, estimated=False):
+    attributes.update(prompt_tokens=prompt_tokens, response_tokens=response_tokens, tokens_estimated=estimated)
+    metrics.inc("hr_ai_llm_tokens_total", prompt_tokens or 0, direction="prompt")
+    metrics.inc("hr_ai_llm_tokens_total", response_tokens or 0, direction="response")
+
+def render_prometheus():
+    return metrics.render()
+
+def _rotate_trace_log():
+    """Xoay vòng file trace khi vượt TRACE_LOG_MAX_BYTES: traces.jsonl -> traces.jsonl.1 -> ... (giữ TRACE_LOG_BACKUPS file)."""
+    path = config.TRACE_LOG_PATH
+    if not config.TRACE_LOG_MAX_BYTES or not os.path.exists(path) or os.path.getsize(path) < config.TRACE_LOG_MAX_BYTES:
+        return
+    if config.TRACE_LOG_BACKUPS <= 0:
+        os.remove(path)
+        return
+    for index in range(config.TRACE_LOG_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{path}.{index}"):
+            os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+    os.replace(path, f"{path}.1")
+
+def _export(trace):
+    try:
+        with _output_lock:
+            for path in (config.TRACE_LOG_PATH, config.TRACE_METRICS_PATH):
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+            _rotate_trace_log()
+            with open(config.TRACE_LOG_PATH, 'a', encoding='utf-8') as f:
+                for record in sorted(trace.spans, key=lambda r: r['start']):
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            # Ghi đè file metrics (dạng textfile collector của node_exporter)
+            with open(f"{config.TRACE_METRICS_PATH}.tmp", 'w', encoding='utf-8') as f:
+                f.write(metrics.render())
+            os.replace(f"{config.TRACE_METRICS_PATH}.tmp", config.TRACE_METRICS_PATH)
+    except OSError as e:
+        print(f"⚠️ Không thể ghi trace: {e}")
@@ -0,0 +1,381 @@
+# vector_store.py
+import os
+import json
+import time
+import threading
+import numpy as np
+import config
+
+class VectorStore:
+    """Giao diện chung cho nơi lưu trữ vector embedding của hồ sơ (độ đo cosine)."""
+
+    name = "vector-store"
+
+    def upsert(self, vectors):
+        """Thêm hoặc ghi đè vector. `vectors` là list các tuple (id, values)."""
+        raise NotImplementedError
+
+    def delete(self, ids):
+        """Xóa các vector theo id."""
+        raise NotImplementedError
+
+    def query(self, vector, top_k):
+        """Trả về list các tuple (id, score) gần nhất, sắp xếp theo score giảm dần."""
+        raise NotImplementedError
+
+    def count(self):
+        """Tổng số vector hiện có."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Đảm bảo dữ liệu đã được ghi bền vững (mặc định không cần làm gì)."""
+
+class PineconeVectorStore(VectorStore):
+    """Vector store dùng Pinecone (serverless)."""
+
+    def __init__(self, index_name=None, create_if_missing=False, wait_until_ready=False):
+        from pinecone import Pinecone, ServerlessSpec  # Chỉ cần khi dùng backend Pinecone
+
+        self.index_name = index_name or config.PINECONE_INDEX_NAME
+        self.name = self.index_name
+        self.pc = Pinecone(api_key=config.PINECONE_API_KEY)
+
+        if create_if_missing and self.index_name not in self.pc.list_indexes().names():
+            print(f"   -> Index '{self.index_name}' không tồn tại. Đang tạo index mới (Serverless)...")
+            self.pc.create_index(
+                name=self.index_name,
+                dimension=config.EMBEDDING_DIMENSION,
+                metric='cosine',
+                spec=ServerlessSpec(
+                    cloud='aws',
+                    region='us-east-1'
+                )
+            )
+            if wait_until_ready:
+                print("   -> Đã gửi yêu cầu tạo index. Chờ index khởi tạo...")
+                while not self.pc.describe_index(self.index_name).status['ready']:
+                    time.sleep(10)
+
+        self.index = self.pc.Index(self.index_name)
+
+    def upsert(self, vectors):
+        self.index.upsert(vectors=[(str(i), list(v)) for i, v in vectors])
+
+    def delete(self, ids):
+        self.index.delete(ids=[str(i) for i in ids])
+
+    def query(self, vector, top_k):
+        results = self.index.query(vector=list(vector), top_k=top_k, include_metadata=False)
+        return [(match['id'], match['score']) for match in results['matches']]
+
+    def count(self):
+        return self.index.describe_index_stats()['total_vector_count']
+
+class LocalVectorStore(VectorStore):
+    """
+    Vector store cục bộ: các vector đã chuẩn hóa nằm trong một file memory-mapped
+    (float16/float32), nên chỉ phần dữ liệu được truy cập mới nằm trong RAM.
+    Danh sách id được ghi dạng log chỉ-nối-thêm (append-only) để mỗi lần upsert/delete
+    chỉ tốn chi phí theo kích thước batch. Tìm kiếm mặc định là chính xác (NumPy);
+    có thể bật chỉ mục HNSW (hnswlib) qua config.LOCAL_ANN_INDEX, chỉ mục được lưu cạnh file vector.
+
+    Một process ghi (sync_pinecone.py) và nhiều process đọc (app, API) có thể dùng chung store:
+    slot không bao giờ được dùng lại cho id khác, và mỗi lần query, process đọc áp dụng các dòng
+    mới của log id nên thấy ngay CV vừa đồng bộ/bị xóa mà không cần khởi động lại.
+    """
+
+    _QUERY_CHUNK_ROWS = 65536
+    _INITIAL_CAPACITY = 1024
+
+    def __init__(self, path=None, dimension=None, dtype=None, ann_index=None):
+        self.path = path or config.LOCAL_VECTOR_STORE_PATH
+        self.name = f"local:{os.path.basename(self.path)}"
+        self.dimension = dimension or config.EMBEDDING_DIMENSION
+        self.dtype = np.dtype(dtype or config.LOCAL_VECTOR_DTYPE)
+        self._lock = threading.RLock()
+        self._meta_path = f"{self.path}.meta.json"
+        self._vectors_path = f"{self.path}.vectors"
+        self._ids_log_path = f"{self.path}.ids.log"
+        self._ann_path = f"{self.path}.hnsw"
+        self._ann_meta_path = f"{self.path}.hnsw.json"
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._ann = None
+        self._load()
+        ann_index = ann_index if ann_index is not None else config.LOCAL_ANN_INDEX
+        self._use_ann = ann_index == 'hnsw'
+        if self._use_ann:
+            self._init_hnsw()
+
+    # --- Lưu trữ ---
+    def _read_meta(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self, path, meta):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+    def _load(self):
+        capacity = self._INITIAL_CAPACITY
+        meta = self._read_meta(self._meta_path)
+        if meta is not None:
+            if meta['dimension'] != self.dimension or meta['dtype'] != self.dtype.name:
+                raise ValueError(
+                    f"Local vector store '{self.path}' có dimension/dtype {meta['dimension']}/{meta['dtype']}, "
+                    f"khác với cấu hình {self.dimension}/{self.dtype.name}."
+                )
+            capacity = meta['capacity']
+        self._open_vectors(capacity)
+
+        # Dựng lại bảng id <-> slot từ log
+        self._slot_ids = [None] * capacity
+        self._id_to_slot = {}
+        self._active = np.zeros(capacity, dtype=bool)
+        self._size = 0  # Số slot đã từng được dùng (slot đã xóa không được dùng lại)
+        self._log_offset = 0
+        self._read_log()
+
+    def _open_vectors(self, capacity):
+        mode = 'r+' if os.path.exists(self._vectors_path) else 'w+'
+        if mode == 'r+':
+            required_bytes = capacity * self.dimension * self.dtype.itemsize
+            if os.path.getsize(self._vectors_path) < required_bytes:
+                with open(self._vectors_path, 'r+b') as f:
+                    f.truncate(required_bytes)
+        self._vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode=mode, shape=(capacity, self.dimension))
+        self._capacity = capacity
+        meta = self._read_meta(self._meta_path)
+        if meta is None or meta['capacity'] < capacity:  # Process khác có thể đã mở rộng file nhiều hơn
+            self._write_meta(self._meta_path, {'dimension': self.dimension, 'dtype': self.dtype.name, 'capacity': capacity})
+
+    def _grow(self, min_capacity):
+        new_capacity = self._capacity
+        while new_capacity < min_capacity:
+            new_capacity *= 2
+        self._vectors.flush()
+        self._open_vectors(new_capacity)
+        self._slot_ids.extend([None] * (new_capacity - len(self._slot_ids)))
+        self._active = np.concatenate([self._active, np.zeros(new_capacity - len(self._active), dtype=bool)])
+        if self._ann is not None:
+            self._ann.resize_index(new_capacity)
+
+    def _parse_log(self, start, end=None):
+        """Đọc các dòng (slot, id hoặc None) của log id từ byte `start`; trả về (list thay đổi, byte kết thúc)."""
+        if not os.path.exists(self._ids_log_path):
+            return [], start
+        with open(self._ids_log_path, 'rb') as f:
+            f.seek(start)
+            data = f.read() if end is None else f.read(end - start)
+        data = data[:data.rfind(b'\n') + 1]  # Bỏ dòng cuối mà process khác đang ghi dở
+        changes = []
+        for line in data.decode('utf-8').splitlines():
+            slot_text, _, resume_id = line.partition('\t')
+            changes.append((int(slot_text), resume_id or None))
+        return changes, start + len(data)
+
+    def _read_log(self):
+        """Áp dụng các dòng mới của log id kể từ lần đọc trước. Trả về list (slot, id hoặc None) đã áp dụng."""
+        changes, self._log_offset = self._parse_log(self._log_offset)
+        for slot, resume_id in changes:
+            if slot >= self._capacity:
+                self._grow(slot + 1)
+            previous = self._slot_ids[slot]
+            if previous is not None and previous != resume_id:
+                self._id_to_slot.pop(previous, None)
+            self._slot_ids[slot] = resume_id
+            self._active[slot] = resume_id is not None
+            if resume_id is not None:
+                self._id_to_slot[resume_id] = slot
+            self._size = max(self._size, slot + 1)
+        return changes
+
+    def _refresh(self):
+        """Áp dụng thay đổi do process khác ghi vào store (vd. sync_pinecone.py) kể từ lần đọc trước."""
+        try:
+            log_size = os.path.getsize(self._ids_log_path)
+        except FileNotFoundError:
+            log_size = 0
+        with self._lock:
+            if log_size == self._log_offset:
+                return
+            if log_size < self._log_offset:
+                # Store bị tạo lại từ đầu: đọc lại toàn bộ
+                self._ann = None
+                self._load()
+                if self._use_ann:
+                    self._init_hnsw()
+                return
+            self._apply_to_ann(self._read_log())
+
+    # --- Chỉ mục HNSW ---
+    def _apply_to_ann(self, changes):
+        if self._ann is None or not changes:
+            return
+        final_state = dict(changes)  # Chỉ trạng thái cuối của mỗi slot
+        added = np.asarray([slot for slot, resume_id in final_state.items() if resume_id is not None], dtype=np.int64)
+        if len(added):
+            self._ann.add_items(np.asarray(self._vectors[added], dtype=np.float32), added)
+        for slot, resume_id in final_state.items():
+            if resume_id is None:
+                try:
+                    self._ann.mark_deleted(slot)
+                except RuntimeError:
+                    pass  # Slot chưa có trong chỉ mục hoặc đã bị đánh dấu xóa
+
+    def _init_hnsw(self):
+        try:
+            import hnswlib
+        except ImportError:
+            print("⚠️ Chưa cài hnswlib, local vector store dùng tìm kiếm chính xác bằng NumPy.")
+            return
+        # Dùng lại chỉ mục đã lưu rồi chỉ áp dụng phần log ghi sau đó, thay vì dựng lại từ đầu
+        ann_meta = self._read_meta(self._ann_meta_path)
+        if ann_meta is not None and os.path.exists(self._ann_path) and ann_meta.get('dimension') == self.dimension \
+                and ann_meta['log_offset'] <= self._log_offset:
+            ann = hnswlib.Index(space='ip', dim=self.dimension)
+            try:
+                ann.load_index(self._ann_path, max_elements=self._capacity)
+            except (RuntimeError, OSError) as e:
+                print(f"⚠️ Không đọc được chỉ mục HNSW đã lưu, dựng lại: {e}")
+            else:
+                ann.set_ef(64)
+                self._ann = ann
+                changes, _ = self._parse_log(ann_meta['log_offset'], self._log_offset)
+                self._apply_to_ann(changes)
+                if changes:
+                    self._save_hnsw()
+                return
+
+        ann = hnswlib.Index(space='ip', dim=self.dimension)
+        # Không bật allow_replace_deleted: slot không bao giờ được dùng lại, add_items với nhãn đã có
+        # sẽ ghi đè vector của nhãn đó tại chỗ
+        ann.init_index(max_elements=self._capacity, ef_construction=200, M=16)
+        active_slots = np.flatnonzero(self._active)
+        for start in range(0, len(active_slots), self._QUERY_CHUNK_ROWS):
+            slots = active_slots[start:start + self._QUERY_CHUNK_ROWS]
+            ann.add_items(np.asarray(self._vectors[slots], dtype=np.float32), slots)
+        ann.set_ef(64)
+        self._ann = ann
+        self._save_hnsw()
+
+    def _save_hnsw(self):
+        """Lưu chỉ mục HNSW cùng vị trí log id mà nó phản ánh."""
+        with self._lock:
+            tmp_path = f"{self._ann_path}.{os.getpid()}.tmp"
+            self._ann.save_index(tmp_path)
+            os.replace(tmp_path, self._ann_path)
+            self._write_meta(self._ann_meta_path, {'dimension': self.dimension, 'log_offset': self._log_offset})
+
+    # --- API ---
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        ids = [str(i) for i, _ in vectors]
+        values = np.asarray([v for _, v in vectors], dtype=np.float32)
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values = values / np.where(norms == 0, 1, norms)
+
+        self._refresh()
+        with self._lock:
+            slots, log_lines = [], []
+            for resume_id in ids:
+                slot = self._id_to_slot.get(resume_id)
+                if slot is None:
+                    slot = self._size
+                    if slot >= self._capacity:
+                        self._grow(slot + 1)
+                    self._size = slot + 1
+                    self._id_to_slot[resume_id] = slot
+                    self._slot_ids[slot] = resume_id
+                # Ghi cả khi cập nhật tại chỗ để process đọc biết cần cập nhật chỉ mục HNSW của nó
+                log_lines.append(f"{slot}\t{resume_id}\n")
+                slots.append(slot)
+            slots = np.asarray(slots)
+            self._vectors[slots] = values.astype(self.dtype)
+            self._active[slots] = True
+            if self._ann is not None:
+                self._ann.add_items(values, slots)
+            self._vectors.flush()
+            self._append_log(log_lines)
+
+    def delete(self, ids):
+        self._refresh()
+        with self._lock:
+            log_lines = []
+            for resume_id in (str(i) for i in ids):
+                slot = self._id_to_slot.pop(resume_id, None)
+                if slot is None:
+                    continue
+                self._slot_ids[slot] = None
+                self._active[slot] = False
+                if self._ann is not None:
+                    self._ann.mark_deleted(slot)
+                log_lines.append(f"{slot}\t\n")
+            self._append_log(log_lines)
+
+    def _append_log(self, log_lines):
+        if not log_lines:
+            return
+        with open(self._ids_log_path, 'ab') as f:
+            f.write("".join(log_lines).encode('utf-8'))
+            self._log_offset = f.tell()
+
+    def query(self, vector, top_k):
+        query_vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm > 0:
+            query_vector = query_vector / norm
+
+        self._refresh()
+        with self._lock:
+            size, vectors, active, slot_ids, ann = self._size, self._vectors, self._active, self._slot_ids, self._ann
+            live_count = len(self._id_to_slot)
+        top_k = min(top_k, live_count)
+        if top_k <= 0:
+            return []
+
+        if ann is not None:
+            labels, distances = ann.knn_query(query_vector, k=top_k)
+            return [(slot_ids[slot], float(1 - distance)) for slot, distance in zip(labels[0], distances[0])]
+
+        # Tìm kiếm chính xác: nhân ma trận theo từng khối để giới hạn bộ nhớ tạm khi dùng float16
+        scores = np.empty(size, dtype=np.float32)
+        for start in range(0, size, self._QUERY_CHUNK_ROWS):
+            end = min(start + self._QUERY_CHUNK_ROWS, size)
+            scores[start:end] = np.asarray(vectors[start:end], dtype=np.float32) @ query_vector
+        scores[~active[:size]] = -np.inf
+        top_slots = np.argpartition(-scores, top_k - 1)[:top_k]
+        top_slots = top_slots[np.argsort(-scores[top_slots])]
+        return [(slot_ids[slot], float(scores[slot])) for slot in top_slots]
+
+    def count(self):
+        self._refresh()
+        return len(self._id_to_slot)
+
+    def flush(self):
+        with self._lock:
+            self._vectors.flush()
+            if self._ann is not None:
+                self._save_hnsw()
+
+def configured_store_name():
+    """Tên của vector store đang cấu hình (không cần kết nối), dùng để tách trạng thái đồng bộ."""
+    if config.VECTOR_STORE_BACKEND == 'local':
+        return f"local:{os.path.basename(config.LOCAL_VECTOR_STORE_PATH)}"
+    return config.PINECONE_INDEX_NAME
+
+def get_vector_store(create_if_missing=False, wait_until_ready=False):
+    """Tạo vector store theo cấu hình VECTOR_STORE_BACKEND."""
+    backend = config.VECTOR_STORE_BACKEND
+    if backend == 'local':
+        return LocalVectorStore()
+    if backend == 'pinecone':
+        return PineconeVectorStore(create_if_missing=create_if_missing, wait_until_ready=wait_until_ready)
+    raise ValueError(f"VECTOR_STORE_BACKEND không hợp lệ: '{backend}'")